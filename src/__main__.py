@@ -5,7 +5,13 @@ import os
 import dotenv
 
 import service
+import shard
+from bot import broadcast
+from bot import pictures
 from bot import quo_bot
+from bot import webhook
+from shard import front
+from utils import metrics
 
 
 def main() -> None:
@@ -14,9 +20,21 @@ def main() -> None:
         **os.environ,
     }
 
+    role = shard.get_role(config)
+    metrics.start_server(config, role)
+    if role == "front":
+        front.run(config)
+        return
+
+    webhook_settings = webhook.get_settings(config)
+
     loop = asyncio.new_event_loop()
+    # The bot has to run in the same loop the service connections were created in
+    asyncio.set_event_loop(loop)
     s = loop.run_until_complete(service.get_service(config))
-    quo_bot.QuoBot(config["BOT_TOKEN"], s)
+    option_pictures = loop.run_until_complete(pictures.get_pictures(config))
+    quo_bot.QuoBot(config["BOT_TOKEN"], s, broadcast.get_broadcaster(config), webhook_settings,
+                   config.get("VOTE_MODE", "keyboard").lower(), option_pictures)
 
 
 if __name__ == "__main__":
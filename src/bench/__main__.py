@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Benchmarks of service.Service with a synthetic provider.
+
+Run from src: python -m bench [--scenarios lifecycle,voting] [--participants 2,10] ...
+Every measurement is printed as one JSON line.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import typing
+
+import dotenv
+
+from bench import scenarios
+from service import ordering
+
+
+SCENARIOS = ("lifecycle", "voting", "concurrency", "memory")
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--storage", choices=("memory", "redis"), default="memory",
+                        help="redis uses REDIS_* settings from the environment or .env")
+    parser.add_argument("--participants", type=_ints, default=[2, 10, 100, 1000])
+    parser.add_argument("--options", type=_ints, default=[10, 100, 1000, 10000])
+    parser.add_argument("--rooms", type=_ints, default=[1, 10, 100], help="concurrent rooms")
+    parser.add_argument("--room-participants", type=int, default=5, help="participants of every concurrent room")
+    parser.add_argument("--room-options", type=int, default=100, help="options of every concurrent room")
+    parser.add_argument("--memory-rooms", type=int, default=10, help="rooms averaged over by the memory scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="rooms measured by the lifecycle scenario")
+    parser.add_argument("--orderings", default=",".join(ordering.ORDERINGS),
+                        help="option orderings compared by the voting and concurrency scenarios")
+    parser.add_argument("--max-votes", type=int, default=100000, help="votes in a room before giving up on a match")
+    parser.add_argument("--liked-share", type=float, default=0.05, help="share of options liked by everyone")
+    parser.add_argument("--like-probability", type=float, default=0.3, help="chance to like any other option")
+    parser.add_argument("--provider-delay", type=float, default=0, help="seconds the provider takes per page")
+    parser.add_argument("--output", default="-", help="file to append JSON lines to")
+    return parser.parse_args()
+
+
+def _config(args: argparse.Namespace) -> typing.Dict[str, str]:
+    config = {
+        **dotenv.dotenv_values(".env"),
+        **os.environ,
+    }
+    if args.storage == "memory":
+        config.pop("REDIS_HOST", None)
+    elif "REDIS_HOST" not in config:
+        raise SystemExit("--storage redis needs REDIS_HOST")
+    return config
+
+
+async def _run(args: argparse.Namespace, out: typing.TextIO):
+    config = _config(args)
+    chosen = args.scenarios.split(",")
+    base = {"storage": args.storage, "python": platform.python_version()}
+
+    def emit(scenario: str, params: dict, result: dict):
+        out.write(json.dumps({"scenario": scenario, **base, **params, **result, "time": time.time()}) + "\n")
+        out.flush()
+
+    taste = {"liked_share": args.liked_share, "like_probability": args.like_probability}
+    orderings = args.orderings.split(",")
+
+    for participants in args.participants:
+        for options in args.options:
+            params = {"participants": participants, "options": options}
+            if "lifecycle" in chosen:
+                emit("lifecycle", {**params, "repeat": args.repeat, "provider_delay": args.provider_delay},
+                     await scenarios.lifecycle(config, participants, options, args.repeat, args.provider_delay))
+            if "voting" in chosen:
+                for option_ordering in orderings:
+                    emit("voting", {**params, **taste, "ordering": option_ordering, "max_votes": args.max_votes},
+                         await scenarios.voting(config, participants, options, args.max_votes, **taste,
+                                                option_ordering=option_ordering))
+            if "memory" in chosen:
+                emit("memory", {**params, "rooms": args.memory_rooms},
+                     await scenarios.memory(config, args.memory_rooms, participants, options))
+
+    if "concurrency" in chosen:
+        for rooms, option_ordering in itertools.product(args.rooms, orderings):
+            params = {"rooms": rooms, "participants": args.room_participants, "options": args.room_options}
+            emit("concurrency", {**params, **taste, "ordering": option_ordering, "max_votes": args.max_votes},
+                 await scenarios.concurrency(config, rooms, args.room_participants, args.room_options,
+                                             args.max_votes, **taste, option_ordering=option_ordering))
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.output == "-":
+        asyncio.run(_run(args, sys.stdout))
+    else:
+        with open(args.output, "a") as out:
+            asyncio.run(_run(args, out))
+
+
+if __name__ == "__main__":
+    main()
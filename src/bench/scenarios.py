@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import time
+import tracemalloc
+import typing
+import uuid
+
+from models import room
+from providers import interface as providers
+from service import events
+from service import interface
+from service import ordering
+from service import service
+from service import storage
+
+from . import synthetic
+
+
+# Any provider backed kind works, the synthetic provider serves all of them
+KIND = providers.ProviderKind.KINOPOISK
+
+_user_ids = itertools.count()
+_run_id = uuid.uuid4().hex[:8]  # keeps users of different runs apart in a shared redis
+
+
+def _new_user() -> str:
+    return "bench-{}-{}".format(_run_id, next(_user_ids))
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    """Milliseconds"""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def at(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 4)
+
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": at(0.5),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+async def make_service(config: typing.Dict[str, str], options: int, provider_delay: float = 0,
+                       option_ordering: str = ordering.ADAPTIVE) -> service.Service:
+    return service.Service(
+        await storage.get_storage(config),
+        {KIND: synthetic.SyntheticProvider(options, delay=provider_delay), providers.ProviderKind.CUSTOM: None},
+        await events.get_event_bus(config),
+        option_ordering=option_ordering,
+    )
+
+
+async def _timed(latencies: list[float], call: typing.Awaitable):
+    started = time.perf_counter()
+    result = await call
+    latencies.append(time.perf_counter() - started)
+    return result
+
+
+async def _fill_room(s: service.Service, participants: int,
+                     create: list[float], join: list[float], start: list[float]) -> list[str]:
+    users = [_new_user() for _ in range(participants)]
+    room_id = await _timed(create, s.create_room(users[0], room.RoomParams(KIND.value)))
+    for user_id in users[1:]:
+        await _timed(join, s.join_room(user_id, room_id))
+    await _timed(start, s.start_vote(users[0]))
+    # Voting starts on the first page, measurements need all of them
+    await asyncio.gather(*list(s.streaming_.values()))
+    return users
+
+
+async def lifecycle(config: typing.Dict[str, str], participants: int, options: int, repeat: int,
+                    provider_delay: float = 0) -> dict:
+    """Latency of create_room, join_room and start_vote"""
+    create, join, start = [], [], []
+    s = await make_service(config, options, provider_delay)
+    try:
+        for _ in range(repeat):
+            await _fill_room(s, participants, create, join, start)
+    finally:
+        await s.close()
+    return {"create_room": summarize(create), "join_room": summarize(join), "start_vote": summarize(start)}
+
+
+class _Room(typing.NamedTuple):
+    users: list[str]
+    taste: synthetic.Taste
+
+
+async def _vote_until_match(s: service.Service, r: _Room, max_votes: int, latencies: list[float]) -> dict:
+    votes = 0
+    votes_to_match = None
+    no_match = False
+
+    async def voter(user_id: str):
+        nonlocal votes, votes_to_match, no_match
+        while votes < max_votes and not no_match:
+            option, match = await s.current_option(user_id)
+            if match is not None or option is None:
+                return
+            outcome = await _timed(latencies, s.vote(user_id, r.taste.likes(option.name)))
+            votes += 1
+            if outcome == interface.VoteOutcome.MATCH:
+                votes_to_match = votes
+            elif outcome == interface.VoteOutcome.NO_MATCH:
+                no_match = True
+            # Memory storage never suspends, without this one voter would vote alone
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*[voter(user_id) for user_id in r.users])
+    return {"votes": votes, "votes_to_match": votes_to_match, "no_match": no_match}
+
+
+async def voting(config: typing.Dict[str, str], participants: int, options: int, max_votes: int,
+                 liked_share: float, like_probability: float, option_ordering: str = ordering.ADAPTIVE) -> dict:
+    """Vote throughput and votes it takes to get a match in one room where everyone votes at once"""
+    s = await make_service(config, options, option_ordering=option_ordering)
+    try:
+        users = await _fill_room(s, participants, [], [], [])
+        r = _Room(users, synthetic.Taste(liked_share, like_probability))
+
+        latencies = []
+        started = time.perf_counter()
+        result = await _vote_until_match(s, r, max_votes, latencies)
+        elapsed = time.perf_counter() - started
+    finally:
+        await s.close()
+
+    return {
+        **result,
+        "matched": result["votes_to_match"] is not None,
+        "votes_per_participant": round(result["votes"] / participants, 2),
+        "votes_per_second": round(result["votes"] / elapsed, 1),
+        "vote": summarize(latencies),
+    }
+
+
+async def concurrency(config: typing.Dict[str, str], rooms: int, participants: int, options: int, max_votes: int,
+                      liked_share: float, like_probability: float, option_ordering: str = ordering.ADAPTIVE) -> dict:
+    """Same as voting, for many rooms voting at once"""
+    s = await make_service(config, options, option_ordering=option_ordering)
+    try:
+        rs = []
+        for i in range(rooms):
+            users = await _fill_room(s, participants, [], [], [])
+            rs.append(_Room(users, synthetic.Taste(liked_share, like_probability, seed=i)))
+
+        latencies = []
+        started = time.perf_counter()
+        results = await asyncio.gather(*[_vote_until_match(s, r, max_votes, latencies) for r in rs])
+        elapsed = time.perf_counter() - started
+    finally:
+        await s.close()
+
+    votes = sum(result["votes"] for result in results)
+    matched = [result["votes_to_match"] for result in results if result["votes_to_match"] is not None]
+    return {
+        "votes": votes,
+        "matched_rooms": len(matched),
+        "no_match_rooms": sum(result["no_match"] for result in results),
+        "mean_votes_to_match": round(sum(matched) / len(matched), 1) if matched else None,
+        "votes_per_second": round(votes / elapsed, 1),
+        "vote": summarize(latencies),
+    }
+
+
+async def memory(config: typing.Dict[str, str], rooms: int, participants: int, options: int) -> dict:
+    """Python heap and serialized size of a started room"""
+    s = await make_service(config, options)
+    try:
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        owners = [(await _fill_room(s, participants, [], [], []))[0] for _ in range(rooms)]
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        _, room_data = await s.storage_.load_users_room(owners[0])
+        serialized = len(room_data.to_bytes())
+    finally:
+        await s.close()
+
+    return {"heap_bytes_per_room": (after - before) // rooms, "serialized_bytes_per_room": serialized}
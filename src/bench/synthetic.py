@@ -0,0 +1,48 @@
+import asyncio
+import random
+import typing
+import zlib
+
+from models import entry
+from providers import interface as providers
+
+
+class SyntheticProvider(providers.ProviderInterface):
+    """Generates options count entries page by page, optionally waiting delay seconds per page"""
+
+    def __init__(self, options: int, page_size: int = providers.PAGE_SIZE, delay: float = 0):
+        self.options = options
+        self.page_size = page_size
+        self.delay = delay
+
+    async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        for start in range(0, self.options, self.page_size):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield [
+                entry.ProviderEntry(name="option {}".format(i), descr="synthetic option {}".format(i))
+                for i in range(start, min(start + self.page_size, self.options))
+            ]
+
+
+class Taste:
+    """Decides whether a participant likes an option.
+
+    A liked_share of options is liked by everyone, so a match is always possible,
+    any other option is liked with like_probability.
+    """
+
+    def __init__(self, liked_share: float = 0.05, like_probability: float = 0.3, seed: int = 0):
+        self.liked_share = liked_share
+        self.like_probability = like_probability
+        self.random = random.Random(seed)
+
+    def is_favourite(self, option_name: str) -> bool:
+        return zlib.crc32(option_name.encode()) % 10000 < self.liked_share * 10000
+
+    def likes(self, option_name: str) -> bool:
+        return self.is_favourite(option_name) or self.random.random() < self.like_probability
+
@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import logging
+import typing
+
+import telegram
+from telegram import error
+
+from utils import ratelimit
+
+
+__all__ = ["Broadcaster", "BroadcastStats", "get_broadcaster"]
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastStats(typing.TypedDict):
+    sent: int
+    failed: int
+    retried: int
+
+
+class Broadcaster:
+    """Sends a message to many chats at once within Telegram flood limits.
+
+    Every message waits for both the global limiter and the limiter of its
+    chat, so one slow or throttled chat does not delay the others.
+    """
+
+    chat_limiters_: collections.OrderedDict[typing.Union[int, str], ratelimit.TokenBucket]
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 3, max_chats: int = 10000):
+        self.global_limiter_ = ratelimit.TokenBucket(global_rate)
+        self.chat_rate_ = chat_rate
+        self.chat_burst_ = chat_burst
+        self.max_retries_ = max_retries
+        self.max_chats_ = max_chats
+        self.chat_limiters_ = collections.OrderedDict()
+
+    def _chat_limiter(self, chat_id: typing.Union[int, str]) -> ratelimit.TokenBucket:
+        limiter = self.chat_limiters_.get(chat_id)
+        if limiter is None:
+            limiter = ratelimit.TokenBucket(self.chat_rate_, self.chat_burst_)
+            self.chat_limiters_[chat_id] = limiter
+            # Limiters of long idle chats are full anyway, forgetting them is safe
+            while len(self.chat_limiters_) > self.max_chats_:
+                self.chat_limiters_.popitem(last=False)
+        else:
+            self.chat_limiters_.move_to_end(chat_id)
+        return limiter
+
+    async def send_message(self, bot: telegram.Bot, chat_ids: typing.Iterable[typing.Union[int, str]],
+                           text: str, **kwargs) -> BroadcastStats:
+        return await self._broadcast(bot.send_message, chat_ids, dict(kwargs, text=text))
+
+    async def send_photo(self, bot: telegram.Bot, chat_ids: typing.Iterable[typing.Union[int, str]],
+                         photo: str, caption: str, **kwargs) -> BroadcastStats:
+        """photo is better a file_id, otherwise Telegram downloads it for every chat"""
+        return await self._broadcast(bot.send_photo, chat_ids, dict(kwargs, photo=photo, caption=caption))
+
+    async def _broadcast(self, send: typing.Callable[..., typing.Awaitable], chat_ids: typing.Iterable[typing.Union[int, str]],
+                         kwargs: dict) -> BroadcastStats:
+        stats = BroadcastStats(sent=0, failed=0, retried=0)
+        await asyncio.gather(*[self._send(send, chat_id, kwargs, stats) for chat_id in chat_ids])
+        if stats["failed"] or stats["retried"]:
+            logger.info("broadcast: %s", stats)
+        return stats
+
+    async def _send(self, send: typing.Callable[..., typing.Awaitable], chat_id: typing.Union[int, str],
+                    kwargs: dict, stats: BroadcastStats):
+        for attempt in range(self.max_retries_ + 1):
+            await self._chat_limiter(chat_id).acquire()
+            await self.global_limiter_.acquire()
+
+            try:
+                await send(chat_id=chat_id, **kwargs)
+                stats["sent"] += 1
+                return
+            except error.RetryAfter as e:
+                if attempt == self.max_retries_:
+                    break
+                stats["retried"] += 1
+                await asyncio.sleep(e.retry_after)
+            except error.TelegramError:
+                logger.warning("broadcast: failed to send to %s", chat_id, exc_info=True)
+                break
+
+        stats["failed"] += 1
+
+
+def get_broadcaster(config: typing.Dict[str, str]) -> Broadcaster:
+    return Broadcaster(
+        global_rate=float(config.get("TELEGRAM_GLOBAL_RATE", 30)),
+        chat_rate=float(config.get("TELEGRAM_CHAT_RATE", 1)),
+        chat_burst=float(config.get("TELEGRAM_CHAT_BURST", 3)),
+        max_retries=int(config.get("TELEGRAM_MAX_RETRIES", 3)),
+    )
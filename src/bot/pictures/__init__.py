@@ -0,0 +1,20 @@
+import typing
+
+from . import interface
+from . import memory
+from . import redis_cache
+from .sender import Pictures
+
+
+async def get_pictures(config: typing.Dict[str, str]) -> Pictures:
+    # File_ids are valid for any chat of the bot, so all workers share them through redis
+    if config.get("REDIS_HOST"):
+        cache = await redis_cache.get_cache(config)
+    else:
+        cache = await memory.get_cache(config)
+    return Pictures(
+        cache,
+        upload_chat_id=config.get("PICTURE_UPLOAD_CHAT_ID") or None,
+        upload_rate=float(config.get("PICTURE_UPLOAD_RATE", 1)),
+        max_uploads=int(config.get("PICTURE_UPLOAD_QUEUE", 50)),
+    )
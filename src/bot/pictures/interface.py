@@ -0,0 +1,18 @@
+import typing
+
+
+class FileIdCacheInterface(typing.Protocol):
+    """Maps picture urls to file_ids Telegram gave for them, least recently used ones are evicted"""
+
+    async def get(self, url: str) -> typing.Optional[str]:
+        ...
+
+    async def put(self, url: str, file_id: str) -> None:
+        ...
+
+    async def forget(self, url: str) -> None:
+        """For file_ids Telegram does not accept anymore"""
+        ...
+
+    async def close(self) -> None:
+        ...
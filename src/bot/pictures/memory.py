@@ -0,0 +1,36 @@
+import collections
+import typing
+
+from . import interface
+
+
+class MemoryFileIdCache(interface.FileIdCacheInterface):
+    """Keeps file_ids in this process only"""
+
+    file_ids_: collections.OrderedDict[str, str]
+
+    def __init__(self, max_size: int):
+        self.max_size_ = max_size
+        self.file_ids_ = collections.OrderedDict()
+
+    async def get(self, url: str) -> typing.Optional[str]:
+        file_id = self.file_ids_.get(url)
+        if file_id is not None:
+            self.file_ids_.move_to_end(url)
+        return file_id
+
+    async def put(self, url: str, file_id: str) -> None:
+        self.file_ids_[url] = file_id
+        self.file_ids_.move_to_end(url)
+        while len(self.file_ids_) > self.max_size_:
+            self.file_ids_.popitem(last=False)
+
+    async def forget(self, url: str) -> None:
+        self.file_ids_.pop(url, None)
+
+    async def close(self) -> None:
+        pass
+
+
+async def get_cache(config: typing.Dict[str, str]) -> interface.FileIdCacheInterface:
+    return MemoryFileIdCache(int(config.get("PICTURE_CACHE_SIZE", 10000)))
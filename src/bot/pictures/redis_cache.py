@@ -0,0 +1,67 @@
+import time
+import typing
+
+import redis.asyncio as redis
+
+from . import interface
+
+
+# {prefix}:pictures maps urls to file_ids, {prefix}:pictures:used orders urls by the last use
+
+# KEYS: file_ids, last use; ARGV: url, now
+GET_SCRIPT = """
+local file_id = redis.call('HGET', KEYS[1], ARGV[1])
+if file_id then
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+return file_id
+"""
+
+# KEYS: file_ids, last use; ARGV: url, file_id, now, max size
+PUT_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if excess > 0 then
+    local evicted = redis.call('ZPOPMIN', KEYS[2], excess)
+    for i = 1, #evicted, 2 do
+        redis.call('HDEL', KEYS[1], evicted[i])
+    end
+end
+"""
+
+
+class RedisFileIdCache(interface.FileIdCacheInterface):
+    """Shared by all workers and kept across restarts"""
+
+    def __init__(self, client: redis.Redis, prefix: str = "quo", max_size: int = 10000):
+        self.redis_ = client
+        self.keys_ = ["{}:pictures".format(prefix), "{}:pictures:used".format(prefix)]
+        self.max_size_ = max_size
+        self.get_ = client.register_script(GET_SCRIPT)
+        self.put_ = client.register_script(PUT_SCRIPT)
+
+    async def get(self, url: str) -> typing.Optional[str]:
+        file_id = await self.get_(keys=self.keys_, args=[url, time.time()])
+        return file_id.decode() if file_id is not None else None
+
+    async def put(self, url: str, file_id: str) -> None:
+        await self.put_(keys=self.keys_, args=[url, file_id, time.time(), self.max_size_])
+
+    async def forget(self, url: str) -> None:
+        async with self.redis_.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.keys_[0], url)
+            pipe.zrem(self.keys_[1], url)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self.redis_.aclose()
+
+
+async def get_cache(config: typing.Dict[str, str]) -> interface.FileIdCacheInterface:
+    client = redis.Redis(
+        host=config["REDIS_HOST"],
+        port=int(config.get("REDIS_PORT", 6379)),
+        password=config.get("REDIS_PASSWORD"),
+    )
+    return RedisFileIdCache(client, config.get("REDIS_PREFIX", "quo"), int(config.get("PICTURE_CACHE_SIZE", 10000)))
@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+import logging
+import typing
+
+import telegram
+from telegram import error
+
+from utils import ratelimit
+
+from . import interface
+
+
+__all__ = ["Pictures"]
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CONCURRENCY = 2  # uploads in advance running at once, the rest wait for a slot
+MAX_UPLOADS = 50  # uploads in advance started or waiting, pictures past that are uploaded when they are sent
+
+
+class Pictures:
+    """Sends pictures by url only once, later they go by the file_id Telegram returned for the first upload.
+
+    Pictures of options coming next can be uploaded in advance to upload_chat_id, a chat
+    the bot can post to, so users don't wait for Telegram to download them.
+    """
+
+    uploading_: dict[str, asyncio.Task]  # url to its upload in advance
+
+    def __init__(self, cache: interface.FileIdCacheInterface, upload_chat_id: typing.Optional[str] = None,
+                 upload_rate: float = 1, max_uploads: int = MAX_UPLOADS):
+        self.cache_ = cache
+        self.upload_chat_id_ = upload_chat_id
+        # Telegram limits messages to one chat, the same as for users
+        self.upload_limiter_ = ratelimit.TokenBucket(upload_rate)
+        self.upload_slots_ = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        self.max_uploads_ = max_uploads
+        self.uploading_ = dict()
+
+    async def file_id(self, url: str) -> typing.Optional[str]:
+        upload = self.uploading_.get(url)
+        if upload is not None:
+            # Waiting for an upload in progress is faster than starting another one
+            with contextlib.suppress(Exception):
+                await asyncio.shield(upload)
+        return await self.cache_.get(url)
+
+    async def send(self, bot: telegram.Bot, chat_id: typing.Union[int, str], url: str,
+                   caption: str, **kwargs) -> telegram.Message:
+        return await self._send(url, lambda photo: bot.send_photo(chat_id, photo, caption=caption, **kwargs))
+
+    async def edit(self, query: telegram.CallbackQuery, url: str, caption: str, **kwargs) -> None:
+        """Replaces the picture and the caption of the message the query came from"""
+        await self._send(url, lambda photo: query.edit_message_media(telegram.InputMediaPhoto(photo, caption=caption),
+                                                                     **kwargs))
+
+    async def _send(self, url: str, send: typing.Callable[[str], typing.Awaitable]):
+        file_id = await self.file_id(url)
+        if file_id is not None:
+            try:
+                return await send(file_id)
+            except error.BadRequest:
+                logger.warning("pictures: file_id of %s is not accepted, uploading it again", url)
+                await self.cache_.forget(url)
+
+        message = await send(url)
+        await self._remember(url, message)
+        return message
+
+    async def _remember(self, url: str, message: typing.Any):
+        if isinstance(message, telegram.Message) and message.photo:
+            # The largest size is the one Telegram made from the original
+            await self.cache_.put(url, message.photo[-1].file_id)
+
+    def preload(self, bot: telegram.Bot, urls: typing.Iterable[str]) -> None:
+        """Uploads pictures in the background unless they are uploaded already"""
+        if not self.upload_chat_id_:
+            return
+        for url in urls:
+            if url in self.uploading_:
+                continue
+            if len(self.uploading_) >= self.max_uploads_:
+                logger.info("pictures: %d uploads in advance are pending already", len(self.uploading_))
+                return
+            upload = asyncio.create_task(self._upload(bot, url))
+            self.uploading_[url] = upload
+            upload.add_done_callback(lambda _, url=url: self.uploading_.pop(url, None))
+
+    async def _upload(self, bot: telegram.Bot, url: str):
+        try:
+            if await self.cache_.get(url) is not None:
+                return
+            async with self.upload_slots_:
+                await self.upload_limiter_.acquire()
+                message = await bot.send_photo(self.upload_chat_id_, url, disable_notification=True)
+                await self._remember(url, message)
+                # The file_id stays valid without the message
+                await bot.delete_message(self.upload_chat_id_, message.message_id)
+        except Exception:
+            logger.warning("pictures: failed to upload %s in advance", url, exc_info=True)
+
+    async def close(self) -> None:
+        for upload in list(self.uploading_.values()):
+            upload.cancel()
+        await self.cache_.close()
@@ -1,15 +1,23 @@
+import asyncio
 import logging
 import telegram
 import enum
+import typing
 
+from bot import broadcast
 from bot import handler_type
+from bot import pictures
+from bot import webhook
 from models import room, entry
-from service.interface import ServiceInterface
+from service.interface import ServiceInterface, VoteCard, VoteOutcome
+from providers import filters as provider_filters
 from providers.interface import ProviderKind
+from utils import metrics
 
-from telegram import ReplyKeyboardMarkup
+from telegram import error
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from telegram.ext import Application, CallbackContext, ContextTypes
-from telegram.ext import CommandHandler, MessageHandler, ConversationHandler
+from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler
 from telegram.ext import filters
 
 __all__ = ["QuoBot"]
@@ -24,12 +32,16 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# keyboard: votes are sent as messages, inline: one card message is edited in place
+VOTE_MODES = ("keyboard", "inline")
+
 
 class QuoBotState(enum.Enum):
     CHOOSE_HOST_SERVICE_TYPE = enum.auto()
     WAITING_FOR_ROOM_NUMBER = enum.auto()
     HOST_LOBBY = enum.auto()
     QUERY_ENTRY = enum.auto()
+    QUERY_FILTERS = enum.auto()
     WAITING_FOR_HOST_TO_START = enum.auto()
     VOTE_IN_PROGRESS = enum.auto()
     WAITING_FOR_VOTE = enum.auto()
@@ -50,12 +62,24 @@ class QuoBot:
 
         return cls.__instance
 
-    def __init__(self, token: str, service: ServiceInterface):
+    def __init__(self, token: str, service: ServiceInterface, broadcaster: broadcast.Broadcaster | None = None,
+                 webhook_settings: webhook.WebhookSettings | None = None, vote_mode: str = "keyboard",
+                 option_pictures: pictures.Pictures | None = None):
         if not self.__initialized:
+            if vote_mode not in VOTE_MODES:
+                raise ValueError("Unknown vote mode {}, expected one of {}".format(vote_mode, ", ".join(VOTE_MODES)))
             self.__initialized = True
             self.__token = token
             self.__service = service
-            self.__app = Application.builder().token(self.__token).build()
+            self.__broadcaster = broadcaster or broadcast.Broadcaster()
+            self.__vote_mode = vote_mode
+            self.__pictures = option_pictures or pictures.Pictures(pictures.memory.MemoryFileIdCache(10000))
+
+            builder = Application.builder().token(self.__token).post_shutdown(self._shutdown)
+            if webhook_settings is not None:
+                # Updates come from the webhook server instead of polling
+                builder = builder.updater(None).concurrent_updates(webhook_settings["workers"])
+            self.__app = builder.build()
             self._setup_handlers()
 
             self.__button_map = {
@@ -67,6 +91,7 @@ class QuoBot:
                 "host_lobby": {
                     "Запустить голосование": self.vote_start,
                     "Добавить опцию": self.add_entry,
+                    "Фильтры": self.ask_filters,
                 },
                 "vote": {
                     "Лайк 👍": self.vote,
@@ -74,46 +99,66 @@ class QuoBot:
                 },
             }
 
-            self.__app.run_polling()
+            if webhook_settings is not None:
+                webhook.run(self.__app, webhook_settings)
+            else:
+                self.__app.run_polling()
+
+    async def _shutdown(self, app: Application):
+        await self.__service.close()
+        await self.__pictures.close()
+
+    def _measured(self, handler: typing.Callable) -> typing.Callable:
+        # Only handlers called by the application are measured, not the ones they call in turn
+        return metrics.timed(metrics.BOT_HANDLER_LATENCY, handler.__name__)(handler)
 
     def _setup_handlers(self):
         for handler_name in filter(lambda n: not n.startswith("_"), dir(self)):
             handler = getattr(self, handler_name)
             if callable(handler) and getattr(handler, "is_command", False):
-                self.__app.add_handler(CommandHandler(handler_name, handler))
+                self.__app.add_handler(CommandHandler(handler_name, self._measured(handler)))
 
         host_handler = ConversationHandler(
             entry_points=[
-                MessageHandler(filters.Regex("Создать комнату$"), self.host_room)
+                MessageHandler(filters.Regex("Создать комнату$"), self._measured(self.host_room))
             ],
             states={
                 QuoBotState.CHOOSE_HOST_SERVICE_TYPE: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.choose_service_type)
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.choose_service_type))
                 ],
                 QuoBotState.HOST_LOBBY: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.Regex("^Запустить голосование$"), self.vote_start),
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.Regex("^Запустить голосование$"), self._measured(self.vote_start)),
+                    MessageHandler(filters.Regex("^Фильтры$"), self._measured(self.ask_filters)),
                     ConversationHandler(
                         entry_points=[
-                            MessageHandler(filters.Regex("^Добавить опцию$"), self.add_entry)
+                            MessageHandler(filters.Regex("^Добавить опцию$"), self._measured(self.add_entry))
                         ],
                         states={
                             QuoBotState.QUERY_ENTRY: [
-                                MessageHandler(filters.TEXT & ~filters.COMMAND, self.query_entry)
+                                MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.query_entry))
                             ],
                         },
                         fallbacks=[],
                     ),
                 ],
+                QuoBotState.QUERY_FILTERS: [
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.query_filters))
+                ],
                 QuoBotState.VOTE_IN_PROGRESS: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.vote_question)
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.vote_question))
                 ],
                 QuoBotState.WAITING_FOR_VOTE: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.vote)
+                    CallbackQueryHandler(self._measured(self.vote_card), pattern="^vote:"),
+                    CallbackQueryHandler(self._measured(self.leave_card), pattern="^leave$"),
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.vote))
                 ],
+                # Inline cards are swiped while the handler which sent the first one waits for the end of the vote
+                ConversationHandler.WAITING: self._card_handlers(),
             },
             fallbacks=[],
             block=False,
@@ -121,24 +166,37 @@ class QuoBot:
         self.__app.add_handler(host_handler)
 
         join_handler = ConversationHandler(
-            entry_points=[MessageHandler(filters.Regex("^Присоединиться к комнате$"), self.join_room)],
+            entry_points=[
+                MessageHandler(filters.Regex("^Присоединиться к комнате$"), self._measured(self.join_room)),
+                # With sharding the room id reaches the worker of the room, which has not seen the button press
+                MessageHandler(filters.Regex(r"^\s*\d+\s*$"), self._measured(self.join_room_by_id)),
+            ],
             states={
                 QuoBotState.WAITING_FOR_ROOM_NUMBER: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.join_room_by_id),
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.join_room_by_id)),
                 ],
                 QuoBotState.VOTE_IN_PROGRESS: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.vote_start)],
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.vote_start))],
                 QuoBotState.WAITING_FOR_VOTE: [
-                    MessageHandler(filters.Regex("^Выйти$"), self.leave_room),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.vote)],
+                    CallbackQueryHandler(self._measured(self.vote_card), pattern="^vote:"),
+                    CallbackQueryHandler(self._measured(self.leave_card), pattern="^leave$"),
+                    MessageHandler(filters.Regex("^Выйти$"), self._measured(self.leave_room)),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self._measured(self.vote))],
+                ConversationHandler.WAITING: self._card_handlers(),
             },
             fallbacks=[],
             block=False,
         )
         self.__app.add_handler(join_handler)
 
+    def _card_handlers(self) -> list[CallbackQueryHandler]:
+        return [
+            CallbackQueryHandler(self._measured(self.vote_card), pattern="^vote:"),
+            CallbackQueryHandler(self._measured(self.leave_card), pattern="^leave$"),
+        ]
+
     @handler_type.command
     async def start(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
         buttons = [[button_option for button_option in self.__button_map["start"].keys()]]
@@ -179,12 +237,9 @@ class QuoBot:
                                        text="Успешно присоединились к комнате {}".format(room_id))
 
         participants = await self.__service.get_room_participants(str(user_id))
-        for participant in participants:
-            if participant == str(user_id):
-                continue
-
-            await context.bot.send_message(chat_id=participant,
-                                            text="@{} присоединился!".format(update.effective_user.username))
+        await self.__broadcaster.send_message(context.bot,
+                                              [p for p in participants if p != str(user_id)],
+                                              text="@{} присоединился!".format(update.effective_user.username))
 
         return await self.wait_for_start(update, context)
 
@@ -231,16 +286,11 @@ class QuoBot:
         user_id = update.effective_chat.id
 
         participants = await self.__service.get_room_participants(str(user_id))
-        for participant in participants:
-            await context.bot.send_message(chat_id=participant,
-                                        text="Запускаем голосование...")
+        await self.__broadcaster.send_message(context.bot, participants, text="Запускаем голосование...")
 
         await self.__service.start_vote(str(user_id))
 
-
-        for participant in participants:
-            await context.bot.send_message(chat_id=participant,
-                                            text="Голосование началось!")
+        await self.__broadcaster.send_message(context.bot, participants, text="Голосование началось!")
 
         return await self.next_vote(update, context)
 
@@ -255,6 +305,9 @@ class QuoBot:
         return QuoBotState.CHOOSE_HOST_SERVICE_TYPE
 
     async def next_vote(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        if self.__vote_mode == "inline":
+            return await self.send_card(update, context)
+
         buttons = [
             [button_option for button_option in self.__button_map["vote"].keys()],
             ["Выйти"],
@@ -262,16 +315,106 @@ class QuoBot:
         reply_markup = ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
 
         user_id = update.effective_chat.id
-        curr_option, maybe_match = await self.__service.current_option(str(user_id))
+        card = await self.__service.current_card(str(user_id))
+        curr_option = card["option"]
+        if curr_option is None:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text="Вы оценили все варианты, ждём остальных",
+                                           reply_markup=ReplyKeyboardMarkup([["Выйти"]], one_time_keyboard=True,
+                                                                            resize_keyboard=True))
+            return QuoBotState.WAITING_FOR_VOTE
+
+        await self._send_option(context.bot, update.effective_chat.id, curr_option, self._option_text(curr_option),
+                                reply_markup)
+        self._preload(context.bot, card)
+        return QuoBotState.WAITING_FOR_VOTE
 
-        query_text = "Что ты думаешь про\n{}?".format(curr_option["name"])
-        if curr_option["descr"]:
-            query_text += "\n{}".format(curr_option["descr"])
+    def _option_text(self, option: entry.ProviderEntry) -> str:
+        query_text = "Что ты думаешь про\n{}?".format(option.name)
+        if option.descr:
+            query_text += "\n{}".format(option.descr)
+        return query_text
 
-        await context.bot.send_message(chat_id=update.effective_chat.id,
-                                       text=query_text,
-                                       reply_markup=reply_markup)
-        return QuoBotState.WAITING_FOR_VOTE
+    def _card(self, option: entry.ProviderEntry | None, option_index: int | None) -> tuple[str, InlineKeyboardMarkup]:
+        leave = [InlineKeyboardButton("Выйти", callback_data="leave")]
+        if option is None:
+            return "Вы оценили все варианты, ждём остальных", InlineKeyboardMarkup([leave])
+
+        # The option index makes taps on an outdated card harmless
+        buttons = [
+            InlineKeyboardButton(label, callback_data="vote:{}:{}".format(option_index, int(label == "Лайк 👍")))
+            for label in self.__button_map["vote"].keys()
+        ]
+        return self._option_text(option), InlineKeyboardMarkup([buttons, leave])
+
+    async def send_card(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        card = await self.__service.current_card(str(update.effective_chat.id))
+        text, reply_markup = self._card(card["option"], card["option_index"])
+        message = await self._send_option(context.bot, update.effective_chat.id, card["option"], text, reply_markup)
+        context.chat_data["card"] = message.message_id
+        self._preload(context.bot, card)
+        return await self.wait_for_end(update, context)
+
+    async def wait_for_end(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        # Whoever's vote decides it, the conversation ends here for everyone in the room
+        chat_id = update.effective_chat.id
+        try:
+            await self.__service.wait_end(str(chat_id))
+        except KeyError:
+            logging.info("room of %s is gone", chat_id)
+
+        card = context.chat_data.pop("card", None)
+        if card is not None:
+            try:
+                await context.bot.edit_message_reply_markup(chat_id, card, reply_markup=None)
+            except error.BadRequest:
+                logger.info("card of %s is gone", chat_id)
+        return ConversationHandler.END
+
+    def _preload(self, bot: telegram.Bot, card: VoteCard):
+        self.__pictures.preload(bot, [option.picture_url for option in card["upcoming"] if option.picture_url])
+
+    async def _send_option(self, bot: telegram.Bot, chat_id: int | str, option: entry.ProviderEntry | None,
+                           text: str, reply_markup: InlineKeyboardMarkup | ReplyKeyboardMarkup):
+        if option is not None and option.picture_url:
+            try:
+                return await self.__pictures.send(bot, chat_id, option.picture_url, caption=text,
+                                                  reply_markup=reply_markup)
+            except error.BadRequest:
+                # Telegram could not download it, or the caption is too long
+                logger.warning("failed to send the picture of %s", option.name, exc_info=True)
+        return await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+
+    async def _edit_card(self, query: telegram.CallbackQuery, bot: telegram.Bot, chat_id: int,
+                         option: entry.ProviderEntry | None, text: str, reply_markup: InlineKeyboardMarkup):
+        picture_url = option.picture_url if option is not None else None
+        if bool(getattr(query.message, "photo", None)) == bool(picture_url):
+            if not picture_url:
+                return await query.edit_message_text(text, reply_markup=reply_markup)
+            try:
+                return await self.__pictures.edit(query, picture_url, text, reply_markup=reply_markup)
+            except error.BadRequest:
+                logger.warning("failed to show the picture of %s", option.name, exc_info=True)
+
+        # A text message can't get a picture and the other way round, so the card is sent anew
+        _, message = await asyncio.gather(query.delete_message(),
+                                          self._send_option(bot, chat_id, option, text, reply_markup))
+        return message
+
+    async def _broadcast_option(self, bot: telegram.Bot, chat_ids: typing.Iterable[str], option: entry.ProviderEntry,
+                                text: str, reply_markup: InlineKeyboardMarkup | ReplyKeyboardMarkup):
+        chat_ids = list(chat_ids)
+        if option.picture_url and chat_ids:
+            file_id = await self.__pictures.file_id(option.picture_url)
+            if file_id is None:
+                # The first chat gets the picture uploaded, the others get its file_id
+                first, *chat_ids = chat_ids
+                await self._send_option(bot, first, option, text, reply_markup)
+                file_id = await self.__pictures.file_id(option.picture_url)
+            if file_id is not None:
+                return await self.__broadcaster.send_photo(bot, chat_ids, file_id, caption=text,
+                                                           reply_markup=reply_markup)
+        return await self.__broadcaster.send_message(bot, chat_ids, text=text, reply_markup=reply_markup)
 
     async def choose_service_type(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
         provider_name = update.message.text
@@ -297,15 +440,64 @@ class QuoBot:
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text="{}".format(room_id))
 
+        await context.bot.send_message(chat_id=update.effective_chat.id,
+                                       text="Ожидаем остальных участников",
+                                       reply_markup=self._lobby_markup())
+
+        return QuoBotState.HOST_LOBBY
+
+    def _lobby_markup(self) -> ReplyKeyboardMarkup:
         buttons = [
             [button_option for button_option in self.__button_map["host_lobby"].keys()],
             ["Выйти"],
         ]
-        reply_markup = ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
-        await context.bot.send_message(chat_id=update.effective_chat.id,
-                                       text="Ожидаем остальных участников",
-                                       reply_markup=reply_markup)
+        return ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
+
+    def _format_filters(self, room_filters: dict) -> str:
+        return "\n".join("{}={}".format(name, value) for name, value in room_filters.items())
+
+    async def ask_filters(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        params = await self.__service.get_room_params(str(update.effective_chat.id))
+        hints = provider_filters.describe(ProviderKind(params.provider_name))
+        if not hints:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text="У этой категории нет фильтров",
+                                           reply_markup=self._lobby_markup())
+            return QuoBotState.HOST_LOBBY
+
+        text = "Отправьте фильтры по одному в строке, например\n{}=...\n\n{}".format(
+            next(iter(hints)), "\n".join("{} — {}".format(name, hint) for name, hint in hints.items()))
+        if params.filters:
+            text += "\n\nСейчас:\n{}".format(self._format_filters(params.filters))
+        reply_markup = ReplyKeyboardMarkup([["Без фильтров", "Отмена"]], one_time_keyboard=True, resize_keyboard=True)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=reply_markup)
+        return QuoBotState.QUERY_FILTERS
+
+    async def query_filters(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        text = update.message.text
+        if text == "Отмена":
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="Фильтры не изменились",
+                                           reply_markup=self._lobby_markup())
+            return QuoBotState.HOST_LOBBY
+
+        room_filters = dict()
+        if text != "Без фильтров":
+            for line in filter(None, map(str.strip, text.splitlines())):
+                name, sep, value = line.partition("=")
+                if not sep:
+                    await context.bot.send_message(chat_id=update.effective_chat.id,
+                                                   text="Не понял строку \"{}\", нужно имя=значение".format(line))
+                    return QuoBotState.QUERY_FILTERS
+                room_filters[name.strip()] = value.strip()
+
+        try:
+            room_filters = await self.__service.set_filters(str(update.effective_chat.id), room_filters)
+        except provider_filters.FilterError as e:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=str(e))
+            return QuoBotState.QUERY_FILTERS
 
+        text = "Фильтры сохранены:\n{}".format(self._format_filters(room_filters)) if room_filters else "Фильтров нет"
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=self._lobby_markup())
         return QuoBotState.HOST_LOBBY
 
     @handler_type.command
@@ -319,12 +511,9 @@ class QuoBot:
             participants = await self.__service.get_room_participants(str(user_id))
             await self.__service.leave_room(str(user_id))
 
-            for participant in participants:
-                if participant == str(user_id):
-                    continue
-
-                await context.bot.send_message(chat_id=participant,
-                                                text="@{} вышел".format(update.effective_user.username))
+            await self.__broadcaster.send_message(context.bot,
+                                                  [p for p in participants if p != str(user_id)],
+                                                  text="@{} вышел".format(update.effective_user.username))
 
         except:
             logging.info("left")
@@ -350,7 +539,19 @@ class QuoBot:
             return await self.leave_room(update, context)
 
         is_liked = (vote_response == "Лайк 👍")
-        await self.__service.vote(str(user_id), is_liked)
+        try:
+            outcome = await self.__service.vote(str(user_id), is_liked)
+        except:
+            # Nothing is left to vote for
+            return await self.next_vote(update, context)
+
+        if outcome == VoteOutcome.NO_MATCH:
+            participants = await self.__service.get_room_participants(str(user_id))
+            buttons = [[button_option for button_option in self.__button_map["start"].keys()]]
+            reply_markup = ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
+            await self.__broadcaster.send_message(context.bot, participants,
+                                                  text="😔 Ни один вариант не понравился всем",
+                                                  reply_markup=reply_markup)
 
         got_match = await self.__service.get_match(str(user_id))
         if got_match:
@@ -358,16 +559,63 @@ class QuoBot:
 
             await self.__service.reset_match(str(user_id))
 
-            match_txt = "✅ You've got a match: {}! ✅".format(got_match["name"])
-            if got_match["descr"]:
-                match_txt += "\n{}".format(got_match["descr"])
+            match_txt = "✅ You've got a match: {}! ✅".format(got_match.name)
+            if got_match.descr:
+                match_txt += "\n{}".format(got_match.descr)
 
             buttons = [[button_option for button_option in self.__button_map["start"].keys()]]
             reply_markup = ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
 
-            for participant in participants:
-                await context.bot.send_message(chat_id=participant,
-                                               text=match_txt,
-                                               reply_markup=reply_markup)
+            await self._broadcast_option(context.bot, participants, got_match, match_txt, reply_markup)
 
         return await self.next_vote(update, context)
+
+    async def vote_card(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        user_id = str(update.effective_chat.id)
+        try:
+            _, option_index, liked = query.data.split(":")
+            result = await self.__service.vote_and_next(user_id, liked == "1", int(option_index))
+        except:
+            # The user is not in a room anymore
+            context.chat_data.pop("card", None)
+            await asyncio.gather(query.answer("Голосование закончилось"), query.edit_message_reply_markup(None))
+            return ConversationHandler.END
+
+        if result["outcome"] == VoteOutcome.IGNORED:
+            await query.answer("Совпадение уже найдено" if result["match"] else None)
+            return QuoBotState.WAITING_FOR_VOTE
+
+        if result["outcome"] in (VoteOutcome.MATCH, VoteOutcome.NO_MATCH):
+            buttons = [[button_option for button_option in self.__button_map["start"].keys()]]
+            reply_markup = ReplyKeyboardMarkup(buttons, one_time_keyboard=True, resize_keyboard=True)
+            if result["outcome"] == VoteOutcome.MATCH:
+                text = "✅ You've got a match: {}! ✅".format(result["match"].name)
+                if result["match"].descr:
+                    text += "\n{}".format(result["match"].descr)
+                announce = self._broadcast_option(context.bot, result["participants"], result["match"], text,
+                                                  reply_markup)
+            else:
+                announce = self.__broadcaster.send_message(context.bot, result["participants"],
+                                                           text="😔 Ни один вариант не понравился всем",
+                                                           reply_markup=reply_markup)
+            # Cards of the others lose their buttons as their conversations end, see wait_for_end
+            context.chat_data.pop("card", None)
+            await asyncio.gather(query.edit_message_reply_markup(None), announce)
+            return ConversationHandler.END
+
+        # The edit replaces the buttons which were tapped, so the query is not answered separately:
+        # one Bot API call per swipe
+        text, reply_markup = self._card(result["option"], result["option_index"])
+        message = await self._edit_card(query, context.bot, update.effective_chat.id, result["option"], text,
+                                        reply_markup)
+        if isinstance(message, telegram.Message):
+            context.chat_data["card"] = message.message_id
+        self._preload(context.bot, result)
+        return QuoBotState.WAITING_FOR_VOTE
+
+    async def leave_card(self, update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        context.chat_data.pop("card", None)
+        await query.edit_message_reply_markup(None)
+        return await self.leave_room(update, context)
@@ -0,0 +1,116 @@
+import asyncio
+import contextlib
+import logging
+import secrets
+import signal
+import typing
+
+import telegram
+from aiohttp import web
+from telegram import ext
+
+
+__all__ = ["WebhookSettings", "get_settings", "run"]
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookSettings(typing.TypedDict):
+    url: str  # public https url Telegram posts updates to, path is appended to it, empty for shard workers
+    listen: str
+    port: int
+    path: str
+    secret_token: str
+    workers: int  # updates processed at once
+
+
+def get_settings(config: typing.Dict[str, str]) -> typing.Optional[WebhookSettings]:
+    """None unless BOT_MODE is webhook or the process is a shard worker"""
+    # Shard workers get updates from the front, not from Telegram, so they have no public url
+    worker = config.get("SHARD_ROLE", "").lower() == "worker"
+    if worker:
+        if not config.get("WEBHOOK_SECRET"):
+            raise ValueError("WEBHOOK_SECRET shared with the front is required for shard workers")
+    elif config.get("BOT_MODE", "polling").lower() != "webhook":
+        return None
+    elif not config.get("WEBHOOK_URL"):
+        raise ValueError("WEBHOOK_URL is required in webhook mode")
+
+    return WebhookSettings(
+        url="" if worker else config["WEBHOOK_URL"].rstrip("/"),
+        listen=config.get("WEBHOOK_LISTEN", "127.0.0.1"),
+        port=int(config.get("WEBHOOK_PORT", 8080)),
+        path=config.get("WEBHOOK_PATH", "telegram").strip("/"),
+        # Anyone who knows the url could post fake updates otherwise
+        secret_token=config.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32),
+        workers=int(config.get("UPDATE_WORKERS", 16)),
+    )
+
+
+class _Handlers:
+    def __init__(self, app: ext.Application, secret_token: str):
+        self.app = app
+        self.secret_token = secret_token
+
+    async def update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=403)
+        try:
+            update = telegram.Update.de_json(await request.json(), self.app.bot)
+        except Exception:
+            logger.warning("webhook: malformed update", exc_info=True)
+            return web.Response(status=400)
+
+        # Application workers take it from here, Telegram should not wait for the handlers
+        await self.app.update_queue.put(update)
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        status = 200 if self.app.running else 503
+        return web.json_response({"running": self.app.running, "pending_updates": self.app.update_queue.qsize()},
+                                 status=status)
+
+
+async def serve(app: ext.Application, settings: WebhookSettings, stop: asyncio.Event) -> None:
+    handlers = _Handlers(app, settings["secret_token"])
+    web_app = web.Application()
+    web_app.add_routes([
+        web.post("/" + settings["path"], handlers.update),
+        web.get("/healthz", handlers.health),
+    ])
+    runner = web.AppRunner(web_app, access_log=None)
+
+    await app.initialize()
+    try:
+        await app.start()
+        await runner.setup()
+        await web.TCPSite(runner, settings["listen"], settings["port"]).start()
+        if settings["url"]:
+            await app.bot.set_webhook(
+                url="{}/{}".format(settings["url"], settings["path"]),
+                secret_token=settings["secret_token"],
+                allowed_updates=telegram.Update.ALL_TYPES,
+                max_connections=min(max(settings["workers"], 1), 100),
+            )
+        logger.info("webhook: listening on %s:%d/%s", settings["listen"], settings["port"], settings["path"])
+
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def run(app: ext.Application, settings: WebhookSettings) -> None:
+    """Blocks until SIGINT or SIGTERM like Application.run_polling does"""
+    loop = asyncio.get_event_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    loop.run_until_complete(serve(app, settings, stop))
@@ -1,9 +1,28 @@
+import dataclasses
 import typing
 
+import msgpack
 
-class ProviderEntry(typing.TypedDict):
+
+@dataclasses.dataclass(slots=True)
+class ProviderEntry:
     name: str
-    descr: str | None
-    rating: float | None  # in [0.0 : 1.0]
-    price: int | None  # In rubles
-    picture_url: str | None
+    descr: str | None = None
+    rating: float | None = None  # in [0.0 : 1.0]
+    price: int | None = None  # In rubles
+    picture_url: str | None = None
+
+    def to_list(self) -> list:
+        return [self.name, self.descr, self.rating, self.price, self.picture_url]
+
+    @classmethod
+    def from_list(cls, data: typing.Sequence) -> "ProviderEntry":
+        name, descr, rating, price, picture_url = data
+        return cls(name, descr, rating, price, picture_url)
+
+    def to_bytes(self) -> bytes:
+        return msgpack.packb(self.to_list(), use_bin_type=True)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ProviderEntry":
+        return cls.from_list(msgpack.unpackb(data, raw=False))
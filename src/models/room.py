@@ -1,6 +1,108 @@
+import dataclasses
 import typing
 
+import msgpack
 
-class RoomParams(typing.TypedDict):
+from models import entry
+
+# Rooms are stored as positional msgpack arrays: field names are not repeated
+# in every blob, sets become arrays and int keyed dicts stay int keyed.
+FORMAT_VERSION = 7
+
+
+def encode_mask(mask: int) -> bytes:
+    # msgpack ints stop at 64 bits while rooms can be larger
+    return mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+
+
+def decode_mask(data: bytes) -> int:
+    return int.from_bytes(data, "little")
+
+
+@dataclasses.dataclass(slots=True)
+class RoomParams:
     provider_name: str
-    filters: dict[str, int | str]
+    filters: dict[str, int | str] = dataclasses.field(default_factory=dict)
+
+    def to_list(self) -> list:
+        return [self.provider_name, self.filters]
+
+    @classmethod
+    def from_list(cls, data: typing.Sequence) -> "RoomParams":
+        provider_name, filters = data
+        return cls(provider_name, filters)
+
+
+@dataclasses.dataclass(slots=True)
+class RoomData:
+    owner: str
+
+    params: RoomParams
+
+    participants: set[str] = dataclasses.field(default_factory=set)
+    participants_positions: dict[str, int] = dataclasses.field(default_factory=dict)  # position in the current order; sizeof == sizeof participants
+    participants_seeds: dict[str, int] = dataclasses.field(default_factory=dict)  # seed of the current order, see service.ordering; sizeof == sizeof participants
+    participants_indexes: dict[str, int] = dataclasses.field(default_factory=dict)  # dense bit index of every participant, never reused inside the room
+    participants_mask: int = 0  # bits of participants_indexes of everyone currently in the room
+    next_participant_index: int = 0
+    participants_options: dict[str, typing.Optional[int]] = dataclasses.field(default_factory=dict)  # current option of every participant in adaptive rooms, None once they voted for every live option
+
+    ordering: str = "shuffled"  # see service.ordering
+
+    options: list[entry.ProviderEntry] = dataclasses.field(default_factory=list)
+    options_likes: list[int] = dataclasses.field(default_factory=list)  # bitmask of participants_indexes; sizeof == sizeof options
+    options_dislikes: list[int] = dataclasses.field(default_factory=list)  # bitmask of participants_indexes; sizeof == sizeof options
+    options_dead: int = 0  # options disliked by someone still in the room, they can't match
+    options_unvoted: int = 0  # every option before it has a vote of someone still in the room, see service.ordering
+
+    match: typing.Optional[entry.ProviderEntry] = None
+    vote_started: bool = False
+
+    def to_bytes(self) -> bytes:
+        return msgpack.packb([
+            FORMAT_VERSION,
+            self.owner,
+            None if self.params is None else self.params.to_list(),
+            list(self.participants),
+            self.participants_positions,
+            self.participants_seeds,
+            self.participants_indexes,
+            encode_mask(self.participants_mask),
+            self.next_participant_index,
+            self.participants_options,
+            self.ordering,
+            [e.to_list() for e in self.options],
+            [encode_mask(likes) for likes in self.options_likes],
+            [encode_mask(dislikes) for dislikes in self.options_dislikes],
+            self.options_dead,
+            self.options_unvoted,
+            None if self.match is None else self.match.to_list(),
+            self.vote_started,
+        ], use_bin_type=True)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RoomData":
+        (version, owner, params, participants, positions, seeds, indexes, mask, next_index, current, ordering,
+         options, likes, dislikes, dead, unvoted, match, vote_started) = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        if version != FORMAT_VERSION:
+            raise ValueError("Unsupported room format version: {}".format(version))
+
+        return cls(
+            owner=owner,
+            params=None if params is None else RoomParams.from_list(params),
+            participants=set(participants),
+            participants_positions=positions,
+            participants_seeds=seeds,
+            participants_indexes=indexes,
+            participants_mask=decode_mask(mask),
+            next_participant_index=next_index,
+            participants_options=current,
+            ordering=ordering,
+            options=[entry.ProviderEntry.from_list(e) for e in options],
+            options_likes=[decode_mask(m) for m in likes],
+            options_dislikes=[decode_mask(m) for m in dislikes],
+            options_dead=dead,
+            options_unvoted=unvoted,
+            match=None if match is None else entry.ProviderEntry.from_list(match),
+            vote_started=vote_started,
+        )
@@ -1,6 +1,12 @@
 import typing
 
 from . import interface
+from . import cache
+from . import catalog
+from . import filters
+from . import http_pool
+from . import measured
+from . import singleflight
 from .dummy import provider as dummy
 from .kinopoisk import provider as kinopoisk
 from .restaurants import provider as restaurants
@@ -9,13 +15,59 @@ from .city import provider as city
 from .custom import provider as custom
 
 
+# name: (ttl, stale_ttl) in seconds, can be overridden with <NAME>_CACHE_TTL and <NAME>_CACHE_STALE_TTL
+HOUR = 60 * 60
+CACHE_TTLS = {
+    "kinopoisk": (HOUR, HOUR),
+    "restaurants": (HOUR, HOUR),
+    "country": (24 * HOUR, 7 * 24 * HOUR),
+    "city": (24 * HOUR, 7 * 24 * HOUR),
+}
+
+# name: (source module, entries returned without a limit filter), served from local snapshots
+CATALOGS = {
+    "country": (country, None),
+    "city": (city, 30),
+}
+
+
+async def get_catalog_source(config: typing.Dict[str, str], http: http_pool.HttpPool,
+                             name: str) -> catalog.CatalogSource:
+    return await CATALOGS[name][0].get_provider(config, http)
+
+
+async def _catalog(config: typing.Dict[str, str], http: http_pool.HttpPool, name: str) -> interface.ProviderInterface:
+    return catalog.get_provider(config, name, await get_catalog_source(config, http, name),
+                                default_limit=CATALOGS[name][1])
+
+
+def _cached(config: typing.Dict[str, str], entries_cache: cache.ProviderCache, kind: interface.ProviderKind,
+            name: str, provider: interface.ProviderInterface) -> interface.ProviderInterface:
+    provider = measured.MeasuredProvider(name, provider)
+    # Rooms starting at once wait for the same request, with or without the cache in front
+    provider = singleflight.CoalescingProvider(kind, provider)
+    ttl, stale_ttl = CACHE_TTLS[name]
+    ttl = float(config.get("{}_CACHE_TTL".format(name.upper()), ttl))
+    stale_ttl = float(config.get("{}_CACHE_STALE_TTL".format(name.upper()), stale_ttl))
+    if ttl <= 0:
+        return provider
+    return cache.CachingProvider(kind, provider, entries_cache, ttl, stale_ttl)
+
+
 async def get_providers(config: typing.Dict[str, str]) -> typing.Dict[interface.ProviderKind, interface.ProviderInterface]:
+    # Shared by all providers and closed together with them
+    http = http_pool.get_pool(config)
+    entries_cache = cache.ProviderCache(int(config.get("PROVIDER_CACHE_SIZE", 128)))
 
     return {
-        # interface.ProviderKind.DUMMY: await dummy.get_provider(config),
-        interface.ProviderKind.KINOPOISK: await kinopoisk.get_provider(config),
-        interface.ProviderKind.RESTAURANTS: await restaurants.get_provider(config),
-        interface.ProviderKind.COUNTRY: await country.get_provider(config),
-        interface.ProviderKind.CITY: await city.get_provider(config),
+        # interface.ProviderKind.DUMMY: await dummy.get_provider(config, http),
+        interface.ProviderKind.KINOPOISK: _cached(config, entries_cache, interface.ProviderKind.KINOPOISK, "kinopoisk",
+                                                  await kinopoisk.get_provider(config, http)),
+        interface.ProviderKind.RESTAURANTS: _cached(config, entries_cache, interface.ProviderKind.RESTAURANTS, "restaurants",
+                                                    await restaurants.get_provider(config, http)),
+        interface.ProviderKind.COUNTRY: _cached(config, entries_cache, interface.ProviderKind.COUNTRY, "country",
+                                                await _catalog(config, http, "country")),
+        interface.ProviderKind.CITY: _cached(config, entries_cache, interface.ProviderKind.CITY, "city",
+                                             await _catalog(config, http, "city")),
         interface.ProviderKind.CUSTOM: None,
     }
@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import copy
+import json
+import logging
+import time
+import typing
+
+from models import entry
+from utils import metrics
+from . import interface
+
+
+class CacheStats(typing.TypedDict):
+    hits: int
+    stale_hits: int
+    misses: int
+    refreshes: int
+    refresh_errors: int
+    evictions: int
+    size: int
+
+
+class _CacheItem(typing.NamedTuple):
+    entries: list[entry.ProviderEntry]
+    fetched_at: float
+
+
+class ProviderCache:
+    """Size bounded LRU storage shared by all caching providers"""
+
+    items_: collections.OrderedDict[str, _CacheItem]
+
+    def __init__(self, max_size: int):
+        self.max_size_ = max_size
+        self.items_ = collections.OrderedDict()
+        self.stats_ = CacheStats(hits=0, stale_hits=0, misses=0, refreshes=0, refresh_errors=0, evictions=0, size=0)
+
+    def get(self, key: str) -> typing.Optional[_CacheItem]:
+        item = self.items_.get(key)
+        if item is not None:
+            self.items_.move_to_end(key)
+        return item
+
+    def put(self, key: str, entries: list[entry.ProviderEntry]):
+        self.items_[key] = _CacheItem(entries, time.monotonic())
+        self.items_.move_to_end(key)
+        while len(self.items_) > self.max_size_:
+            self.items_.popitem(last=False)
+            self.stats_["evictions"] += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(**{**self.stats_, "size": len(self.items_)})
+
+
+def cache_key(kind: interface.ProviderKind, params: interface.ProviderParams) -> str:
+    # Same filters in another order are the same request
+    return json.dumps([
+        kind.name,
+        sorted(params["filters"].items()),
+        sorted(params["exclude_names"]),
+    ], ensure_ascii=False)
+
+
+class CachingProvider(interface.ProviderInterface):
+    """Serves entries from the cache while they are younger than ttl.
+
+    Entries older than ttl but younger than ttl + stale_ttl are still served,
+    while a fresh copy is fetched in the background.
+    """
+
+    refreshing_: dict[str, asyncio.Task]
+
+    def __init__(self, kind: interface.ProviderKind, provider: interface.ProviderInterface,
+                 cache: ProviderCache, ttl: float, stale_ttl: float):
+        self.kind_ = kind
+        self.provider_ = provider
+        self.cache_ = cache
+        self.ttl_ = ttl
+        self.stale_ttl_ = stale_ttl
+        self.refreshing_ = dict()
+
+    async def get_entries(self, params: interface.ProviderParams) -> list[entry.ProviderEntry]:
+        key = cache_key(self.kind_, params)
+        cached = self._lookup(key, params)
+        if cached is not None:
+            return cached
+
+        entries = await self.provider_.get_entries(params)
+        self.cache_.put(key, entries)
+        return self._copy(entries)
+
+    async def iter_entries(self, params: interface.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        key = cache_key(self.kind_, params)
+        cached = self._lookup(key, params)
+        if cached is not None:
+            yield cached
+            return
+
+        # Pages are passed through as they come, only a complete list gets cached
+        entries: list[entry.ProviderEntry] = []
+        async for page in self.provider_.iter_entries(params):
+            entries += page
+            yield self._copy(page)
+        self.cache_.put(key, entries)
+
+    def _lookup(self, key: str, params: interface.ProviderParams) -> typing.Optional[list[entry.ProviderEntry]]:
+        item = self.cache_.get(key)
+        age = None if item is None else time.monotonic() - item.fetched_at
+
+        if age is not None and age < self.ttl_:
+            self.cache_.stats_["hits"] += 1
+            self._count("hit")
+            return self._copy(item.entries)
+
+        if age is not None and age < self.ttl_ + self.stale_ttl_:
+            self.cache_.stats_["stale_hits"] += 1
+            self._count("stale_hit")
+            if key not in self.refreshing_:
+                self.refreshing_[key] = asyncio.create_task(self._refresh(key, params))
+            return self._copy(item.entries)
+
+        self.cache_.stats_["misses"] += 1
+        self._count("miss")
+        return None
+
+    def _count(self, result: str):
+        metrics.PROVIDER_CACHE.labels(self.kind_.name.lower(), result).inc()
+
+    async def _refresh(self, key: str, params: interface.ProviderParams):
+        try:
+            self.cache_.put(key, await self.provider_.get_entries(params))
+            self.cache_.stats_["refreshes"] += 1
+        except Exception:
+            self.cache_.stats_["refresh_errors"] += 1
+            logging.exception("failed to refresh %s entries", self.kind_.name)
+        finally:
+            del self.refreshing_[key]
+
+    def _copy(self, entries: list[entry.ProviderEntry]) -> list[entry.ProviderEntry]:
+        # Callers shuffle and extend the result, cached list must stay intact
+        return [copy.copy(e) for e in entries]
+
+    async def close(self) -> None:
+        for task in self.refreshing_.values():
+            task.cancel()
+        await self.provider_.close()
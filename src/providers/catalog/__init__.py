@@ -0,0 +1,2 @@
+from . import snapshot
+from .provider import CatalogProvider, CatalogSource, get_path, get_provider
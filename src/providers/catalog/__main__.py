@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Builds catalog snapshots the country and city providers serve from.
+
+Run from src: python -m providers.catalog [country city]
+Snapshots are written to CATALOG_DIR (catalogs by default), running bots pick them up at once.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import dotenv
+
+import providers
+from providers import http_pool
+from providers.catalog import provider
+from providers.catalog import snapshot
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m providers.catalog", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", default=list(providers.CATALOGS),
+                        help="any of {}, all by default".format(", ".join(providers.CATALOGS)))
+    parser.add_argument("--dir", help="overrides CATALOG_DIR")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(providers.CATALOGS)
+    if unknown:
+        parser.error("unknown catalogs: {}".format(", ".join(sorted(unknown))))
+    return args
+
+
+async def _build(args: argparse.Namespace):
+    config = {
+        **dotenv.dotenv_values(".env"),
+        **os.environ,
+    }
+    if args.dir:
+        config["CATALOG_DIR"] = args.dir
+
+    http = http_pool.get_pool(config)
+    try:
+        for name in args.names:
+            path = provider.get_path(config, name)
+            source = await providers.get_catalog_source(config, http, name)
+            started = time.monotonic()
+            count = await snapshot.write(path, source.iter_catalog_rows(), name)
+            print("{}: {} entries in {:.1f}s, {} bytes written to {}".format(
+                name, count, time.monotonic() - started, os.path.getsize(path), path))
+    finally:
+        await http.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_build(_parse_args()))
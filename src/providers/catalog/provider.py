@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+import typing
+
+from models import entry
+from providers import interface as providers
+
+from . import snapshot
+
+
+class CatalogSource(typing.Protocol):
+    """Provider which can list all of its entries with the attributes they are filtered by"""
+
+    def iter_catalog_rows(self) -> typing.AsyncIterator[list[snapshot.CatalogRow]]:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+# Filters served from the snapshot, others are ignored
+QUERY_FILTERS = ("min_population", "region", "country", "limit")
+RETRY_INTERVAL = 15 * 60
+
+
+class CatalogProvider(providers.ProviderInterface):
+    """Serves entries from a local snapshot of the source and rebuilds it in the background once it is old.
+
+    The network is used only when there is no snapshot at all yet, e.g. on the very first start;
+    snapshots can be built in advance with `python -m providers.catalog`.
+    """
+
+    def __init__(self, name: str, source: CatalogSource, path: str, refresh_interval: float,
+                 default_limit: typing.Optional[int] = None):
+        self.name_ = name
+        self.source_ = source
+        self.path_ = path
+        self.refresh_interval_ = refresh_interval
+        self.default_limit_ = default_limit
+        self.built_at_: typing.Optional[float] = None
+        self.retry_at_ = 0.0
+        self.building_: typing.Optional[asyncio.Task] = None
+
+    async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
+        if self.built_at_ is None:
+            self.built_at_ = await asyncio.to_thread(snapshot.built_at, self.path_)
+        if self.built_at_ is None:
+            logging.warning("catalog: no %s snapshot at %s, building it now", self.name_, self.path_)
+            await asyncio.shield(self._build())
+            if self.built_at_ is None:
+                raise RuntimeError("No {} snapshot".format(self.name_))
+        elif time.time() - self.built_at_ > self.refresh_interval_ and time.time() >= self.retry_at_:
+            self._build()
+
+        return await asyncio.to_thread(snapshot.read, self.path_, self._query(params))
+
+    def _query(self, params: providers.ProviderParams) -> snapshot.CatalogQuery:
+        query = snapshot.CatalogQuery(exclude_names=params["exclude_names"])
+        if self.default_limit_ is not None:
+            query["limit"] = self.default_limit_
+        for name in QUERY_FILTERS:
+            if name in params["filters"]:
+                query[name] = params["filters"][name]
+        return query
+
+    def _build(self) -> asyncio.Task:
+        if self.building_ is None:
+            self.building_ = asyncio.create_task(self._rebuild())
+        return self.building_
+
+    async def _rebuild(self):
+        try:
+            # Another worker of the host may have rebuilt it already
+            built_at = await asyncio.to_thread(snapshot.built_at, self.path_)
+            if built_at is not None and time.time() - built_at <= self.refresh_interval_:
+                self.built_at_ = built_at
+                return
+
+            started = time.monotonic()
+            count = await snapshot.write(self.path_, self.source_.iter_catalog_rows(), self.name_)
+            self.built_at_ = time.time()
+            logging.info("catalog: %s snapshot with %d entries built in %.1fs", self.name_, count,
+                         time.monotonic() - started)
+        except Exception:
+            # The old snapshot, if any, is served in the meantime
+            logging.exception("catalog: failed to build %s snapshot", self.name_)
+            self.retry_at_ = time.time() + RETRY_INTERVAL
+        finally:
+            self.building_ = None
+
+    async def close(self) -> None:
+        if self.building_ is not None:
+            self.building_.cancel()
+        await self.source_.close()
+
+
+def get_path(config: typing.Dict[str, str], name: str) -> str:
+    return os.path.join(config.get("CATALOG_DIR", "catalogs"), "{}.sqlite".format(name))
+
+
+def get_provider(config: typing.Dict[str, str], name: str, source: CatalogSource,
+                 default_limit: typing.Optional[int] = None) -> providers.ProviderInterface:
+    return CatalogProvider(
+        name,
+        source,
+        get_path(config, name),
+        float(config.get("CATALOG_REFRESH_INTERVAL", 7 * 24 * 60 * 60)),
+        default_limit=default_limit,
+    )
@@ -0,0 +1,127 @@
+import contextlib
+import os
+import sqlite3
+import tempfile
+import time
+import typing
+
+from models import entry
+
+
+__all__ = ["CatalogRow", "CatalogQuery", "write", "read", "built_at"]
+
+# A snapshot is a read-only SQLite file with one row per entry plus the attributes entries
+# are filtered by. Those attributes are indexed together with population, so the largest
+# matching entries come straight from an index. It is opened memory-mapped, so every
+# worker of the host shares the same pages of it.
+
+FORMAT_VERSION = 1
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE entries (
+    name TEXT NOT NULL,
+    descr TEXT,
+    population INTEGER,
+    region TEXT,
+    country TEXT
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX entries_population ON entries (population DESC);
+CREATE INDEX entries_region ON entries (region, population DESC);
+CREATE INDEX entries_country ON entries (country, population DESC);
+"""
+
+
+class CatalogRow(typing.NamedTuple):
+    name: str
+    descr: typing.Optional[str] = None
+    population: typing.Optional[int] = None
+    region: typing.Optional[str] = None
+    country: typing.Optional[str] = None
+
+
+class CatalogQuery(typing.TypedDict, total=False):
+    min_population: int
+    region: str
+    country: str
+    limit: int  # largest entries by population first
+    exclude_names: list[str]
+
+
+def parse_population(value: str) -> typing.Optional[int]:
+    """OSM population is free text like "12 655 050" or "~300000" """
+    digits = "".join(c for c in value.split(";")[0] if c.isdigit())
+    return int(digits) if digits else None
+
+
+async def write(path: str, rows: typing.AsyncIterator[list[CatalogRow]], source: str) -> int:
+    """Replaces the snapshot at path atomically, readers keep the file they have opened"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Several workers may refresh the same snapshot at once
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        count = 0
+        with contextlib.closing(sqlite3.connect(tmp_path)) as db:
+            db.executescript(SCHEMA)
+            async for page in rows:
+                db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", page)
+                count += len(page)
+            db.executemany("INSERT INTO meta VALUES (?, ?)", [("source", source), ("built_at", str(time.time()))])
+            db.execute("PRAGMA user_version = {}".format(FORMAT_VERSION))
+            db.commit()
+            db.execute("ANALYZE")
+            db.execute("VACUUM")
+        os.replace(tmp_path, path)
+        return count
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # immutable: snapshots are never changed in place, only replaced, so no locking is needed
+    db = sqlite3.connect("file:{}?mode=ro&immutable=1".format(path), uri=True)
+    db.execute("PRAGMA mmap_size = {}".format(MMAP_SIZE))
+    if db.execute("PRAGMA user_version").fetchone()[0] != FORMAT_VERSION:
+        db.close()
+        raise ValueError("{} is not a catalog snapshot of version {}".format(path, FORMAT_VERSION))
+    return db
+
+
+def built_at(path: str) -> typing.Optional[float]:
+    """None if there is no usable snapshot at path"""
+    try:
+        with contextlib.closing(_connect(path)) as db:
+            return float(db.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()[0])
+    except (sqlite3.Error, ValueError, TypeError):
+        return None
+
+
+def read(path: str, query: CatalogQuery) -> list[entry.ProviderEntry]:
+    """Blocks, takes milliseconds thanks to the indexes"""
+    conditions, args = [], []
+    if "min_population" in query:
+        conditions.append("population >= ?")
+        args.append(query["min_population"])
+    for column in ("region", "country"):
+        if column in query:
+            conditions.append("{} = ?".format(column))
+            args.append(query[column])
+    if query.get("exclude_names"):
+        conditions.append("name NOT IN ({})".format(", ".join("?" * len(query["exclude_names"]))))
+        args += query["exclude_names"]
+
+    sql = "SELECT name, descr FROM entries"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY population DESC"
+    if "limit" in query:
+        sql += " LIMIT ?"
+        args.append(query["limit"])
+
+    with contextlib.closing(_connect(path)) as db:
+        return [entry.ProviderEntry(name=name, descr=descr) for name, descr in db.execute(sql, args)]
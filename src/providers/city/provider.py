@@ -3,32 +3,48 @@ import typing
 import httpx
 
 from models import entry
+from providers import http_pool
 from providers import interface as providers
+from providers import overpass
+from providers.catalog import snapshot
 
 
 class CityProvider(providers.ProviderInterface):
-    def __init__(self, overpass_url: str):
+    def __init__(self, overpass_url: str, http: http_pool.HttpPool, timeout: httpx.Timeout):
         self.overpass_url = overpass_url
+        self.http = http
+        self.timeout = timeout
+        # All cities are listed, snapshots filter them by region and population
         self.query = ('/* Get list of cities in Russian. */'
-                      "[out:json];area[name='Россия']->.russia;(node[place=city](area.russia););out 30;")
+                      "[out:csv('name:ru', 'population', 'addr:region', ::lat, ::lon; false)];"
+                      "area[name='Россия']->.russia;(node[place=city](area.russia););out;")
+        self.country = "Россия"
         self.ref_template = "https://yandex.com/maps?whatshere[point]={lng},{lat}"
 
     async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
-
-        async with httpx.AsyncClient() as client:
-            r = await client.get(self.overpass_url, params={'data': self.query}, timeout=None)
-
-            return [
-                entry.ProviderEntry(
-                    name=element['tags']["name:ru"],
-                    descr=f"На карте: {self.ref_template.format(lat=element['lat'], lng=element['lon'])}",
-                    rating=None,
-                    price=None,
-                    picture_url=None,
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        async for rows in self.iter_catalog_rows():
+            yield [entry.ProviderEntry(name=row.name, descr=row.descr) for row in rows]
+
+    async def iter_catalog_rows(self) -> typing.AsyncIterator[list[snapshot.CatalogRow]]:
+        client = self.http.client(self.overpass_url)
+        async for rows in overpass.iter_csv_rows(client, self.overpass_url, self.query, self.timeout):
+            yield [
+                snapshot.CatalogRow(
+                    name=name,
+                    descr=f"На карте: {self.ref_template.format(lat=lat, lng=lon)}",
+                    population=snapshot.parse_population(population),
+                    region=region or None,
+                    country=self.country,
                 )
-                for element in r.json()['elements']
+                for name, population, region, lat, lon in rows if len(name) > 0
             ]
 
+    async def close(self) -> None:
+        await self.http.close()
+
 
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
-    return CityProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter")
\ No newline at end of file
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
+    return CityProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter", http, http_pool.get_timeout(config, "city"))
@@ -3,33 +3,43 @@ import typing
 import httpx
 
 from models import entry
+from providers import http_pool
 from providers import interface as providers
+from providers import overpass
+from providers.catalog import snapshot
 
 
 class CountryProvider(providers.ProviderInterface):
-    def __init__(self, overpass_url: str):
+    def __init__(self, overpass_url: str, http: http_pool.HttpPool, timeout: httpx.Timeout):
         self.overpass_url = overpass_url
+        self.http = http
+        self.timeout = timeout
         self.query = ('/* Get list of countries in Russian. */'
-                      '[out:csv("name:ru")];relation["admin_level"="2"]'
+                      '[out:csv("name:ru", "population"; false)];relation["admin_level"="2"]'
                       '[boundary=administrative][type!=multilinestring];out;')
 
     async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
-
-        async with httpx.AsyncClient() as client:
-            r = await client.post(self.overpass_url, data=self.query)
-
-            data = [elem for elem in r.text.split('\n')[1:]]
-            return [
-                entry.ProviderEntry(
-                    name=element,
-                    descr=None,
-                    rating=None,
-                    price=None,
-                    picture_url=None,
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        async for rows in self.iter_catalog_rows():
+            yield [entry.ProviderEntry(name=row.name, descr=row.descr) for row in rows]
+
+    async def iter_catalog_rows(self) -> typing.AsyncIterator[list[snapshot.CatalogRow]]:
+        client = self.http.client(self.overpass_url)
+        async for rows in overpass.iter_csv_rows(client, self.overpass_url, self.query, self.timeout):
+            yield [
+                snapshot.CatalogRow(
+                    name=name,
+                    population=snapshot.parse_population(population),
+                    country=name,
                 )
-                for element in data if len(element) > 0
+                for name, population in rows if len(name) > 0
             ]
 
+    async def close(self) -> None:
+        await self.http.close()
+
 
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
-    return CountryProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter")
\ No newline at end of file
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
+    return CountryProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter", http, http_pool.get_timeout(config, "country"))
@@ -1,6 +1,7 @@
 import typing
 
+from providers import http_pool
 from providers import interface as providers
 
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
     raise Exception("THIS ONE SHOULDN'T BE REALLY CALLED. IT'S JUST BOGUS")
@@ -1,6 +1,7 @@
 import typing
 
 from models import entry
+from providers import http_pool
 from providers import interface as providers
 
 
@@ -17,5 +18,5 @@ class DummyProvider(providers.ProviderInterface):
         ]
 
 
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
     return DummyProvider()
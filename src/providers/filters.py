@@ -0,0 +1,147 @@
+import datetime
+import typing
+
+from . import interface
+
+
+__all__ = ["FilterError", "KinopoiskFilters", "RestaurantsFilters", "CountryFilters", "CityFilters",
+           "validate", "describe", "current_month"]
+
+# Room filters are checked once when they are set, providers translate them into
+# their query parameters as they are, so nothing is downloaded just to be filtered out.
+
+
+class FilterError(ValueError):
+    """Message is shown to the user as is"""
+
+
+class KinopoiskFilters(typing.TypedDict, total=False):
+    year: int
+    month: str  # premieres of the month, JANUARY...DECEMBER
+    genre: int  # Kinopoisk genre id, films of the year sorted by votes instead of premieres
+    page: int  # 20 films per page, with genre or instead of month
+
+
+class RestaurantsFilters(typing.TypedDict, total=False):
+    area: str  # OSM area name, e.g. a city
+    bbox: str  # "south,west,north,east" in degrees, instead of area
+    amenity: str
+    limit: int
+
+
+class CountryFilters(typing.TypedDict, total=False):
+    min_population: int
+    limit: int  # the most populous first
+
+
+class CityFilters(typing.TypedDict, total=False):
+    region: str
+    min_population: int
+    limit: int  # the most populous first
+
+
+MONTHS = ("JANUARY", "FEBRUARY", "MARCH", "APRIL", "MAY", "JUNE",
+          "JULY", "AUGUST", "SEPTEMBER", "OCTOBER", "NOVEMBER", "DECEMBER")
+AMENITIES = ("restaurant", "cafe", "bar", "pub", "fast_food", "food_court", "biergarten", "ice_cream")
+
+
+class _Field(typing.NamedTuple):
+    parse: typing.Callable[[typing.Any], int | str]  # raises ValueError
+    hint: str
+
+
+def _int(low: int, high: int) -> typing.Callable[[typing.Any], int]:
+    def parse(value: typing.Any) -> int:
+        if isinstance(value, bool):
+            raise ValueError(value)
+        value = int(value)
+        if not low <= value <= high:
+            raise ValueError(value)
+        return value
+
+    return parse
+
+
+def _choice(choices: typing.Sequence[str], normalize: typing.Callable[[str], str]) -> typing.Callable[[typing.Any], str]:
+    def parse(value: typing.Any) -> str:
+        value = normalize(str(value).strip())
+        if value not in choices:
+            raise ValueError(value)
+        return value
+
+    return parse
+
+
+def _name(value: typing.Any) -> str:
+    value = str(value).strip()
+    # Names go into Overpass queries in quotes
+    if not value or len(value) > 100 or any(c in value for c in "'\"\\[]();"):
+        raise ValueError(value)
+    return value
+
+
+def _bbox(value: typing.Any) -> str:
+    south, west, north, east = (float(v) for v in str(value).split(","))
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+        raise ValueError(value)
+    return "{},{},{},{}".format(south, west, north, east)
+
+
+SCHEMAS: dict[interface.ProviderKind, dict[str, _Field]] = {
+    interface.ProviderKind.KINOPOISK: {
+        "year": _Field(_int(1900, 2100), "год, по умолчанию текущий"),
+        "month": _Field(_choice(MONTHS, str.upper), "месяц премьер: JANUARY...DECEMBER, по умолчанию текущий"),
+        "genre": _Field(_int(1, 100), "id жанра Кинопоиска, фильмы года по числу оценок вместо премьер"),
+        "page": _Field(_int(1, 20), "страница из 20 фильмов, вместо месяца"),
+    },
+    interface.ProviderKind.RESTAURANTS: {
+        "area": _Field(_name, "город или другая область OpenStreetMap, по умолчанию Москва"),
+        "bbox": _Field(_bbox, "юг,запад,север,восток в градусах вместо area"),
+        "amenity": _Field(_choice(AMENITIES, str.lower), "тип заведения: {}".format(", ".join(AMENITIES))),
+        "limit": _Field(_int(1, 200), "сколько заведений, по умолчанию 20"),
+    },
+    interface.ProviderKind.COUNTRY: {
+        "min_population": _Field(_int(0, 10 ** 10), "минимальное население"),
+        "limit": _Field(_int(1, 500), "сколько стран, самые населённые первыми"),
+    },
+    interface.ProviderKind.CITY: {
+        "region": _Field(_name, "регион, например Московская область"),
+        "min_population": _Field(_int(0, 10 ** 8), "минимальное население"),
+        "limit": _Field(_int(1, 1000), "сколько городов, самые населённые первыми, по умолчанию 30"),
+    },
+}
+
+# Filters which make no sense together
+CONFLICTS: dict[interface.ProviderKind, list[tuple[str, str]]] = {
+    interface.ProviderKind.KINOPOISK: [("month", "genre"), ("month", "page")],
+    interface.ProviderKind.RESTAURANTS: [("area", "bbox")],
+}
+
+
+def validate(kind: interface.ProviderKind, filters: typing.Mapping[str, typing.Any]) -> dict[str, int | str]:
+    """Normalized filters, raises FilterError for unknown names and bad values"""
+    schema = SCHEMAS.get(kind, {})
+    result: dict[str, int | str] = dict()
+    for name, value in filters.items():
+        field = schema.get(name)
+        if field is None:
+            raise FilterError("Неизвестный фильтр {}".format(name))
+        try:
+            result[name] = field.parse(value)
+        except (TypeError, ValueError):
+            raise FilterError("Неверное значение {}: {}".format(name, field.hint)) from None
+
+    for first, second in CONFLICTS.get(kind, []):
+        if first in result and second in result:
+            raise FilterError("Фильтры {} и {} нельзя задать вместе".format(first, second))
+    return result
+
+
+def describe(kind: interface.ProviderKind) -> dict[str, str]:
+    """Filter names of the kind with hints for users"""
+    return {name: field.hint for name, field in SCHEMAS.get(kind, {}).items()}
+
+
+def current_month() -> tuple[int, str]:
+    today = datetime.date.today()
+    return today.year, MONTHS[today.month - 1]
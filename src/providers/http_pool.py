@@ -0,0 +1,60 @@
+import typing
+import urllib.parse
+
+import httpx
+
+
+DEFAULT_TIMEOUT = 10.0
+
+
+class HttpPool:
+    """One long living httpx client per host, shared by all providers.
+
+    Connections are kept alive between room starts, so only the first
+    request to a host pays for the TCP and TLS handshakes.
+    """
+
+    clients_: dict[str, httpx.AsyncClient]  # host to client mapping
+
+    def __init__(self, limits: httpx.Limits, http2: bool, default_timeout: float = DEFAULT_TIMEOUT):
+        self.limits_ = limits
+        self.http2_ = http2
+        self.default_timeout_ = default_timeout
+        self.clients_ = dict()
+        self.closed_ = False
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        if self.closed_:
+            raise RuntimeError("HTTP pool is already closed")
+
+        host = urllib.parse.urlsplit(url).netloc
+        client = self.clients_.get(host)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits_, http2=self.http2_, timeout=self.default_timeout_)
+            self.clients_[host] = client
+        return client
+
+    async def close(self) -> None:
+        """Can be called by every provider sharing the pool"""
+        if self.closed_:
+            return
+        self.closed_ = True
+        for client in self.clients_.values():
+            await client.aclose()
+        self.clients_.clear()
+
+
+def get_timeout(config: typing.Dict[str, str], provider_name: str) -> httpx.Timeout:
+    """Per provider timeout, e.g. CITY_HTTP_TIMEOUT, falling back to HTTP_TIMEOUT"""
+    value = config.get("{}_HTTP_TIMEOUT".format(provider_name.upper()), config.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT))
+    return httpx.Timeout(float(value))
+
+
+def get_pool(config: typing.Dict[str, str]) -> HttpPool:
+    limits = httpx.Limits(
+        max_connections=int(config.get("HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(config.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)),
+        keepalive_expiry=float(config.get("HTTP_KEEPALIVE_EXPIRY", 60.0)),
+    )
+    http2 = config.get("HTTP_HTTP2", "1").lower() not in ("0", "false", "no")
+    return HttpPool(limits, http2, float(config.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT)))
@@ -9,10 +9,22 @@ class ProviderParams(typing.TypedDict):
     exclude_names: list[str]
 
 
+# Providers streaming their entries yield pages of about this size
+PAGE_SIZE = 50
+
+
 class ProviderInterface(typing.Protocol):
     async def get_entries(self, params: ProviderParams) -> list[entry.ProviderEntry]:
         ...
 
+    async def iter_entries(self, params: ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        """Same entries as get_entries, page by page as soon as they are available"""
+        yield await self.get_entries(params)
+
+    async def close(self) -> None:
+        """Releases shared resources, may be called for every provider"""
+        pass
+
 
 class ProviderKind(enum.StrEnum):
     # DUMMY = "dummy"
@@ -21,3 +33,10 @@ class ProviderKind(enum.StrEnum):
     COUNTRY = "Страны"
     CITY = "Города"
     CUSTOM = "Свой список"
+
+
+async def collect_entries(pages: typing.AsyncIterator[list[entry.ProviderEntry]]) -> list[entry.ProviderEntry]:
+    result: list[entry.ProviderEntry] = []
+    async for page in pages:
+        result += page
+    return result
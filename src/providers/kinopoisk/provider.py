@@ -1,45 +1,122 @@
+import asyncio
+import logging
 import typing
 
 import httpx
 
 from models import entry
+from providers import filters
+from providers import http_pool
 from providers import interface as providers
+from utils import ratelimit
+
+
+KINOPOISK_URL = 'https://kinopoiskapiunofficial.tech'
+# Every film costs a request, so pages are small to let voting start early
+PAGE_SIZE = 10
 
 
 class KinopoiskProvider(providers.ProviderInterface):
-    def __init__(self, token: str):
+    def __init__(self, token: str, http: http_pool.HttpPool, timeout: httpx.Timeout,
+                 concurrency: int = 5, requests_per_second: float = 20):
         self.token = token
+        self.http = http
+        self.timeout = timeout
+        # Film details are requested in parallel but within the API quota
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.limiter = ratelimit.TokenBucket(requests_per_second)
 
     async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
         headers = {
             'x-api-key': self.token,
         }
 
-        async with httpx.AsyncClient() as client:
-            r = await client.get('https://kinopoiskapiunofficial.tech/api/v2.2/films/premieres?year=2024&month=JANUARY', headers=headers)
-            data = r.json()
-            
-            result: list[entry.ProviderEntry] = []
-            for item in data["items"]:
-                premiere_r = await client.get(f'https://kinopoiskapiunofficial.tech/api/v2.2/films/{item["kinopoiskId"]}', headers=headers)
-                premiere_data = premiere_r.json()
-                descr: str = f'Рейтинг: {premiere_data.get("ratingKinopoisk", "Отсутствует")}\n' \
-                             + f'Год: {premiere_data.get("year", "Неизвестен")}\n' \
-                             + f'Жанры: {", ".join([d["genre"] for d in premiere_data.get("genres", [{"genre": "Отсутствует"}])])}\n' \
-                             + premiere_data.get("webUrl", None)
-                
-                result.append(
-                    entry.ProviderEntry(
-                        name=item["nameRu"],
-                        descr=descr,
-                        rating=None,
-                        price=None,
-                        picture_url=None,
-                    )
-                )
-
-            return result
-
-
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
-    return KinopoiskProvider(config["KINOPOISK_TOKEN"])
+        client = self.http.client(KINOPOISK_URL)
+        path, query = self._query(typing.cast(filters.KinopoiskFilters, params["filters"]))
+        async with self.limiter:
+            r = await client.get(f'{KINOPOISK_URL}{path}', params=query, headers=headers, timeout=self.timeout)
+        r.raise_for_status()
+        items = r.json()["items"]
+
+        # Films are given away in the order their details arrive
+        tasks = [asyncio.ensure_future(self._get_entry(client, headers, item)) for item in items]
+        failed = 0
+        try:
+            page: list[entry.ProviderEntry] = []
+            for next_entry in asyncio.as_completed(tasks):
+                premiere_entry, has_details = await next_entry
+                failed += not has_details
+                page.append(premiere_entry)
+                if len(page) == PAGE_SIZE:
+                    yield page
+                    page = []
+            if page:
+                yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if failed:
+            logging.warning("kinopoisk: details are missing for %d of %d films", failed, len(items))
+
+    def _query(self, room_filters: filters.KinopoiskFilters) -> typing.Tuple[str, dict[str, int | str]]:
+        year, month = filters.current_month()
+        year = room_filters.get("year", year)
+        if "genre" in room_filters or "page" in room_filters:
+            query: dict[str, int | str] = {"yearFrom": year, "yearTo": year, "order": "NUM_VOTE", "type": "FILM",
+                                           "page": room_filters.get("page", 1)}
+            if "genre" in room_filters:
+                query["genres"] = room_filters["genre"]
+            return '/api/v2.2/films', query
+        return '/api/v2.2/films/premieres', {"year": year, "month": room_filters.get("month", month)}
+
+    async def _get_entry(self, client: httpx.AsyncClient, headers: dict[str, str], item: dict) -> typing.Tuple[entry.ProviderEntry, bool]:
+        try:
+            premiere_data = await self._get_details(client, headers, item)
+            has_details = True
+        except Exception as e:
+            # The premieres list itself has enough for a usable option
+            logging.warning("kinopoisk: no details for film %s: %r", item.get("kinopoiskId"), e)
+            premiere_data = item
+            has_details = False
+
+        premiere_entry = entry.ProviderEntry(
+            # Films found by genre may have no russian name
+            name=item.get("nameRu") or item.get("nameOriginal") or str(item["kinopoiskId"]),
+            descr=self._describe(premiere_data),
+            rating=None,
+            price=None,
+            # Previews are smaller, so Telegram downloads them faster
+            picture_url=premiere_data.get("posterUrlPreview") or premiere_data.get("posterUrl"),
+        )
+        return premiere_entry, has_details
+
+    async def _get_details(self, client: httpx.AsyncClient, headers: dict[str, str], item: dict) -> dict:
+        async with self.concurrency, self.limiter:
+            premiere_r = await client.get(f'{KINOPOISK_URL}/api/v2.2/films/{item["kinopoiskId"]}', headers=headers, timeout=self.timeout)
+        premiere_r.raise_for_status()
+        return premiere_r.json()
+
+    def _describe(self, premiere_data: dict) -> str:
+        descr: str = f'Рейтинг: {premiere_data.get("ratingKinopoisk", "Отсутствует")}\n' \
+                     + f'Год: {premiere_data.get("year", "Неизвестен")}\n' \
+                     + f'Жанры: {", ".join([d["genre"] for d in premiere_data.get("genres", [{"genre": "Отсутствует"}])])}'
+        if premiere_data.get("webUrl"):
+            descr += '\n' + premiere_data["webUrl"]
+        return descr
+
+    async def close(self) -> None:
+        await self.http.close()
+
+
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
+    return KinopoiskProvider(
+        config["KINOPOISK_TOKEN"],
+        http,
+        http_pool.get_timeout(config, "kinopoisk"),
+        concurrency=int(config.get("KINOPOISK_CONCURRENCY", 5)),
+        requests_per_second=float(config.get("KINOPOISK_RPS", 20)),
+    )
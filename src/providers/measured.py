@@ -0,0 +1,39 @@
+import time
+import typing
+
+from models import entry
+from utils import metrics
+from . import interface
+
+
+class MeasuredProvider(interface.ProviderInterface):
+    """Reports latency and failures of the wrapped provider to metrics"""
+
+    def __init__(self, name: str, provider: interface.ProviderInterface):
+        self.provider_ = provider
+        self.latency_ = metrics.PROVIDER_LATENCY.labels(name)
+        self.errors_ = metrics.PROVIDER_ERRORS.labels(name)
+
+    async def get_entries(self, params: interface.ProviderParams) -> list[entry.ProviderEntry]:
+        started = time.perf_counter()
+        try:
+            return await self.provider_.get_entries(params)
+        except Exception:
+            self.errors_.inc()
+            raise
+        finally:
+            self.latency_.observe(time.perf_counter() - started)
+
+    async def iter_entries(self, params: interface.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        # Until the last page, a caller stopping early is not observed
+        started = time.perf_counter()
+        try:
+            async for page in self.provider_.iter_entries(params):
+                yield page
+        except Exception:
+            self.errors_.inc()
+            raise
+        self.latency_.observe(time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self.provider_.close()
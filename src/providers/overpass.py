@@ -0,0 +1,28 @@
+import typing
+
+import httpx
+
+from . import interface
+
+
+async def iter_csv_rows(client: httpx.AsyncClient, url: str, query: str, timeout: httpx.Timeout,
+                        skip_header: bool = False) -> typing.AsyncIterator[list[list[str]]]:
+    """Streams rows of an `[out:csv(...)]` query in pages of interface.PAGE_SIZE rows"""
+    async with client.stream('POST', url, data={'data': query}, timeout=timeout) as r:
+        r.raise_for_status()
+
+        page: list[list[str]] = []
+        async for line in r.aiter_lines():
+            if skip_header:
+                skip_header = False
+                continue
+            if not line:
+                continue
+
+            page.append(line.split('\t'))
+            if len(page) == interface.PAGE_SIZE:
+                yield page
+                page = []
+
+        if page:
+            yield page
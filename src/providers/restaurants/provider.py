@@ -3,34 +3,51 @@ import typing
 import httpx
 
 from models import entry
+from providers import filters
+from providers import http_pool
 from providers import interface as providers
+from providers import overpass
 
 
 class RestaurantsProvider(providers.ProviderInterface):
-    def __init__(self, overpass_url: str):
+    def __init__(self, overpass_url: str, http: http_pool.HttpPool, timeout: httpx.Timeout):
         self.overpass_url = overpass_url
-        self.query_template = "[out:json];area[name='{city}']->.searchArea;node[amenity={amenity_type}](area.searchArea);out {limit};"
+        self.http = http
+        self.timeout = timeout
         self.ref_template = "https://yandex.com/maps?whatshere[point]={lng},{lat}"
 
+    def _query(self, room_filters: filters.RestaurantsFilters) -> str:
+        # Overpass selects and limits nodes itself, only what the room uses is downloaded
+        amenity = room_filters.get("amenity", "restaurant")
+        if "bbox" in room_filters:
+            nodes = "node[amenity={}]({})".format(amenity, room_filters["bbox"])
+        else:
+            nodes = "area[name='{}']->.searchArea;node[amenity={}](area.searchArea)".format(
+                room_filters.get("area", "Москва"), amenity)
+        return "[out:csv(name, ::lat, ::lon; false)];{};out {};".format(nodes, room_filters.get("limit", 20))
+
     async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
-        # TODO: remove hardcoded values
-        query: str = self.query_template.format(city='Москва', amenity_type='restaurant', limit=20)
+        return await providers.collect_entries(self.iter_entries(params))
 
-        async with httpx.AsyncClient() as client:
-            r = await client.get(self.overpass_url, params={'data': query})
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        query = self._query(typing.cast(filters.RestaurantsFilters, params["filters"]))
 
-            data = r.json()
-            return [
+        client = self.http.client(self.overpass_url)
+        async for rows in overpass.iter_csv_rows(client, self.overpass_url, query, self.timeout):
+            yield [
                 entry.ProviderEntry(
-                    name=element['tags']['name'],
-                    descr=f"На карте: {self.ref_template.format(lat=element['lat'], lng=element['lon'])}",
+                    name=name,
+                    descr=f"На карте: {self.ref_template.format(lat=lat, lng=lon)}",
                     rating=None,
                     price=None,
                     picture_url=None,
                 )
-                for element in data['elements'] if 'tags' in element and 'name' in element['tags']
+                for name, lat, lon in rows if len(name) > 0
             ]
 
+    async def close(self) -> None:
+        await self.http.close()
+
 
-async def get_provider(config: typing.Dict[str, str]) -> providers.ProviderInterface:
-    return RestaurantsProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter")
+async def get_provider(config: typing.Dict[str, str], http: http_pool.HttpPool) -> providers.ProviderInterface:
+    return RestaurantsProvider("https://maps.mail.ru/osm/tools/overpass/api/interpreter", http, http_pool.get_timeout(config, "restaurants"))
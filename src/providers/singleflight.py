@@ -0,0 +1,98 @@
+import asyncio
+import copy
+import typing
+
+from models import entry
+from utils import metrics
+from . import cache
+from . import interface
+
+
+class _Flight:
+    """Pages of one upstream request, kept for everyone reading them until it is over"""
+
+    def __init__(self):
+        self.pages: list[list[entry.ProviderEntry]] = []
+        self.done = False
+        self.error: typing.Optional[Exception] = None
+        self.changed = asyncio.Event()  # replaced after every change
+        self.readers = 0
+        self.task: typing.Optional[asyncio.Task] = None
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class CoalescingProvider(interface.ProviderInterface):
+    """Concurrent requests with the same params share one upstream request.
+
+    Every caller gets the pages as soon as they arrive, copied, so callers shuffling or changing
+    entries don't affect each other. The upstream request is cancelled once nobody reads it anymore.
+    Nothing is kept after it is over, keeping results is what CachingProvider does.
+    """
+
+    flights_: dict[str, _Flight]
+
+    def __init__(self, kind: interface.ProviderKind, provider: interface.ProviderInterface):
+        self.kind_ = kind
+        self.provider_ = provider
+        self.coalesced_ = metrics.PROVIDER_COALESCED.labels(kind.name.lower())
+        self.flights_ = dict()
+
+    async def get_entries(self, params: interface.ProviderParams) -> list[entry.ProviderEntry]:
+        return await interface.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: interface.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        key = cache.cache_key(self.kind_, params)
+        flight = self.flights_.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._fly(key, flight, params))
+            self.flights_[key] = flight
+        else:
+            self.coalesced_.inc()
+
+        flight.readers += 1
+        try:
+            read = 0
+            while True:
+                if read == len(flight.pages) and not flight.done:
+                    await flight.changed.wait()
+                    continue
+                while read < len(flight.pages):
+                    read += 1
+                    yield [copy.copy(e) for e in flight.pages[read - 1]]
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.done:
+                if self.flights_.get(key) is flight:
+                    del self.flights_[key]
+                flight.task.cancel()
+
+    async def _fly(self, key: str, flight: _Flight, params: interface.ProviderParams):
+        try:
+            async for page in self.provider_.iter_entries(params):
+                flight.pages.append(page)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        except asyncio.CancelledError:
+            # Readers must not take what they got so far for all entries
+            flight.error = RuntimeError("{} request is cancelled".format(self.kind_.name))
+            raise
+        finally:
+            # Requests coming after this point start a new flight
+            if self.flights_.get(key) is flight:
+                del self.flights_[key]
+            flight.done = True
+            flight.notify()
+
+    async def close(self) -> None:
+        for flight in list(self.flights_.values()):
+            flight.task.cancel()
+        await self.provider_.close()
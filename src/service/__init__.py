@@ -1,15 +1,27 @@
 import typing
 
-import redis.asyncio as redis
-
 import providers
+import shard
 from . import service
 from . import interface
+from . import storage
+from . import events
 
 
 async def get_service(config: typing.Dict[str, str]) -> interface.ServiceInterface:
-    # storage = redis.Redis(host=config["REDIS_HOST"], port=config["REDIS_PORT"], password=config["REDIS_PASSWORD"])
-    storage = None
+    st = await storage.get_storage(config)
+    if shard.get_role(config) == "worker":
+        st = await shard.get_worker_storage(config, st)
+    ev = await events.get_event_bus(config)
     p = await providers.get_providers(config)
-    s = service.Service(storage, p)
+    s = service.Service(
+        st, p, ev,
+        prefetch=config.get("PREFETCH_ENTRIES", "1").lower() not in ("0", "false", "no"),
+        prefetch_timeout=float(config.get("PREFETCH_TIMEOUT", 60)),
+        prefetch_ttl=float(config.get("PREFETCH_TTL", 30 * 60)),
+        match_ttl=float(config.get("ROOM_MATCH_TTL", 30 * 60)),
+        gc_interval=float(config.get("ROOM_GC_INTERVAL", 60)),
+        option_ordering=config.get("OPTION_ORDERING", "adaptive").lower(),
+    )
+    await s.start()
     return s
@@ -0,0 +1,12 @@
+import typing
+
+from . import interface
+from . import memory
+from . import redis_events
+
+
+async def get_event_bus(config: typing.Dict[str, str]) -> interface.EventBusInterface:
+    # Events have to cross process boundaries whenever rooms are shared through redis
+    if config.get("REDIS_HOST"):
+        return await redis_events.get_event_bus(config)
+    return await memory.get_event_bus(config)
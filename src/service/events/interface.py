@@ -0,0 +1,39 @@
+import enum
+import typing
+
+
+class RoomEventKind(enum.StrEnum):
+    JOIN = "join"
+    LEAVE = "leave"
+    START = "start"
+    MATCH = "match"
+    NO_MATCH = "no_match"  # every option is disliked by someone
+    EXPIRE = "expire"  # the room is removed, nobody is in it anymore
+
+
+class EventsLost(Exception):
+    """Raised to subscribers when events may have been missed, e.g. while reconnecting to redis.
+
+    They should look at the room again and subscribe anew.
+    """
+
+
+class RoomEvent(typing.TypedDict):
+    kind: RoomEventKind
+    room_id: int
+    user_id: typing.Optional[str]  # who joined/left/started, None for match, no_match and expire
+
+
+class EventBusInterface(typing.Protocol):
+    async def publish(self, event: RoomEvent) -> None:
+        ...
+
+    def subscribe(self, room_id: int) -> typing.AsyncContextManager[typing.AsyncIterator[RoomEvent]]:
+        """Events published after the context is entered are delivered, earlier ones are not.
+
+        Iteration raises EventsLost if some of them could not be delivered.
+        """
+        ...
+
+    async def close(self) -> None:
+        ...
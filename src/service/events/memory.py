@@ -0,0 +1,56 @@
+import asyncio
+import contextlib
+import typing
+
+from . import interface
+
+
+class MemoryEventBus(interface.EventBusInterface):
+    """Delivers room events to subscribers of this process only"""
+
+    subscribers_: dict[int, set[asyncio.Queue]]  # room_id to subscriber queues
+
+    def __init__(self):
+        self.subscribers_ = dict()
+
+    def has_subscribers(self, room_id: int) -> bool:
+        return room_id in self.subscribers_
+
+    async def publish(self, event: interface.RoomEvent) -> None:
+        self.publish_nowait(event)
+
+    def publish_nowait(self, event: interface.RoomEvent) -> None:
+        for queue in self.subscribers_.get(event["room_id"], ()):
+            queue.put_nowait(event)
+
+    def fail_all(self, error: Exception) -> None:
+        """Every current subscriber gets the error raised instead of the next event"""
+        for queues in self.subscribers_.values():
+            for queue in queues:
+                queue.put_nowait(error)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, room_id: int) -> typing.AsyncIterator[typing.AsyncIterator[interface.RoomEvent]]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self.subscribers_.setdefault(room_id, set()).add(queue)
+        try:
+            yield self._iterate(queue)
+        finally:
+            queues = self.subscribers_[room_id]
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers_[room_id]
+
+    async def _iterate(self, queue: asyncio.Queue) -> typing.AsyncIterator[interface.RoomEvent]:
+        while True:
+            event = await queue.get()
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    async def close(self) -> None:
+        pass
+
+
+async def get_event_bus(config: typing.Dict[str, str]) -> interface.EventBusInterface:
+    return MemoryEventBus()
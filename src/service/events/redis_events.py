@@ -0,0 +1,110 @@
+import asyncio
+import contextlib
+import json
+import logging
+import typing
+
+import redis.asyncio as redis
+
+from . import interface
+from . import memory
+
+
+# Seconds before subscribing again after the connection is lost, doubled on every failure
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30
+
+
+class RedisEventBus(interface.EventBusInterface):
+    """Room events go through redis pub/sub, so subscribers on every worker receive them.
+
+    Every worker keeps a single pattern subscription and fans messages out to
+    its local subscribers, so waiting users do not hold redis connections.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str = "quo"):
+        self.redis_ = client
+        self.prefix_ = prefix
+        self.local_ = memory.MemoryEventBus()
+        self.pubsub_ = None
+        self.reader_: typing.Optional[asyncio.Task] = None
+        self.reader_lock_ = asyncio.Lock()
+
+    def _channel(self, room_id: int) -> str:
+        return "{}:room:{}:events".format(self.prefix_, room_id)
+
+    async def publish(self, event: interface.RoomEvent) -> None:
+        await self.redis_.publish(self._channel(event["room_id"]), json.dumps(event))
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, room_id: int) -> typing.AsyncIterator[typing.AsyncIterator[interface.RoomEvent]]:
+        await self._ensure_reader()
+        async with self.local_.subscribe(room_id) as events:
+            yield events
+
+    async def _ensure_reader(self):
+        async with self.reader_lock_:
+            if self.reader_ is not None and not self.reader_.done():
+                return
+            # Subscription is confirmed before returning, so no event published after this point is lost
+            await self._subscribe()
+            self.reader_ = asyncio.create_task(self._read())
+
+    async def _subscribe(self):
+        pubsub = self.redis_.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.psubscribe(self._channel("*"))
+        except BaseException:
+            await pubsub.aclose()
+            raise
+        self.pubsub_ = pubsub
+
+    async def _read(self):
+        # Runs until the bus is closed, a broken subscription is restored with backoff
+        attempt = 0
+        while True:
+            try:
+                if self.pubsub_ is None:
+                    await self._subscribe()
+                    # Whatever was published in between is lost, subscribers look at their rooms again
+                    self.local_.fail_all(interface.EventsLost())
+                    logging.info("room events are subscribed to again")
+                attempt = 0
+                await self._dispatch()
+            except Exception:
+                logging.warning("room events subscription is broken, attempt %d", attempt + 1, exc_info=True)
+
+            if self.pubsub_ is not None:
+                with contextlib.suppress(Exception):
+                    await self.pubsub_.aclose()
+                self.pubsub_ = None
+            await asyncio.sleep(min(RECONNECT_DELAY * 2 ** attempt, MAX_RECONNECT_DELAY))
+            attempt += 1
+
+    async def _dispatch(self):
+        async for message in self.pubsub_.listen():
+            if message["type"] != "pmessage":
+                continue
+            try:
+                event = json.loads(message["data"])
+                event["kind"] = interface.RoomEventKind(event["kind"])
+            except (ValueError, KeyError):
+                logging.exception("bad room event: %r", message["data"])
+                continue
+            self.local_.publish_nowait(event)
+
+    async def close(self) -> None:
+        if self.reader_ is not None:
+            self.reader_.cancel()
+        if self.pubsub_ is not None:
+            await self.pubsub_.aclose()
+        await self.redis_.aclose()
+
+
+async def get_event_bus(config: typing.Dict[str, str]) -> interface.EventBusInterface:
+    client = redis.Redis(
+        host=config["REDIS_HOST"],
+        port=int(config.get("REDIS_PORT", 6379)),
+        password=config.get("REDIS_PASSWORD"),
+    )
+    return RedisEventBus(client, config.get("REDIS_PREFIX", "quo"))
@@ -1,8 +1,31 @@
+import enum
 import typing
 
 from models import room
 from models import entry
 
+from .events import interface as events
+from .storage import interface as storage
+
+
+class VoteOutcome(enum.StrEnum):
+    VOTED = "voted"
+    MATCH = "match"  # this vote made the match
+    NO_MATCH = "no_match"  # this vote killed the last option which could match
+    IGNORED = "ignored"  # the option was voted for already or the room has its match, nothing changed
+
+
+class VoteCard(typing.TypedDict):
+    option: typing.Optional[entry.ProviderEntry]  # to vote for, None once the user has voted for every live one
+    option_index: typing.Optional[int]  # identifies the option for vote_and_next
+    match: typing.Optional[entry.ProviderEntry]
+    participants: list[str]
+    upcoming: list[entry.ProviderEntry]  # likely shown after option, e.g. to prepare their pictures
+
+
+class VoteResult(VoteCard):
+    outcome: VoteOutcome
+
 
 class ServiceInterface(typing.Protocol):
     async def create_room(self, user_id: str, params: room.RoomParams) -> int:
@@ -16,7 +39,8 @@ class ServiceInterface(typing.Protocol):
     async def leave_room(self, user_id: str) -> None:
         ...
 
-    async def current_option(self, user_id: str) -> typing.Tuple[entry.ProviderEntry, typing.Optional[entry.ProviderEntry]]:
+    async def current_option(self, user_id: str) -> typing.Tuple[typing.Optional[entry.ProviderEntry], typing.Optional[entry.ProviderEntry]]:
+        """Option to vote for, None once the user has voted for every live one, and the match"""
         ...
 
     async def reset_match(self, user_id: str):
@@ -25,11 +49,30 @@ class ServiceInterface(typing.Protocol):
     async def get_match(self, user_id: str) -> typing.Optional[entry.ProviderEntry]:
         ...
 
+    async def get_room_params(self, user_id: str) -> room.RoomParams:
+        ...
+
+    async def set_filters(self, user_id: str, filters: typing.Mapping[str, typing.Any]) -> dict[str, int | str]:
+        """Replaces filters of the room, only its owner can call this before the vote.
+
+        Raises providers.filters.FilterError for unknown filters and bad values.
+        """
+        ...
+
     async def add_entry(self, user_id: str, entry: entry.ProviderEntry) -> None:
         """Will add custom entry"""
         ...
 
     async def wait_start(self, user_id: str) -> None:
+        """Returns as soon as the owner starts voting in the user's room"""
+        ...
+
+    async def wait_end(self, user_id: str) -> None:
+        """Returns as soon as the user's room gets a match, runs out of options or the user leaves it"""
+        ...
+
+    def room_events(self, user_id: str) -> typing.AsyncContextManager[typing.AsyncIterator[events.RoomEvent]]:
+        """Join/leave/start/match events of the user's room, published after the context is entered"""
         ...
 
     async def start_vote(self, user_id: str) -> None:
@@ -39,5 +82,30 @@ class ServiceInterface(typing.Protocol):
     async def get_room_participants(self, user_id: str) -> list[str]:
         ...
 
-    async def vote(self, user_id: str, is_liked: bool):
+    async def vote(self, user_id: str, is_liked: bool) -> VoteOutcome:
+        """Votes for the current option, which is disliked unless is_liked"""
+        ...
+
+    async def current_card(self, user_id: str) -> VoteCard:
+        """Everything a voting user is shown, in one call"""
+        ...
+
+    async def vote_and_next(self, user_id: str, is_liked: bool, option_index: int) -> VoteResult:
+        """Votes for option_index and returns what to show next in one call.
+
+        The vote is ignored unless option_index is still the current option of the user and the room
+        has no match yet, so a repeated tap or an old message can't vote for another option.
+        """
+        ...
+
+    async def stats(self) -> storage.StorageStats:
+        """Live rooms and users, and how much expired rooms took"""
+        ...
+
+    async def start(self) -> None:
+        """Reports room metrics and starts removing expired rooms, called once the service is built"""
+        ...
+
+    async def close(self) -> None:
+        """Releases storage, event bus and provider connections on shutdown"""
         ...
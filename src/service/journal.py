@@ -0,0 +1,302 @@
+import enum
+import itertools
+import logging
+import typing
+
+from models import entry
+from models import room
+
+from . import ordering
+
+# Every change of a room is an event. Applying the same events to the same room
+# always gives the same result, so a room can be stored as a snapshot plus
+# the events which happened after it.
+
+
+class EventKind(enum.IntEnum):
+    JOIN = 1
+    LEAVE = 2
+    ADD_ENTRY = 3
+    START = 4
+    APPEND_OPTIONS = 5
+    VOTE = 6
+    RESET_MATCH = 7
+    SKIP = 8
+    SET_FILTERS = 9
+
+
+class Event(typing.NamedTuple):
+    kind: EventKind
+    user_id: typing.Optional[str] = None
+    liked: bool = False
+    entries: typing.Optional[list[entry.ProviderEntry]] = None
+    seeds: typing.Optional[dict[str, int]] = None  # participant order seeds for START
+    option: typing.Optional[int] = None  # next option of the voter in adaptive rooms, chosen before VOTE or SKIP is recorded
+    filters: typing.Optional[dict[str, int | str]] = None  # validated room filters for SET_FILTERS
+
+
+def join(user_id: str) -> Event:
+    return Event(EventKind.JOIN, user_id=user_id)
+
+
+def leave(user_id: str) -> Event:
+    return Event(EventKind.LEAVE, user_id=user_id)
+
+
+def add_entry(new_entry: entry.ProviderEntry) -> Event:
+    return Event(EventKind.ADD_ENTRY, entries=[new_entry])
+
+
+def start(options: list[entry.ProviderEntry], participants: typing.Iterable[str]) -> Event:
+    return Event(EventKind.START, entries=options, seeds={id: ordering.new_seed() for id in participants})
+
+
+def append_options(options: list[entry.ProviderEntry]) -> Event:
+    return Event(EventKind.APPEND_OPTIONS, entries=options)
+
+
+def vote(room_data: room.RoomData, user_id: str, is_liked: bool) -> Event:
+    return Event(EventKind.VOTE, user_id=user_id, liked=is_liked, option=_next_option(room_data, user_id))
+
+
+def skip(room_data: room.RoomData, user_id: str) -> Event:
+    """Moves the user past their current option, which somebody has disliked before it was shown"""
+    return Event(EventKind.SKIP, user_id=user_id, option=_next_option(room_data, user_id))
+
+
+def set_filters(filters: dict[str, int | str]) -> Event:
+    return Event(EventKind.SET_FILTERS, filters=filters)
+
+
+def reset_match() -> Event:
+    return Event(EventKind.RESET_MATCH)
+
+
+def apply(room_data: room.RoomData, event: Event):
+    """Changes room in place. Events are checked before they are recorded, so this never fails"""
+    if event.kind == EventKind.JOIN:
+        _add_user_to_room(room_data, event.user_id)
+    elif event.kind == EventKind.LEAVE:
+        _remove_user_from_room(room_data, event.user_id)
+    elif event.kind == EventKind.ADD_ENTRY:
+        room_data.options += event.entries
+    elif event.kind == EventKind.START:
+        room_data.options += event.entries
+        room_data.options_likes = [0] * len(room_data.options)
+        room_data.options_dislikes = [0] * len(room_data.options)
+        room_data.vote_started = True
+        room_data.participants_seeds = dict(event.seeds)
+        if room_data.ordering == ordering.ADAPTIVE:
+            # Nothing is liked yet, everyone starts exploring from the same option
+            room_data.participants_options = {user_id: 0 for user_id in event.seeds}
+        else:
+            for user_id in event.seeds:
+                room_data.participants_positions[user_id] = _seek(room_data, user_id, 0)
+    elif event.kind == EventKind.APPEND_OPTIONS:
+        _append_options(room_data, event.entries)
+    elif event.kind == EventKind.VOTE:
+        _vote_option(room_data, event.user_id, event.liked)
+        _advance_unvoted(room_data)
+        _progress_user(room_data, event.user_id, event.option)
+    elif event.kind == EventKind.SKIP:
+        _progress_user(room_data, event.user_id, event.option)
+    elif event.kind == EventKind.RESET_MATCH:
+        room_data.match = None
+    elif event.kind == EventKind.SET_FILTERS:
+        room_data.params = room.RoomParams(room_data.params.provider_name, dict(event.filters))
+
+
+def current_option_index(room_data: room.RoomData, user_id: str) -> typing.Optional[int]:
+    """None once the user has voted for every option which can still match"""
+    if room_data.ordering == ordering.ADAPTIVE:
+        return room_data.participants_options[user_id]
+    # Positions always point at an option or past the end of the order
+    position = room_data.participants_positions[user_id]
+    if position >= ordering.positions_count(len(room_data.options)):
+        return None
+    return ordering.option_at(room_data.participants_seeds[user_id], position)
+
+
+def current_option_dead(room_data: room.RoomData, user_id: str) -> bool:
+    option_index = current_option_index(room_data, user_id)
+    return option_index is not None and bool(room_data.options_dislikes[option_index] & room_data.participants_mask)
+
+
+def upcoming_option_indexes(room_data: room.RoomData, user_id: str, count: int) -> list[int]:
+    """Up to count options the user will likely vote for after the current one"""
+    current = current_option_index(room_data, user_id)
+    if current is None or room_data.match is not None:
+        return []
+    likes, dislikes = room_data.options_likes, room_data.options_dislikes
+    participant = 1 << room_data.participants_indexes[user_id]
+    everyone = room_data.participants_mask
+    if room_data.ordering == ordering.ADAPTIVE:
+        return ordering.likely_next(likes, dislikes, participant, everyone, current, count, room_data.options_unvoted)
+
+    seed, options_count = room_data.participants_seeds[user_id], len(room_data.options)
+    upcoming = (ordering.option_at(seed, position)
+                for position in range(room_data.participants_positions[user_id] + 1, ordering.positions_count(options_count)))
+    return list(itertools.islice(
+        (i for i in upcoming if i < options_count and ordering.is_open(likes[i], dislikes[i], participant, everyone)),
+        count))
+
+
+def match_possible(room_data: room.RoomData) -> bool:
+    """False once every option is disliked by someone still in the room"""
+    return room_data.match is not None or room_data.options_dead < len(room_data.options)
+
+
+def _vote_option(room_data: room.RoomData, user_id: str, is_liked: bool):
+    option_index = current_option_index(room_data, user_id)
+    participant = 1 << room_data.participants_indexes[user_id]
+    # Likes and dislikes of those who left are still set but are masked out
+    everyone = room_data.participants_mask
+
+    if not is_liked:
+        room_data.options_likes[option_index] &= ~participant
+        dislikes = room_data.options_dislikes[option_index]
+        if not dislikes & everyone:
+            room_data.options_dead += 1
+        room_data.options_dislikes[option_index] = dislikes | participant
+        return
+
+    likes = room_data.options_likes[option_index] | participant
+    room_data.options_likes[option_index] = likes
+    if room_data.options_dislikes[option_index] & participant:
+        room_data.options_dislikes[option_index] &= ~participant
+        if not room_data.options_dislikes[option_index] & everyone:
+            room_data.options_dead -= 1
+
+    if likes & everyone == everyone and room_data.match is None:
+        option = room_data.options[option_index]
+        logging.info("match: " + option.name)
+        room_data.match = option
+
+
+def _next_option(room_data: room.RoomData, user_id: str) -> typing.Optional[int]:
+    # Adaptive choice looks at every option, it is made once before the event is recorded instead of on every replay
+    if room_data.ordering != ordering.ADAPTIVE:
+        return None
+    return ordering.choose_option(
+        room_data.participants_seeds[user_id],
+        room_data.participants_positions[user_id],
+        room_data.options_likes,
+        room_data.options_dislikes,
+        1 << room_data.participants_indexes[user_id],
+        room_data.participants_mask,
+        room_data.participants_options[user_id],
+        room_data.options_unvoted,
+    )
+
+
+def _advance_unvoted(room_data: room.RoomData):
+    # Votes of those still in the room only add up, so the first unvoted option only moves forward
+    # and every option is passed once, until someone leaves
+    likes, dislikes = room_data.options_likes, room_data.options_dislikes
+    everyone = room_data.participants_mask
+    i = room_data.options_unvoted
+    while i < len(likes) and (likes[i] | dislikes[i]) & everyone:
+        i += 1
+    room_data.options_unvoted = i
+
+
+def _progress_user(room_data: room.RoomData, user_id: str, option: typing.Optional[int]):
+    if room_data.ordering == ordering.ADAPTIVE:
+        room_data.participants_positions[user_id] += 1
+        room_data.participants_options[user_id] = option
+        return
+
+    position = _seek(room_data, user_id, room_data.participants_positions[user_id] + 1)
+    if position >= ordering.positions_count(len(room_data.options)):
+        # Options appended to a chunk the user has already passed are voted for last
+        position = _seek(room_data, user_id, 0)
+    room_data.participants_positions[user_id] = position
+
+
+def _seek(room_data: room.RoomData, user_id: str, position: int) -> int:
+    """First position from the given one with an option the user still has to vote for"""
+    participant = 1 << room_data.participants_indexes[user_id]
+    everyone = room_data.participants_mask
+    seed = room_data.participants_seeds[user_id]
+    options_count = len(room_data.options)
+    end = ordering.positions_count(options_count)
+
+    # Options someone has disliked are skipped, each participant votes for the rest once
+    while position < end:
+        i = ordering.option_at(seed, position)
+        if i < options_count and ordering.is_open(room_data.options_likes[i], room_data.options_dislikes[i],
+                                                  participant, everyone):
+            break
+        position += 1
+    return position
+
+
+def _append_options(room_data: room.RoomData, options: list[entry.ProviderEntry]):
+    first = len(room_data.options)
+    done = [user_id for user_id in room_data.participants if current_option_index(room_data, user_id) is None]
+    room_data.options += options
+    room_data.options_likes += [0] * len(options)
+    room_data.options_dislikes += [0] * len(options)
+
+    # Those who voted for everything get the new options, the others get them on the way
+    # or, for options appended to a chunk they have passed, once they reach the end
+    if room_data.ordering == ordering.ADAPTIVE:
+        for user_id in done:
+            room_data.participants_options[user_id] = first
+    else:
+        for user_id in done:
+            _rewind_user(room_data, user_id)
+
+
+def _add_user_to_room(room_data: room.RoomData, user_id: str):
+    room_data.participants.add(user_id)
+    room_data.participants_positions[user_id] = 0
+
+    index = room_data.next_participant_index
+    room_data.next_participant_index += 1
+    room_data.participants_indexes[user_id] = index
+    room_data.participants_mask |= 1 << index
+
+
+def _remove_user_from_room(room_data: room.RoomData, user_id: str):
+    room_data.participants.remove(user_id)
+    del room_data.participants_positions[user_id]
+    room_data.participants_seeds.pop(user_id, None)
+    room_data.participants_options.pop(user_id, None)
+
+    index = room_data.participants_indexes.pop(user_id)
+    room_data.participants_mask &= ~(1 << index)
+
+    # Options only they disliked can match again, those who voted for everything else get them
+    if room_data.vote_started:
+        everyone = room_data.participants_mask
+        dead = sum(1 for dislikes in room_data.options_dislikes if dislikes & everyone)
+        # Options only they voted for are unvoted again
+        room_data.options_unvoted = 0
+        _advance_unvoted(room_data)
+        if dead < room_data.options_dead:
+            for user_id in room_data.participants:
+                if current_option_index(room_data, user_id) is None:
+                    _rewind_user(room_data, user_id)
+        room_data.options_dead = dead
+
+        # The others may all like an option they did not
+        if room_data.match is None and everyone:
+            option_index = next((i for i, likes in enumerate(room_data.options_likes) if likes & everyone == everyone),
+                                None)
+            if option_index is not None:
+                option = room_data.options[option_index]
+                logging.info("match: " + option.name)
+                room_data.match = option
+
+
+def _rewind_user(room_data: room.RoomData, user_id: str):
+    participant = 1 << room_data.participants_indexes[user_id]
+    everyone = room_data.participants_mask
+    if room_data.ordering == ordering.ADAPTIVE:
+        room_data.participants_options[user_id] = next((
+            i for i, (likes, dislikes) in enumerate(zip(room_data.options_likes, room_data.options_dislikes))
+            if ordering.is_open(likes, dislikes, participant, everyone)
+        ), None)
+    else:
+        room_data.participants_positions[user_id] = _seek(room_data, user_id, 0)
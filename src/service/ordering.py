@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import random
+import typing
+
+# Options are shown chunk by chunk, only the order inside of a chunk differs between participants
+CHUNK_SIZE = 10
+
+# Orderings a room can use, see models.room.RoomData.ordering
+SHUFFLED = "shuffled"  # fixed order computed from the seed
+ADAPTIVE = "adaptive"  # options most liked by others first
+ORDERINGS = (SHUFFLED, ADAPTIVE)
+
+# Share of adaptive picks that go to options nobody has voted for yet
+EXPLORATION = 0.05
+
+
+def new_seed() -> int:
+    return random.getrandbits(32)
+
+
+def option_at(seed: int, position: int) -> int:
+    """Index of the option shown at position of the order given by seed.
+
+    Computed on demand in O(CHUNK_SIZE), nothing has to be materialized or stored
+    besides seed and position, and the same seed always gives the same order.
+    Every chunk is a permutation of CHUNK_SIZE indexes whatever the number of options,
+    so appended options never reorder a chunk: while the last chunk is not full yet,
+    some of its positions point past the last option and are skipped.
+    """
+    chunk = position // CHUNK_SIZE
+    permutation = list(range(CHUNK_SIZE))
+    random.Random((seed << 32) | chunk).shuffle(permutation)
+    return chunk * CHUNK_SIZE + permutation[position % CHUNK_SIZE]
+
+
+def positions_count(options_count: int) -> int:
+    """Positions of an order of options_count options, the last chunk counts as a full one"""
+    return -(-options_count // CHUNK_SIZE) * CHUNK_SIZE
+
+
+def is_open(likes: int, dislikes: int, participant: int, everyone: int) -> bool:
+    """Whether the participant still has to vote for an option: they did not and nobody killed it with a dislike"""
+    return not (likes | dislikes) & participant and not dislikes & everyone
+
+
+def _first_unvoted(likes: typing.Sequence[int], dislikes: typing.Sequence[int],
+                   everyone: int, current: int, unvoted: int) -> typing.Optional[int]:
+    # Everyone explores the same options, so they get votes from all participants soon
+    for i in range(unvoted, len(likes)):
+        if i != current and not (likes[i] | dislikes[i]) & everyone:
+            return i
+    return None
+
+
+def _most_liked(likes: typing.Sequence[int], dislikes: typing.Sequence[int],
+                participant: int, everyone: int, current: int) -> typing.Optional[int]:
+    best, best_likes = None, 0
+    # Most options are not liked by anyone, they are skipped without a python level loop
+    for i in itertools.compress(range(len(likes)), likes):
+        if i != current and is_open(likes[i], dislikes[i], participant, everyone):
+            option_likes = (likes[i] & everyone).bit_count()
+            if option_likes > best_likes:
+                best, best_likes = i, option_likes
+    return best
+
+
+def choose_option(seed: int, position: int, likes: typing.Sequence[int], dislikes: typing.Sequence[int],
+                  participant: int, everyone: int, current: int, unvoted: int = 0) -> typing.Optional[int]:
+    """Next option of an adaptive order, None if the participant has voted for every live option.
+
+    likes and dislikes are bitmasks of participants per option, participant is the bit of the one
+    choosing and everyone the bits of those still in the room. The current option is skipped.
+    Every option before unvoted has a vote of someone in the room, the search for unvoted ones starts there.
+    Usually that is the open option liked by most of the others, an EXPLORATION share of picks
+    (and all of them while nothing is liked) goes to the first option nobody has voted for.
+    An open option somebody has voted for is liked by them, so there is nothing else to choose from.
+    """
+    if random.Random((seed << 32) | position).random() >= EXPLORATION:
+        best = _most_liked(likes, dislikes, participant, everyone, current)
+        if best is not None:
+            return best
+        return _first_unvoted(likes, dislikes, everyone, current, unvoted)
+
+    unvoted = _first_unvoted(likes, dislikes, everyone, current, unvoted)
+    if unvoted is not None:
+        return unvoted
+    return _most_liked(likes, dislikes, participant, everyone, current)
+
+
+def likely_next(likes: typing.Sequence[int], dislikes: typing.Sequence[int],
+                participant: int, everyone: int, current: int, count: int, unvoted: int = 0) -> list[int]:
+    """Up to count options choose_option is likely to pick after the current one, to prepare them in advance"""
+    liked = heapq.nlargest(
+        count,
+        (i for i in itertools.compress(range(len(likes)), likes)
+         if i != current and is_open(likes[i], dislikes[i], participant, everyone)),
+        key=lambda i: (likes[i] & everyone).bit_count(),
+    )
+    upcoming = (i for i in range(unvoted, len(likes)) if i != current and not (likes[i] | dislikes[i]) & everyone)
+    return liked + list(itertools.islice(upcoming, count - len(liked)))
@@ -1,249 +1,543 @@
 import asyncio
-import copy
-import json
-import itertools
-from logging import log
+import contextlib
 import logging
 import random
 import typing
 
-import redis.asyncio as redis
-
+from providers import filters as provider_filters
 from providers import interface as providers
 from models import entry
 from models import room
+from utils import metrics
 
 from . import interface
+from . import journal
+from . import ordering
+from .events import interface as events
+from .events import memory as memory_events
+from .storage import interface as storage
 
 
-class RoomData(typing.TypedDict):
-    owner: str
-
-    params: room.RoomParams
-
-    participants: set[str]
-    participants_positions: dict[str, int]  # sizeof == sizeof participants
-
-    options: list[entry.ProviderEntry]
-    options_likes: dict[int, set[str]]  # sizeof == sizeof options
-    options_orders: dict[str, list[int]]  # for every key: sizeof value == sizeof options
-
-    match: typing.Optional[entry.ProviderEntry]
-    vote_started: bool
+# Options in a vote card after the current one, the bot uploads their pictures in advance
+UPCOMING_OPTIONS = 3
+# Seconds before a page which lost every compare-and-set attempt is appended again
+APPEND_RETRY_INTERVAL = 0.5
 
 
-EMPTY_ROOM = {
-    "owner": None,
-    "match": None,
+class _Prefetch:
+    """Pages fetched for a room before it starts, start reads them as they arrive"""
 
-    "params": None,
+    def __init__(self, filters: dict):
+        self.filters = filters
+        self.pages: list[list[entry.ProviderEntry]] = []
+        self.done = False
+        self.error: typing.Optional[BaseException] = None
+        self.changed = asyncio.Event()  # replaced after every change
+        self.task: typing.Optional[asyncio.Task] = None
+        self.timer: typing.Optional[asyncio.TimerHandle] = None  # drops the pages of a room which is never started
 
-    "participants": set(),
-    "participants_positions": {},
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
 
-    "options": [],
-    "options_likes": {},
-    "options_orders": {},
-
-    "vote_started": False,
-}
+    def cancel(self):
+        self.task.cancel()
+        self.timer.cancel()
 
 
 class Service(interface.ServiceInterface):
     providers_: dict[providers.ProviderKind, providers.ProviderInterface]
-    rooms_: dict[int, RoomData]  # room_id to RoomData mapping
-    users_: dict[str, int]  # user_id to room_id mapping
-    next_room_id_: int
-
-    def __init__(self, storage: redis.Redis, providers: typing.Dict[providers.ProviderKind, providers.ProviderInterface]):
+    storage_: storage.StorageInterface
+    events_: events.EventBusInterface
+    prefetched_: dict[int, _Prefetch]  # room_id to pages fetched before start, local to the worker
+    streaming_: dict[int, asyncio.Task]  # room_id to the task appending pages which arrived after start
+    gc_task_: typing.Optional[asyncio.Task]  # removes expired rooms every gc_interval seconds
+
+    def __init__(self, storage: storage.StorageInterface, providers: typing.Dict[providers.ProviderKind, providers.ProviderInterface],
+                 events: typing.Optional[events.EventBusInterface] = None,
+                 prefetch: bool = False, prefetch_timeout: float = 60, prefetch_ttl: float = 30 * 60,
+                 match_ttl: float = 30 * 60, gc_interval: float = 60, option_ordering: str = ordering.ADAPTIVE):
+        if option_ordering not in ordering.ORDERINGS:
+            raise ValueError("Unknown option ordering: {}".format(option_ordering))
         self.providers_ = providers
         self.storage_ = storage
-        self.rooms_ = dict()
-        self.users_ = dict()
-        self.next_room_id_ = random.randint(10000, 50000)
-
+        self.events_ = events or memory_events.MemoryEventBus()
+        self.prefetch_ = prefetch
+        self.prefetch_timeout_ = prefetch_timeout
+        self.prefetch_ttl_ = prefetch_ttl
+        self.prefetched_ = dict()
+        self.streaming_ = dict()
+        self.match_ttl_ = match_ttl
+        self.gc_interval_ = gc_interval
+        self.gc_task_ = None
+        self.option_ordering_ = option_ordering
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def get_room_participants(self, user_id: str) -> list[str]:
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        return list(room_data["participants"])
+        room_id, room_data = await self._load_users_room(user_id)
+        return list(room_data.participants)
 
     async def wait_start(self, user_id: str):
+        with metrics.WAITING_USERS.track_inprogress():
+            await self._wait_room(
+                user_id,
+                lambda room_data: room_data.vote_started is True,
+                lambda event: event["kind"] == events.RoomEventKind.START,
+            )
+
+    async def wait_end(self, user_id: str):
+        def is_over(room_data: room.RoomData) -> bool:
+            return user_id not in room_data.participants or room_data.match is not None \
+                or not journal.match_possible(room_data)
+
+        def ends(event: events.RoomEvent) -> bool:
+            if event["kind"] == events.RoomEventKind.LEAVE:
+                return event["user_id"] == user_id
+            return event["kind"] in (events.RoomEventKind.MATCH, events.RoomEventKind.NO_MATCH,
+                                     events.RoomEventKind.EXPIRE)
+
+        await self._wait_room(user_id, is_over, ends)
+
+    async def _wait_room(self, user_id: str, is_over: typing.Callable[[room.RoomData], bool],
+                         ends: typing.Callable[[events.RoomEvent], bool]):
         room_id = await self._get_users_room(user_id)
+        while True:
+            try:
+                # Subscribe before looking at the room, so the event can't slip in between
+                async with self.events_.subscribe(room_id) as room_events:
+                    if is_over(await self._load_room(room_id)):
+                        return
+                    async for event in room_events:
+                        if ends(event):
+                            return
+            except events.EventsLost:
+                logging.info("events of room %s may be lost, looking at it again", room_id)
+
+    def room_events(self, user_id: str) -> typing.AsyncContextManager[typing.AsyncIterator[events.RoomEvent]]:
+        return self._room_events(user_id)
+
+    @contextlib.asynccontextmanager
+    async def _room_events(self, user_id: str) -> typing.AsyncIterator[typing.AsyncIterator[events.RoomEvent]]:
+        room_id = await self._get_users_room(user_id)
+        async with self.events_.subscribe(room_id) as room_events:
+            yield room_events
 
-        room_data = await self._load_room(room_id)
-        while room_data["vote_started"] is False:
-            # FIXME
-            await asyncio.sleep(1)
-            logging.info("waiting")
-            room_data = await self._load_room(room_id)
-
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def create_room(self, user_id: str, params: room.RoomParams) -> int:
         """Callback is called when people are joining group. And will be called then voting is started and is finished and room is closed"""
+        params = room.RoomParams(params.provider_name, provider_filters.validate(
+            providers.ProviderKind(params.provider_name), params.filters))
         room_id = await self._generate_room_id()
-        room_data = self._create_empty_room()
-
-        room_data["params"] = params
-        room_data["owner"] = user_id
-
-        self._add_user_to_room(room_data, user_id)
-        self.users_[user_id] = room_id
+        room_data = room.RoomData(owner=user_id, params=params, ordering=self.option_ordering_)
+        journal.apply(room_data, journal.join(user_id))
 
         logging.info(room_data)
 
-        await self._store_room(room_id, room_data)
+        await self._store_room(room_id, room_data, users={user_id: room_id})
+        self._start_gc()
+
+        if self.prefetch_:
+            self._prefetch_options(room_id, params)
         return room_id
 
+    @metrics.timed(metrics.SERVICE_LATENCY)
+    async def get_room_params(self, user_id: str) -> room.RoomParams:
+        room_id, room_data = await self._load_users_room(user_id)
+        return room_data.params
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
+    async def set_filters(self, user_id: str, filters: typing.Mapping[str, typing.Any]) -> dict[str, int | str]:
+        validated: dict[str, int | str] = dict()
+
+        def set_filters(room_data: room.RoomData) -> list[journal.Event]:
+            nonlocal validated
+            if room_data.vote_started is True or room_data.owner != user_id:
+                raise Exception("Only the owner can change filters before the vote")
+            validated = provider_filters.validate(providers.ProviderKind(room_data.params.provider_name), filters)
+            return [journal.set_filters(validated)]
+
+        room_id, room_data = await self._update_users_room(user_id, set_filters)
+        # Entries fetched for the old filters are of no use
+        self._drop_prefetched(room_id)
+        if self.prefetch_:
+            self._prefetch_options(room_id, room_data.params)
+        return validated
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def add_entry(self, user_id: str, entry: entry.ProviderEntry) -> None:
         """Will add custom entry"""
-        # Redis lock <room_id>
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        if room_data["vote_started"] is True or room_data["owner"] != user_id:
-            raise Exception("A? A? A? A? A? A? A? A? A? A? A? A? A? A? A? A?")
-        room_data["options"].append(entry)
-        await self._store_room(room_id, room_data)
-        # Redis unlock <room_id>
+        def add(room_data: room.RoomData) -> list[journal.Event]:
+            if room_data.vote_started is True or room_data.owner != user_id:
+                raise Exception("A? A? A? A? A? A? A? A? A? A? A? A? A? A? A? A?")
+            return [journal.add_entry(entry)]
+
+        await self._update_users_room(user_id, add)
 
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def leave_room(self, user_id: str) -> None:
         """Will be called then voting is started and is finished and room is closed. Active only is voting is not started"""
-        # Redis lock <room_id>
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        self._remove_user_from_room(room_data, user_id)
-        self.users_[user_id] = -1
-        await self._store_room(room_id, room_data)
-
+        had_match = False
+        was_possible = True
+
+        def leave(room_data: room.RoomData) -> list[journal.Event]:
+            nonlocal had_match, was_possible
+            had_match = room_data.match is not None
+            was_possible = journal.match_possible(room_data)
+            return [journal.leave(user_id)]
+
+        room_id, room_data = await self._update_users_room(user_id, leave, users={user_id: None})
+        if not room_data.participants:
+            await self.storage_.delete_room(room_id)
+            self._drop_room_tasks(room_id)
+        await self._publish(events.RoomEventKind.LEAVE, room_id, user_id)
+        if room_data.participants:
+            # The rest may be left with an option they all like
+            await self._finish_vote(room_id, room_data, had_match, was_possible)
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def join_room(self, user_id: str, room_id: int) -> None:
         """Will be called then voting is started and is finished and room is closed. Active only is voting is not started"""
-        # Redis lock <room_id>
-        room_data = await self._load_room(room_id)
-
-        if room_data["vote_started"] is True:
-            raise Exception("OH GOD WHY PLEASE STOP I BEG YOU AAAAA")
+        def join(room_data: room.RoomData) -> list[journal.Event]:
+            if room_data.vote_started is True:
+                raise Exception("OH GOD WHY PLEASE STOP I BEG YOU AAAAA")
+            return [journal.join(user_id)]
 
-        self._add_user_to_room(room_data, user_id)
-        self.users_[user_id] = room_id
-        await self._store_room(room_id, room_data)
-        # Redis unlock <room_id>
+        await self._update_room(room_id, join, users={user_id: room_id})
+        await self._publish(events.RoomEventKind.JOIN, room_id, user_id)
 
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def current_option(self, user_id: str):
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        return room_data["options"][self._get_user_current_option_index(user_id, room_data)], room_data["match"]
-        # Redis unlock <room_id>
-
+        room_data = await self._load_current(user_id)
+        option_index = journal.current_option_index(room_data, user_id)
+        return None if option_index is None else room_data.options[option_index], room_data.match
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
+    async def current_card(self, user_id: str) -> interface.VoteCard:
+        return self._card(await self._load_current(user_id), user_id)
+
+    async def _load_current(self, user_id: str) -> room.RoomData:
+        room_id, room_data = await self._load_users_room(user_id)
+        if journal.current_option_dead(room_data, user_id):
+            # Someone disliked it after it was chosen, no need to show it
+            def skip(room_data: room.RoomData) -> list[journal.Event]:
+                if not journal.current_option_dead(room_data, user_id):
+                    return []
+                return [journal.skip(room_data, user_id)]
+
+            room_id, room_data = await self._update_users_room(user_id, skip)
+        return room_data
+
+    def _card(self, room_data: room.RoomData, user_id: str) -> interface.VoteCard:
+        option_index = journal.current_option_index(room_data, user_id)
+        return interface.VoteCard(
+            option=None if option_index is None else room_data.options[option_index],
+            option_index=option_index,
+            match=room_data.match,
+            participants=list(room_data.participants),
+            upcoming=[room_data.options[i]
+                      for i in journal.upcoming_option_indexes(room_data, user_id, UPCOMING_OPTIONS)],
+        )
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def get_match(self, user_id: str) -> typing.Optional[entry.ProviderEntry]:
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        return room_data["match"]
+        room_id, room_data = await self._load_users_room(user_id)
+        return room_data.match
 
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def reset_match(self, user_id: str):
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        room_data["match"] = None
-        await self._store_room(room_id, room_data)
-
-    async def vote(self, user_id: str, is_liked: bool):
-        room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        if is_liked:
-            await self._like_option(user_id, room_data)
-        self._progress_user(user_id, room_data)
-        await self._store_room(room_id, room_data)
-
+        def reset(room_data: room.RoomData) -> list[journal.Event]:
+            return [journal.reset_match()]
+
+        await self._update_users_room(user_id, reset)
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
+    async def vote(self, user_id: str, is_liked: bool) -> interface.VoteOutcome:
+        outcome, room_data = await self._vote(user_id, is_liked)
+        return outcome
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
+    async def vote_and_next(self, user_id: str, is_liked: bool, option_index: int) -> interface.VoteResult:
+        outcome, room_data = await self._vote(user_id, is_liked, option_index)
+        return interface.VoteResult(**self._card(room_data, user_id), outcome=outcome)
+
+    async def _vote(self, user_id: str, is_liked: bool,
+                    option_index: typing.Optional[int] = None) -> typing.Tuple[interface.VoteOutcome, room.RoomData]:
+        ignored = False
+        had_match = False
+        was_possible = True
+
+        def vote(room_data: room.RoomData) -> list[journal.Event]:
+            nonlocal ignored, had_match, was_possible
+            current = journal.current_option_index(room_data, user_id)
+            ignored = option_index is not None and (current != option_index or room_data.match is not None)
+            if ignored:
+                return []
+            if current is None:
+                raise Exception("Nothing left to vote for")
+            had_match = room_data.match is not None
+            was_possible = journal.match_possible(room_data)
+            return [journal.vote(room_data, user_id, is_liked)]
+
+        # Vote, move to the next option and match check are applied to the room at once
+        room_id, room_data = await self._update_users_room(user_id, vote)
+        if ignored:
+            return interface.VoteOutcome.IGNORED, room_data
+
+        metrics.VOTES.labels("true" if is_liked else "false").inc()
+        outcome = await self._finish_vote(room_id, room_data, had_match, was_possible)
+        return outcome, room_data
+
+    async def _finish_vote(self, room_id: int, room_data: room.RoomData,
+                           had_match: bool, was_possible: bool) -> interface.VoteOutcome:
+        if not had_match and room_data.match is not None:
+            metrics.MATCHES.inc()
+            # Participants may keep voting or reset the match, the room still ends after match_ttl
+            await self.storage_.expire_room(room_id, self.match_ttl_)
+            await self._publish(events.RoomEventKind.MATCH, room_id, None)
+            return interface.VoteOutcome.MATCH
+        if was_possible and not journal.match_possible(room_data):
+            metrics.NO_MATCHES.inc()
+            await self.storage_.expire_room(room_id, self.match_ttl_)
+            await self._publish(events.RoomEventKind.NO_MATCH, room_id, None)
+            return interface.VoteOutcome.NO_MATCH
+        return interface.VoteOutcome.VOTED
+
+    @metrics.timed(metrics.SERVICE_LATENCY)
     async def start_vote(self, user_id: str) -> None:
         """Only owner of the room can call this"""
         room_id = await self._get_users_room(user_id)
-        room_data = await self._load_room(room_id)
-        if providers.ProviderKind(room_data["params"]["provider_name"]) != providers.ProviderKind.CUSTOM:
-            provider = self.providers_.get(providers.ProviderKind(room_data["params"]["provider_name"]))
-            if not provider:
-                raise Exception("AAAAAAA")
-            options = await provider.get_entries({"filters": room_data["params"]["filters"], "exclude_names": []})
-
-            random.shuffle(options)
-            room_data["options"] += options
-        else:
-            # All options should be already set
-            if len(room_data["options"]) == 0:
-                 raise Exception("WHERE'S VOTES LOBOWSKI????")
-
-        room_data["options_likes"] = {i: set() for i in range(len(room_data["options"]))}
-
-        if room_data["vote_started"] is True or room_data["owner"] != user_id:
-            raise Exception("OH GOD WHY PLEASE STOP I BEG YOU AAAAA")
 
-        logging.info("STARTED")
-        room_data["vote_started"] = True
+        # Provider is asked once even if start is pressed several times
+        async with self._lock_room(room_id):
+            room_data = await self._load_room(room_id)
+            self._check_can_start(user_id, room_data)
+
+            pages = None
+            options = []
+            if providers.ProviderKind(room_data.params.provider_name) != providers.ProviderKind.CUSTOM:
+                # Voting starts on the first page, the rest is appended while participants vote
+                pages = self._iter_options(room_id, room_data.params)
+                async for options in pages:
+                    if options:
+                        break
+                random.shuffle(options)
+
+            def start(room_data: room.RoomData) -> list[journal.Event]:
+                self._check_can_start(user_id, room_data)
+                # Custom rooms should already have all options set
+                if len(room_data.options) + len(options) == 0:
+                    raise Exception("WHERE'S VOTES LOBOWSKI????")
+
+                logging.info("STARTED")
+                return [journal.start(options, room_data.participants)]
+
+            try:
+                await self._update_room(room_id, start)
+            except Exception:
+                if pages is not None:
+                    await pages.aclose()
+                raise
 
-        room_data["options_orders"] = {id: self._reshuffle_options(room_data) for id in room_data["participants"]}
-        await self._store_room(room_id, room_data)
         logging.info("STORED")
-        # Redis unlock <room_id>
-
-    def _get_user_current_option_index(self, user_id: str, room_data: RoomData) -> int:
-        return room_data["options_orders"][user_id][
-            room_data["participants_positions"][user_id]
-        ]
-
-    async def _like_option(self, user_id: str, room_data: RoomData):
-        option_index = self._get_user_current_option_index(user_id, room_data)
-        room_data["options_likes"][option_index].add(user_id)
-
-        if len(room_data["options_likes"][option_index]) >= len(room_data["participants"]) and room_data["match"] is None:
-            option = room_data["options"][option_index]
-            logging.info("match: " + option["name"])
-            room_data["match"] = option
-
-    def _progress_user(self, user_id: str, room_data: RoomData):
-        room_data["participants_positions"][user_id] += 1
-
-        # if no options left then reshuffle them and give again
-        if room_data["participants_positions"][user_id] == len(room_data["options_orders"][user_id]):
-            room_data["participants_positions"][user_id] = 0
-            room_data["options_orders"][user_id] = self._reshuffle_options(room_data)
+        await self._publish(events.RoomEventKind.START, room_id, user_id)
+
+        if pages is not None:
+            self.streaming_[room_id] = asyncio.create_task(self._append_options(room_id, pages))
+
+    def _get_provider(self, params: room.RoomParams) -> providers.ProviderInterface:
+        provider = self.providers_.get(providers.ProviderKind(params.provider_name))
+        if not provider:
+            raise Exception("AAAAAAA")
+        return provider
+
+    async def _iter_options(self, room_id: int, params: room.RoomParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        prefetch = self.prefetched_.pop(room_id, None)
+        # Filters may have been changed on another worker
+        if prefetch is not None and prefetch.filters != params.filters:
+            prefetch.cancel()
+        elif prefetch is not None:
+            prefetch.timer.cancel()
+            read = 0
+            try:
+                while True:
+                    if read == len(prefetch.pages) and not prefetch.done:
+                        await prefetch.changed.wait()
+                        continue
+                    while read < len(prefetch.pages):
+                        read += 1
+                        yield prefetch.pages[read - 1]
+                    if prefetch.done:
+                        break
+            finally:
+                prefetch.task.cancel()
+
+            if prefetch.error is None:
+                return
+            if read:
+                # Pages already read can't be told apart from those of a new request
+                raise prefetch.error
+            logging.warning("prefetch for room %s failed, fetching again: %r", room_id, prefetch.error)
+
+        async for page in self._get_provider(params).iter_entries({"filters": params.filters, "exclude_names": []}):
+            yield page
+
+    async def _append_options(self, room_id: int, pages: typing.AsyncIterator[list[entry.ProviderEntry]]):
+        try:
+            async for page in pages:
+                if not page:
+                    continue
+                random.shuffle(page)
+
+                def append(room_data: room.RoomData) -> list[journal.Event]:
+                    return [journal.append_options(page)]
+
+                # The page is appended atomically with whatever participants do meanwhile, a busy room
+                # may keep winning the race for a while but the page is never dropped because of it
+                while True:
+                    try:
+                        await self._update_room(room_id, append)
+                        break
+                    except storage.ConflictError:
+                        logging.warning("room %s is busy, appending options again", room_id)
+                        await asyncio.sleep(APPEND_RETRY_INTERVAL)
+        except KeyError:
+            logging.info("room %s is gone, stop loading options", room_id)
+        except Exception:
+            logging.exception("failed to load options for room %s", room_id)
+        finally:
+            self.streaming_.pop(room_id, None)
+            await pages.aclose()
+
+    def _prefetch_options(self, room_id: int, params: room.RoomParams):
+        if providers.ProviderKind(params.provider_name) == providers.ProviderKind.CUSTOM:
+            return
+
+        prefetch = _Prefetch(params.filters)
+        prefetch.task = asyncio.create_task(self._prefetch(self._get_provider(params), params, prefetch))
+        # Entries of a room which is never started are not kept forever
+        prefetch.timer = asyncio.get_running_loop().call_later(self.prefetch_ttl_, self._drop_prefetched, room_id)
+        self.prefetched_[room_id] = prefetch
+
+    async def _prefetch(self, provider: providers.ProviderInterface, params: room.RoomParams, prefetch: _Prefetch):
+        try:
+            async with asyncio.timeout(self.prefetch_timeout_):
+                async for page in provider.iter_entries({"filters": params.filters, "exclude_names": []}):
+                    prefetch.pages.append(page)
+                    prefetch.notify()
+        except Exception as e:
+            logging.warning("prefetch failed: %r", e)
+            prefetch.error = e
+        except asyncio.CancelledError:
+            # Start must not take the pages read so far for all of them
+            prefetch.error = RuntimeError("prefetch is cancelled")
+            raise
+        finally:
+            prefetch.done = True
+            prefetch.notify()
+
+    def _drop_prefetched(self, room_id: int):
+        prefetch = self.prefetched_.pop(room_id, None)
+        if prefetch is not None:
+            prefetch.cancel()
+
+    def _drop_streaming(self, room_id: int):
+        task = self.streaming_.pop(room_id, None)
+        if task is not None:
+            task.cancel()
+
+    def _drop_room_tasks(self, room_id: int):
+        self._drop_prefetched(room_id)
+        self._drop_streaming(room_id)
+
+    def _start_gc(self):
+        if self.gc_task_ is None:
+            self.gc_task_ = asyncio.create_task(self._collect_garbage())
+
+    async def _collect_garbage(self):
+        while True:
+            await asyncio.sleep(self.gc_interval_)
+            try:
+                expired = await self.storage_.collect_garbage()
+                stats = await self.storage_.stats()
+            except Exception:
+                logging.exception("failed to collect expired rooms")
+                continue
+
+            for room_id in expired:
+                self._drop_room_tasks(room_id)
+            # Those still waiting for the end of a vote in expired rooms stop waiting
+            published = await asyncio.gather(
+                *(self._publish(events.RoomEventKind.EXPIRE, room_id, None) for room_id in expired),
+                return_exceptions=True)
+            if any(isinstance(result, Exception) for result in published):
+                logging.warning("failed to publish expiry of some rooms")
+
+            self._report_stats(stats)
+            if expired:
+                logging.info("expired %d rooms, %s", len(expired), stats)
+
+    def _report_stats(self, stats: storage.StorageStats):
+        metrics.LIVE_ROOMS.set(stats["live_rooms"])
+        metrics.ROOM_USERS.set(stats["users"])
+        metrics.EXPIRED_ROOMS.set(stats["expired_rooms"])
+        metrics.RECLAIMED_BYTES.set(stats["reclaimed_bytes"])
+
+    async def stats(self) -> storage.StorageStats:
+        return await self.storage_.stats()
+
+    async def start(self) -> None:
+        # Rooms of the shared storage are there before this worker touches any of them
+        self._report_stats(await self.storage_.stats())
+        self._start_gc()
+
+    async def close(self) -> None:
+        if self.gc_task_ is not None:
+            self.gc_task_.cancel()
+            self.gc_task_ = None
+        for room_id in list(self.prefetched_):
+            self._drop_prefetched(room_id)
+        for task in self.streaming_.values():
+            task.cancel()
+        self.streaming_.clear()
+
+        for provider in self.providers_.values():
+            if provider is not None:
+                await provider.close()
+        await self.events_.close()
+        await self.storage_.close()
+
+    async def _publish(self, kind: events.RoomEventKind, room_id: int, user_id: typing.Optional[str]):
+        await self.events_.publish(events.RoomEvent(kind=kind, room_id=room_id, user_id=user_id))
+
+    def _check_can_start(self, user_id: str, room_data: room.RoomData):
+        if room_data.vote_started is True or room_data.owner != user_id:
+            raise Exception("OH GOD WHY PLEASE STOP I BEG YOU AAAAA")
 
-    def _create_empty_room(self) -> RoomData:
-        return copy.deepcopy(EMPTY_ROOM)  # type: ignore
+    async def _assign_users_room(self, user_id: str, room_id: int):
+        await self.storage_.assign_users_room(user_id, room_id)
 
-    def _add_user_to_room(self, room_data: RoomData, user_id: str):
-        room_data["participants"].add(user_id)
-        room_data["participants_positions"][user_id] = 0
+    async def _get_users_room(self, user_id: str) -> int:
+        return await self.storage_.get_users_room(user_id)
 
-    def _remove_user_from_room(self, room_data: RoomData, user_id: str):
-        room_data["participants"].remove(user_id)
-        del room_data["participants_positions"][user_id]
+    async def _load_room(self, room_id: int) -> room.RoomData:
+        return await self.storage_.load_room(room_id)
 
-    # Add redis later for following methods (for now can be used with one worker)
-    async def _assign_users_room(self, user_id: str, room_id: int):
-        self.users_[user_id] = room_id
+    async def _load_users_room(self, user_id: str) -> typing.Tuple[int, room.RoomData]:
+        return await self.storage_.load_users_room(user_id)
 
-    async def _remove_room_users_room(self, user_id: str, room_id: int):
-        self.users_[user_id] = room_id
+    async def _store_room(self, room_id: int, room_data: room.RoomData, users: typing.Optional[dict[str, typing.Optional[int]]] = None):
+        await self.storage_.store_room(room_id, room_data, users)
 
-    async def _get_users_room(self, user_id: str) -> int:
-        return self.users_[user_id]
+    async def _update_room(self, room_id: int, update: storage.RoomUpdate,
+                           users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> room.RoomData:
+        return await self.storage_.update_room(room_id, update, users)
 
-    async def _load_room(self, room_id: int) -> RoomData:
-        return self.rooms_[room_id]
+    async def _update_users_room(self, user_id: str, update: storage.RoomUpdate,
+                                 users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> typing.Tuple[int, room.RoomData]:
+        return await self.storage_.update_users_room(user_id, update, users)
 
-    async def _store_room(self, room_id: int, room_data: RoomData):
-        self.rooms_[room_id] = room_data
+    def _lock_room(self, room_id: int) -> typing.AsyncContextManager[None]:
+        return self.storage_.lock_room(room_id)
 
     async def _generate_room_id(self):
-        new_id = self.next_room_id_
-        self.next_room_id_ += 1
-        return new_id
-
-    def _reshuffle_options(self, room_data: RoomData) -> list:
-        def divide_chunks(l, n):
-            for i in range(0, len(l), n):
-                yield l[i:i + n]
-
-        def get_shuffled():
-            indexes = list(range(len(room_data["options"])))
-            chunks = [random.shuffle(chunk) or chunk for chunk in divide_chunks(indexes, 10)]
-            indexes = list(itertools.chain.from_iterable(chunks))
-            return indexes
-
-        return get_shuffled()
+        return await self.storage_.generate_room_id()
@@ -0,0 +1,12 @@
+import typing
+
+from . import interface
+from . import memory
+from . import redis_storage
+
+
+async def get_storage(config: typing.Dict[str, str]) -> interface.StorageInterface:
+    # Redis is used whenever it is configured, so several workers can share rooms
+    if config.get("REDIS_HOST"):
+        return await redis_storage.get_storage(config)
+    return await memory.get_storage(config)
@@ -0,0 +1,35 @@
+import msgpack
+
+from models import entry
+
+from .. import journal
+
+# Rooms encode themselves, see models.room.RoomData.to_bytes. Events are
+# positional msgpack arrays as well.
+
+
+def encode_event(event: journal.Event) -> bytes:
+    # Votes are the most frequent events and take a dozen of bytes
+    return msgpack.packb([
+        int(event.kind),
+        event.user_id,
+        event.liked,
+        None if event.entries is None else [e.to_list() for e in event.entries],
+        event.seeds,
+        event.option,
+        event.filters,
+    ], use_bin_type=True)
+
+
+def decode_event(data: bytes) -> journal.Event:
+    # Events logged before filters were added have no such field
+    kind, user_id, liked, entries, seeds, option, *rest = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return journal.Event(
+        kind=journal.EventKind(kind),
+        user_id=user_id,
+        liked=liked,
+        entries=None if entries is None else [entry.ProviderEntry.from_list(e) for e in entries],
+        seeds=seeds,
+        option=option,
+        filters=rest[0] if rest else None,
+    )
@@ -0,0 +1,59 @@
+import heapq
+import typing
+
+
+K = typing.TypeVar("K")
+
+
+class ExpiryQueue(typing.Generic[K]):
+    """Deadlines of many keys, popped in order without scanning all of them.
+
+    Keys are pushed to the heap only when their deadline moves earlier. A later
+    deadline is just remembered and the key is pushed again when its old entry
+    comes out, so frequently touched keys do not fill the heap with stale entries.
+    """
+
+    deadlines_: dict[K, float]  # key to its current deadline
+    scheduled_: dict[K, float]  # key to the deadline of its live heap entry
+    heap_: list[typing.Tuple[float, K]]
+
+    def __init__(self):
+        self.deadlines_ = dict()
+        self.scheduled_ = dict()
+        self.heap_ = []
+
+    def __len__(self) -> int:
+        return len(self.deadlines_)
+
+    def schedule(self, key: K, deadline: float, only_earlier: bool = False):
+        """Sets the deadline of key, with only_earlier a later deadline than the current one is ignored"""
+        current = self.deadlines_.get(key)
+        if only_earlier and current is not None and current <= deadline:
+            return
+        self.deadlines_[key] = deadline
+        scheduled = self.scheduled_.get(key)
+        if scheduled is None or deadline < scheduled:
+            self.scheduled_[key] = deadline
+            heapq.heappush(self.heap_, (deadline, key))
+
+    def remove(self, key: K):
+        # Its heap entry is skipped when it comes out
+        self.deadlines_.pop(key, None)
+        self.scheduled_.pop(key, None)
+
+    def pop_expired(self, now: float, limit: typing.Optional[int] = None) -> list[K]:
+        expired = []
+        while self.heap_ and self.heap_[0][0] <= now and (limit is None or len(expired) < limit):
+            scheduled, key = heapq.heappop(self.heap_)
+            if self.scheduled_.get(key) != scheduled:
+                continue  # removed or superseded by an earlier entry
+
+            deadline = self.deadlines_[key]
+            if deadline > now:
+                self.scheduled_[key] = deadline
+                heapq.heappush(self.heap_, (deadline, key))
+                continue
+
+            self.remove(key)
+            expired.append(key)
+        return expired
@@ -0,0 +1,84 @@
+import typing
+
+from models import room
+
+from .. import journal
+
+
+# Checks the room and returns events to apply to it, see service.journal. Must not
+# change the room or await and can be called several times if the room is changed
+# concurrently
+RoomUpdate = typing.Callable[[room.RoomData], list[journal.Event]]
+
+
+class ConflictError(Exception):
+    """Room kept changing concurrently and the update could not be applied"""
+
+
+class StorageStats(typing.TypedDict):
+    live_rooms: int
+    users: int  # users assigned to a room
+    expired_rooms: int  # rooms removed since start
+    reclaimed_bytes: int  # serialized size of removed rooms
+
+
+class StorageInterface(typing.Protocol):
+    async def generate_room_id(self) -> int:
+        """Returns new unique room id. Must be safe to call from several workers at once"""
+        ...
+
+    async def load_room(self, room_id: int) -> room.RoomData:
+        """Raises KeyError if there is no such room"""
+        ...
+
+    async def load_users_room(self, user_id: str) -> typing.Tuple[int, room.RoomData]:
+        """Same as get_users_room + load_room but in one round trip"""
+        ...
+
+    async def store_room(self, room_id: int, room_data: room.RoomData, users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> None:
+        """Stores room together with given user to room assignments, None removes the assignment.
+
+        Every write postpones expiry of the room by the idle TTL of the storage.
+        """
+        ...
+
+    async def update_room(self, room_id: int, update: RoomUpdate, users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> room.RoomData:
+        """Atomically applies events returned by update to the room and records them together with
+        given user to room assignments. Returns the changed room.
+
+        Nothing is stored if update raises.
+        """
+        ...
+
+    async def update_users_room(self, user_id: str, update: RoomUpdate, users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> typing.Tuple[int, room.RoomData]:
+        """Same as update_room for the room of the user, returns room id as well"""
+        ...
+
+    def lock_room(self, room_id: int) -> typing.AsyncContextManager[None]:
+        """Serializes long operations (like starting a vote) on one room. Updates do not need it"""
+        ...
+
+    async def get_users_room(self, user_id: str) -> int:
+        """Raises KeyError if user is not in any room"""
+        ...
+
+    async def assign_users_room(self, user_id: str, room_id: int) -> None:
+        ...
+
+    async def expire_room(self, room_id: int, ttl: float) -> None:
+        """Moves expiry of the room to ttl seconds from now, until it is written again"""
+        ...
+
+    async def delete_room(self, room_id: int) -> None:
+        """Removes the room and assignments of users still in it"""
+        ...
+
+    async def collect_garbage(self, limit: int = 1000) -> list[int]:
+        """Removes at most limit expired rooms like delete_room does, returns their ids"""
+        ...
+
+    async def stats(self) -> StorageStats:
+        ...
+
+    async def close(self) -> None:
+        ...
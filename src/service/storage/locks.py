@@ -0,0 +1,29 @@
+import asyncio
+import contextlib
+import typing
+
+
+class RoomLocks:
+    """asyncio lock per room, existing only while somebody holds or waits for it"""
+
+    locks_: dict[int, typing.Tuple[asyncio.Lock, int]]  # room_id to lock and number of its holders and waiters
+
+    def __init__(self):
+        self.locks_ = dict()
+
+    @contextlib.asynccontextmanager
+    async def lock(self, room_id: int) -> typing.AsyncIterator[bool]:
+        """Yields True if the lock had to be waited for"""
+        lock, holders = self.locks_.get(room_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self.locks_[room_id] = (lock, holders + 1)
+        try:
+            contended = lock.locked()
+            async with lock:
+                yield contended
+        finally:
+            lock, holders = self.locks_[room_id]
+            if holders == 1:
+                del self.locks_[room_id]
+            else:
+                self.locks_[room_id] = (lock, holders - 1)
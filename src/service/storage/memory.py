@@ -0,0 +1,131 @@
+import contextlib
+import random
+import time
+import typing
+
+from models import room
+
+from .. import journal
+from . import expiry
+from . import interface
+from . import locks
+
+
+ROOM_IDLE_TTL = 6 * 60 * 60
+
+
+class MemoryStorage(interface.StorageInterface):
+    """Keeps everything in process. Can be used with one worker only"""
+
+    rooms_: dict[int, room.RoomData]  # room_id to RoomData mapping
+    users_: dict[str, int]  # user_id to room_id mapping
+    next_room_id_: int
+    expiry_: expiry.ExpiryQueue[int]  # room_id to the time it is removed at
+    ending_: set[int]  # rooms given a ttl by expire_room, updates don't move their deadline later
+
+    def __init__(self, idle_ttl: float = ROOM_IDLE_TTL):
+        self.rooms_ = dict()
+        self.users_ = dict()
+        self.next_room_id_ = random.randint(10000, 50000)
+        self.locks_ = locks.RoomLocks()
+        self.idle_ttl_ = idle_ttl
+        self.expiry_ = expiry.ExpiryQueue()
+        self.ending_ = set()
+        self.expired_rooms_ = 0
+        self.reclaimed_bytes_ = 0
+
+    async def generate_room_id(self) -> int:
+        new_id = self.next_room_id_
+        self.next_room_id_ += 1
+        return new_id
+
+    async def load_room(self, room_id: int) -> room.RoomData:
+        return self.rooms_[room_id]
+
+    async def load_users_room(self, user_id: str) -> typing.Tuple[int, room.RoomData]:
+        room_id = self.users_[user_id]
+        return room_id, self.rooms_[room_id]
+
+    async def store_room(self, room_id: int, room_data: room.RoomData,
+                         users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> None:
+        self.rooms_[room_id] = room_data
+        self._assign_users(users)
+        self._touch(room_id)
+
+    async def update_room(self, room_id: int, update: interface.RoomUpdate,
+                          users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> room.RoomData:
+        # Update does not await, so nothing else can run on this loop in between.
+        # Rooms live in memory, there is nothing to persist besides the changed room itself
+        room_data = self.rooms_[room_id]
+        for event in update(room_data):
+            journal.apply(room_data, event)
+        self._assign_users(users)
+        self._touch(room_id)
+        return room_data
+
+    async def update_users_room(self, user_id: str, update: interface.RoomUpdate,
+                                users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> typing.Tuple[int, room.RoomData]:
+        room_id = self.users_[user_id]
+        return room_id, await self.update_room(room_id, update, users)
+
+    @contextlib.asynccontextmanager
+    async def lock_room(self, room_id: int) -> typing.AsyncIterator[None]:
+        async with self.locks_.lock(room_id):
+            yield
+
+    async def get_users_room(self, user_id: str) -> int:
+        return self.users_[user_id]
+
+    async def assign_users_room(self, user_id: str, room_id: int) -> None:
+        self.users_[user_id] = room_id
+
+    async def expire_room(self, room_id: int, ttl: float) -> None:
+        if room_id in self.rooms_:
+            self.expiry_.schedule(room_id, time.time() + ttl)
+            self.ending_.add(room_id)
+
+    async def delete_room(self, room_id: int) -> None:
+        self.expiry_.remove(room_id)
+        self._delete_room(room_id)
+
+    async def collect_garbage(self, limit: int = 1000) -> list[int]:
+        expired = self.expiry_.pop_expired(time.time(), limit)
+        for room_id in expired:
+            self._delete_room(room_id)
+        return expired
+
+    async def stats(self) -> interface.StorageStats:
+        return interface.StorageStats(
+            live_rooms=len(self.rooms_),
+            users=len(self.users_),
+            expired_rooms=self.expired_rooms_,
+            reclaimed_bytes=self.reclaimed_bytes_,
+        )
+
+    def _assign_users(self, users: typing.Optional[dict[str, typing.Optional[int]]]):
+        for user_id, room_id in (users or {}).items():
+            if room_id is None:
+                self.users_.pop(user_id, None)
+            else:
+                self.users_[user_id] = room_id
+
+    def _touch(self, room_id: int):
+        self.expiry_.schedule(room_id, time.time() + self.idle_ttl_, only_earlier=room_id in self.ending_)
+
+    def _delete_room(self, room_id: int):
+        self.ending_.discard(room_id)
+        room_data = self.rooms_.pop(room_id, None)
+        if room_data is None:
+            return
+
+        # Those who left are unassigned already, those who moved on belong to another room
+        for user_id in room_data.participants:
+            if self.users_.get(user_id) == room_id:
+                del self.users_[user_id]
+
+        self.expired_rooms_ += 1
+        self.reclaimed_bytes_ += len(room_data.to_bytes())
+
+
+async def get_storage(config: typing.Dict[str, str]) -> interface.StorageInterface:
+    return MemoryStorage(idle_ttl=float(config.get("ROOM_IDLE_TTL", ROOM_IDLE_TTL)))
@@ -0,0 +1,358 @@
+import asyncio
+import random
+import time
+import typing
+
+import redis.asyncio as redis
+
+from models import room
+
+from .. import journal
+from . import codec
+from . import interface
+from . import locks
+
+
+# A room is stored as a snapshot plus the log of events which happened after it.
+# Updates append a few bytes to the log, and the log is folded into a new snapshot
+# once it grows long enough.
+
+# Every key a script touches is passed in KEYS. On Redis Cluster they have to share a slot,
+# which a prefix with a hash tag such as {quo} gives.
+
+# Rooms expire through the {prefix}:rooms sorted set of deadlines. Every room keeps
+# the set of users assigned to it, so removing a room does not scan all users.
+# Updates of a room given a ttl by expire_room (marked by its :ending key) don't move its deadline later.
+# KEYS: ..., rooms, room ending, users, (user, users set of the room the user is assigned to or leaves)...
+ASSIGN_USERS_LUA = """
+local function assign_users(room_id, deadline, first, count)
+    if redis.call('EXISTS', KEYS[5]) == 1 then
+        redis.call('ZADD', KEYS[4], 'LT', deadline, room_id)
+    else
+        redis.call('ZADD', KEYS[4], deadline, room_id)
+    end
+    for i = 0, count - 1 do
+        local user_id, users_room_id = ARGV[first + 2 * i], ARGV[first + 2 * i + 1]
+        local user_key, room_users_key = KEYS[7 + 2 * i], KEYS[8 + 2 * i]
+        if users_room_id == '' then
+            redis.call('DEL', user_key)
+            redis.call('SREM', room_users_key, user_id)
+            redis.call('SREM', KEYS[6], user_id)
+        else
+            redis.call('SET', user_key, users_room_id)
+            redis.call('SADD', room_users_key, user_id)
+            redis.call('SADD', KEYS[6], user_id)
+        end
+    end
+end
+"""
+
+# Appends events only if nobody has changed the room since it was read, together with user assignments.
+# KEYS: room, room version, room log, then as in ASSIGN_USERS_LUA
+# ARGV: room id, expected version, deadline, users count, (user id, room id or '')..., events...
+COMPARE_AND_APPEND_EVENTS_SCRIPT = ASSIGN_USERS_LUA + """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+local users = tonumber(ARGV[4])
+for i = 5 + 2 * users, #ARGV do
+    redis.call('RPUSH', KEYS[3], ARGV[i])
+end
+redis.call('INCR', KEYS[2])
+assign_users(ARGV[1], ARGV[3], 5, users)
+return 1
+"""
+
+# Same, but replaces the snapshot and drops the log. Empty expected version stores unconditionally.
+# KEYS: room, room version, room log, then as in ASSIGN_USERS_LUA
+# ARGV: room id, expected version, deadline, users count, (user id, room id or '')..., room blob
+COMPARE_AND_STORE_ROOM_SCRIPT = ASSIGN_USERS_LUA + """
+if ARGV[2] ~= '' and (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[#ARGV])
+redis.call('DEL', KEYS[3])
+redis.call('INCR', KEYS[2])
+assign_users(ARGV[1], ARGV[3], 5, tonumber(ARGV[4]))
+return 1
+"""
+
+# Sets the deadline of a live room and marks it as ending.
+# KEYS: rooms, room ending
+# ARGV: room id, deadline
+EXPIRE_ROOM_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('SET', KEYS[2], 1)
+return 1
+"""
+
+# Removes a room which is due and the users still assigned to it. Users are read from the room
+# before, if they have changed since, the room is left for the next collection.
+# KEYS: rooms, room, room version, room log, room users, room worker, room ending, users, gc, (user)...
+# ARGV: room id, now, (user id)...
+COLLECT_ROOM_SCRIPT = """
+local deadline = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not deadline or tonumber(deadline) > tonumber(ARGV[2]) then
+    return 0
+end
+if redis.call('SCARD', KEYS[5]) ~= #ARGV - 2 then
+    return 0
+end
+for i = 3, #ARGV do
+    if redis.call('SISMEMBER', KEYS[5], ARGV[i]) == 0 then
+        return 0
+    end
+end
+
+local reclaimed = redis.call('STRLEN', KEYS[2])
+for _, event in ipairs(redis.call('LRANGE', KEYS[4], 0, -1)) do
+    reclaimed = reclaimed + #event
+end
+for i = 3, #ARGV do
+    if redis.call('GET', KEYS[i + 7]) == ARGV[1] then
+        redis.call('DEL', KEYS[i + 7])
+        redis.call('SREM', KEYS[8], ARGV[i])
+    end
+end
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], KEYS[7])
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HINCRBY', KEYS[9], 'expired_rooms', 1)
+redis.call('HINCRBY', KEYS[9], 'reclaimed_bytes', reclaimed)
+return 1
+"""
+
+MAX_UPDATE_ATTEMPTS = 50
+MAX_LOG_LENGTH = 64  # events replayed on every load before the room is written as a new snapshot
+ROOM_IDLE_TTL = 6 * 60 * 60
+
+
+class RedisStorage(interface.StorageInterface):
+    """Shares rooms between any number of bot workers connected to the same redis"""
+
+    def __init__(self, client: redis.Redis, prefix: str = "quo", lock_timeout: float = 120,
+                 max_log_length: int = MAX_LOG_LENGTH, idle_ttl: float = ROOM_IDLE_TTL):
+        self.redis_ = client
+        self.prefix_ = prefix
+        self.lock_timeout_ = lock_timeout
+        self.max_log_length_ = max_log_length
+        self.idle_ttl_ = idle_ttl
+        self.compare_and_append_events_ = client.register_script(COMPARE_AND_APPEND_EVENTS_SCRIPT)
+        self.compare_and_store_room_ = client.register_script(COMPARE_AND_STORE_ROOM_SCRIPT)
+        self.expire_room_ = client.register_script(EXPIRE_ROOM_SCRIPT)
+        self.collect_room_ = client.register_script(COLLECT_ROOM_SCRIPT)
+        # Updates of one room from this worker go one by one, so they only conflict with other workers
+        self.update_locks_ = locks.RoomLocks()
+
+    def _room_key(self, room_id: int) -> str:
+        return "{}:room:{}".format(self.prefix_, room_id)
+
+    def _version_key(self, room_id: int) -> str:
+        return "{}:room:{}:version".format(self.prefix_, room_id)
+
+    def _log_key(self, room_id: int) -> str:
+        return "{}:room:{}:log".format(self.prefix_, room_id)
+
+    def _lock_key(self, room_id: int) -> str:
+        return "{}:room:{}:lock".format(self.prefix_, room_id)
+
+    def _user_key(self, user_id: str) -> str:
+        return "{}:user:{}".format(self.prefix_, user_id)
+
+    def _room_id_key(self) -> str:
+        return "{}:next_room_id".format(self.prefix_)
+
+    def _rooms_key(self) -> str:
+        return "{}:rooms".format(self.prefix_)
+
+    def _room_users_key(self, room_id: int) -> str:
+        return "{}:room:{}:users".format(self.prefix_, room_id)
+
+    def _room_worker_key(self, room_id: int) -> str:
+        # Pin of the room to a worker, see shard.registry
+        return "{}:room:{}:worker".format(self.prefix_, room_id)
+
+    def _room_ending_key(self, room_id: int) -> str:
+        return "{}:room:{}:ending".format(self.prefix_, room_id)
+
+    def _users_key(self) -> str:
+        return "{}:users".format(self.prefix_)
+
+    def _gc_key(self) -> str:
+        return "{}:gc".format(self.prefix_)
+
+    async def init_room_ids(self):
+        # Ids are not starting from zero so they are harder to guess
+        await self.redis_.set(self._room_id_key(), random.randint(10000, 50000), nx=True)
+
+    async def generate_room_id(self) -> int:
+        return await self.redis_.incr(self._room_id_key())
+
+    async def load_room(self, room_id: int) -> room.RoomData:
+        return (await self._load_versioned_room(room_id))[0]
+
+    async def _load_versioned_room(self, room_id: int) -> typing.Tuple[room.RoomData, bytes, int]:
+        async with self.redis_.pipeline(transaction=True) as pipe:
+            pipe.get(self._room_key(room_id))
+            pipe.get(self._version_key(room_id))
+            pipe.lrange(self._log_key(room_id), 0, -1)
+            data, version, log = await pipe.execute()
+        if data is None:
+            raise KeyError(room_id)
+        return self._replay(data, log), version or b"0", len(log)
+
+    def _replay(self, data: bytes, log: list[bytes]) -> room.RoomData:
+        room_data = room.RoomData.from_bytes(data)
+        for event in log:
+            journal.apply(room_data, codec.decode_event(event))
+        return room_data
+
+    async def load_users_room(self, user_id: str) -> typing.Tuple[int, room.RoomData]:
+        room_id, room_data, _, _ = await self._load_versioned_users_room(user_id)
+        return room_id, room_data
+
+    async def _load_versioned_users_room(self, user_id: str) -> typing.Tuple[int, room.RoomData, bytes, int]:
+        # Keys of the room are known only once the user's room is read, so it takes two round trips
+        room_id = await self.get_users_room(user_id)
+        return room_id, *await self._load_versioned_room(room_id)
+
+    async def store_room(self, room_id: int, room_data: room.RoomData,
+                         users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> None:
+        await self._compare_and_store(room_id, room_data, b"", users)
+
+    async def update_room(self, room_id: int, update: interface.RoomUpdate,
+                          users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> room.RoomData:
+        return await self._update(room_id, update, users, None)
+
+    async def update_users_room(self, user_id: str, update: interface.RoomUpdate,
+                                users: typing.Optional[dict[str, typing.Optional[int]]] = None) -> typing.Tuple[int, room.RoomData]:
+        room_id, room_data, version, log_length = await self._load_versioned_users_room(user_id)
+        return room_id, await self._update(room_id, update, users, (room_data, version, log_length))
+
+    async def _update(self, room_id: int, update: interface.RoomUpdate, users: typing.Optional[dict[str, typing.Optional[int]]],
+                      loaded: typing.Optional[typing.Tuple[room.RoomData, bytes, int]]) -> room.RoomData:
+        async with self.update_locks_.lock(room_id) as contended:
+            if contended:
+                # Whatever was read before waiting is stale by now
+                loaded = None
+
+            for attempt in range(MAX_UPDATE_ATTEMPTS):
+                room_data, version, log_length = loaded or await self._load_versioned_room(room_id)
+                loaded = None
+                room_events = update(room_data)
+                for event in room_events:
+                    journal.apply(room_data, event)
+
+                if log_length + len(room_events) >= self.max_log_length_:
+                    stored = await self._compare_and_store(room_id, room_data, version, users)
+                else:
+                    stored = await self._compare_and_append(room_id, room_events, version, users)
+                if stored:
+                    return room_data
+                await self._backoff(attempt)
+        raise interface.ConflictError(room_id)
+
+    async def _compare_and_append(self, room_id: int, room_events: list[journal.Event], version: bytes,
+                                  users: typing.Optional[dict[str, typing.Optional[int]]]) -> bool:
+        stored = await self.compare_and_append_events_(
+            keys=self._write_keys(room_id, users),
+            args=[*self._write_args(room_id, version, users), *[codec.encode_event(e) for e in room_events]],
+        )
+        return bool(stored)
+
+    async def _compare_and_store(self, room_id: int, room_data: room.RoomData, version: bytes,
+                                 users: typing.Optional[dict[str, typing.Optional[int]]]) -> bool:
+        stored = await self.compare_and_store_room_(
+            keys=self._write_keys(room_id, users),
+            args=[*self._write_args(room_id, version, users), room_data.to_bytes()],
+        )
+        return bool(stored)
+
+    def _write_keys(self, room_id: int, users: typing.Optional[dict[str, typing.Optional[int]]]) -> list[str]:
+        keys = [self._room_key(room_id), self._version_key(room_id), self._log_key(room_id),
+                self._rooms_key(), self._room_ending_key(room_id), self._users_key()]
+        for user_id, users_room_id in (users or {}).items():
+            keys += [self._user_key(user_id), self._room_users_key(room_id if users_room_id is None else users_room_id)]
+        return keys
+
+    def _write_args(self, room_id: int, version: bytes, users: typing.Optional[dict[str, typing.Optional[int]]]) -> list:
+        users = users or {}
+        args = [room_id, version, time.time() + self.idle_ttl_, len(users)]
+        for user_id, users_room_id in users.items():
+            args += [user_id, "" if users_room_id is None else users_room_id]
+        return args
+
+    async def _backoff(self, attempt: int):
+        # Spread retries of concurrent voters so they do not collide again
+        await asyncio.sleep(random.uniform(0, 0.001 * min(attempt + 1, 20)))
+
+    def lock_room(self, room_id: int) -> typing.AsyncContextManager[None]:
+        return self.redis_.lock(self._lock_key(room_id), timeout=self.lock_timeout_)
+
+    async def get_users_room(self, user_id: str) -> int:
+        room_id = await self.redis_.get(self._user_key(user_id))
+        if room_id is None:
+            raise KeyError(user_id)
+        return int(room_id)
+
+    async def assign_users_room(self, user_id: str, room_id: int) -> None:
+        async with self.redis_.pipeline(transaction=True) as pipe:
+            pipe.set(self._user_key(user_id), room_id)
+            pipe.sadd(self._room_users_key(room_id), user_id)
+            pipe.sadd(self._users_key(), user_id)
+            await pipe.execute()
+
+    async def expire_room(self, room_id: int, ttl: float) -> None:
+        await self.expire_room_(keys=[self._rooms_key(), self._room_ending_key(room_id)],
+                                args=[room_id, time.time() + ttl])
+
+    async def delete_room(self, room_id: int) -> None:
+        # Rooms due at zero are only those being deleted right now,
+        # if users join it meanwhile the next collection removes it
+        await self.redis_.zadd(self._rooms_key(), {room_id: 0}, xx=True)
+        await self._collect_room(room_id, 0)
+
+    async def collect_garbage(self, limit: int = 1000) -> list[int]:
+        now = time.time()
+        due = await self.redis_.zrangebyscore(self._rooms_key(), "-inf", now, start=0, num=limit)
+        return [int(room_id) for room_id in due if await self._collect_room(int(room_id), now)]
+
+    async def _collect_room(self, room_id: int, now: float) -> bool:
+        user_ids = [user_id.decode() for user_id in await self.redis_.smembers(self._room_users_key(room_id))]
+        collected = await self.collect_room_(
+            keys=[self._rooms_key(), self._room_key(room_id), self._version_key(room_id), self._log_key(room_id),
+                  self._room_users_key(room_id), self._room_worker_key(room_id), self._room_ending_key(room_id),
+                  self._users_key(), self._gc_key(), *[self._user_key(user_id) for user_id in user_ids]],
+            args=[room_id, now, *user_ids],
+        )
+        return bool(collected)
+
+    async def stats(self) -> interface.StorageStats:
+        async with self.redis_.pipeline(transaction=False) as pipe:
+            pipe.zcard(self._rooms_key())
+            pipe.scard(self._users_key())
+            pipe.hmget(self._gc_key(), "expired_rooms", "reclaimed_bytes")
+            live_rooms, users, (expired_rooms, reclaimed_bytes) = await pipe.execute()
+        return interface.StorageStats(
+            live_rooms=live_rooms,
+            users=users,
+            expired_rooms=int(expired_rooms or 0),
+            reclaimed_bytes=int(reclaimed_bytes or 0),
+        )
+
+    async def close(self) -> None:
+        await self.redis_.aclose()
+
+
+async def get_storage(config: typing.Dict[str, str]) -> interface.StorageInterface:
+    client = redis.Redis(
+        host=config["REDIS_HOST"],
+        port=int(config.get("REDIS_PORT", 6379)),
+        password=config.get("REDIS_PASSWORD"),
+    )
+    storage = RedisStorage(client, config.get("REDIS_PREFIX", "quo"),
+                           idle_ttl=float(config.get("ROOM_IDLE_TTL", ROOM_IDLE_TTL)))
+    await storage.init_room_ids()
+    return storage
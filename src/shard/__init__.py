@@ -0,0 +1,34 @@
+import os
+import socket
+import typing
+
+from service.storage import interface
+
+from . import registry
+from . import storage
+
+
+def get_role(config: typing.Dict[str, str]) -> typing.Optional[str]:
+    """front, worker or None when the bot runs in one process"""
+    role = config.get("SHARD_ROLE", "").lower()
+    if role not in ("", "front", "worker"):
+        raise ValueError("SHARD_ROLE must be front or worker")
+    if role:
+        registry.check_config(config)
+    return role or None
+
+
+async def get_worker_storage(config: typing.Dict[str, str],
+                             st: interface.StorageInterface) -> interface.StorageInterface:
+    worker_id = config.get("SHARD_WORKER_ID") or "{}-{}".format(socket.gethostname(), os.getpid())
+    address = config.get("SHARD_WORKER_URL")
+    if not address:
+        listen = config.get("WEBHOOK_LISTEN", "127.0.0.1")
+        address = "http://{}:{}/{}".format(socket.gethostname() if listen == "0.0.0.0" else listen,
+                                           config.get("WEBHOOK_PORT", 8080),
+                                           config.get("WEBHOOK_PATH", "telegram").strip("/"))
+
+    workers = registry.get_registry(config)
+    await workers.register(worker_id, address)
+    await workers.refresh()
+    return storage.ShardedStorage(st, workers, worker_id)
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import logging
+import secrets
+import signal
+import typing
+
+import httpx
+import telegram
+from aiohttp import web
+
+from bot import webhook
+from service.storage import locks
+
+from . import registry
+from . import ring
+
+
+__all__ = ["Front", "run"]
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 2
+MAX_FORWARD_ATTEMPTS = 3
+
+
+class Front:
+    """Receives all updates and forwards each one to the worker owning the room of its user"""
+
+    def __init__(self, workers: registry.WorkerRegistry, secret_token: str, http: httpx.AsyncClient):
+        self.workers_ = workers
+        self.secret_token_ = secret_token
+        self.http_ = http
+        # Updates of one chat are forwarded one by one, so the worker gets them in order
+        self.chats_ = locks.RoomLocks()
+
+    async def dispatch(self, data: dict) -> bool:
+        update = telegram.Update.de_json(data, None)
+        chat = update.effective_chat or update.effective_user
+        user_id = str(chat.id) if chat is not None else None
+
+        # Those joining a room send its id, the room worker should get it
+        text = update.effective_message.text if update.effective_message else None
+        room_id = int(text) if text and text.strip().isdigit() else None
+
+        async with self.chats_.lock(user_id or update.update_id):
+            for attempt in range(MAX_FORWARD_ATTEMPTS):
+                try:
+                    if user_id is not None:
+                        worker_id = await self.workers_.route(user_id, room_id)
+                    else:
+                        worker_id = self.workers_.ring.owner(ring.user_key(str(update.update_id)))
+                    response = await self.http_.post(self.workers_.address(worker_id), json=data,
+                                                     headers={webhook.SECRET_HEADER: self.secret_token_})
+                    response.raise_for_status()
+                    return True
+                except (httpx.HTTPError, LookupError):
+                    logger.warning("shard: failed to forward update %s", update.update_id, exc_info=True)
+                    await asyncio.sleep(0.1 * (attempt + 1))
+                    await self.workers_.refresh()
+
+        logger.error("shard: update %s is dropped", update.update_id)
+        return False
+
+    async def refresh(self):
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            try:
+                await self.workers_.refresh()
+            except Exception:
+                logger.exception("shard: failed to refresh workers")
+
+    async def update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(webhook.SECRET_HEADER, ""), self.secret_token_):
+            return web.Response(status=403)
+        await self.dispatch(await request.json())
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        workers = sorted(self.workers_.ring.workers)
+        return web.json_response({"workers": workers}, status=200 if workers else 503)
+
+    async def poll(self, bot: telegram.Bot):
+        await bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=telegram.Update.ALL_TYPES)
+            except telegram.error.TelegramError:
+                logger.warning("shard: failed to get updates", exc_info=True)
+                await asyncio.sleep(1)
+                continue
+            if updates:
+                offset = updates[-1].update_id + 1
+                await asyncio.gather(*[self.dispatch(u.to_dict()) for u in updates])
+
+
+async def serve(config: typing.Dict[str, str], stop: asyncio.Event) -> None:
+    settings = webhook.get_settings(config)  # None when the front polls Telegram
+    secret_token = config["WEBHOOK_SECRET"]
+    workers = registry.get_registry(config)
+    await workers.refresh()
+
+    bot = telegram.Bot(config["BOT_TOKEN"])
+    async with bot, httpx.AsyncClient(timeout=10) as http:
+        front = Front(workers, secret_token, http)
+        web_app = web.Application()
+        web_app.add_routes([web.get("/healthz", front.health)])
+        if settings is not None:
+            web_app.add_routes([web.post("/" + settings["path"], front.update)])
+        runner = web.AppRunner(web_app, access_log=None)
+        await runner.setup()
+
+        tasks = [asyncio.create_task(front.refresh())]
+        try:
+            await web.TCPSite(runner, config.get("WEBHOOK_LISTEN", "127.0.0.1"),
+                              int(config.get("WEBHOOK_PORT", 8080))).start()
+            if settings is not None:
+                await bot.set_webhook(url="{}/{}".format(settings["url"], settings["path"]), secret_token=secret_token,
+                                      allowed_updates=telegram.Update.ALL_TYPES)
+            else:
+                tasks.append(asyncio.create_task(front.poll(bot)))
+            logger.info("shard: front is running with workers %s", sorted(workers.ring.workers))
+
+            await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await runner.cleanup()
+            await workers.close()
+
+
+def run(config: typing.Dict[str, str]) -> None:
+    """Blocks until SIGINT or SIGTERM"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    loop.run_until_complete(serve(config, stop))
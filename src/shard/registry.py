@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import logging
+import typing
+
+import redis.asyncio as redis
+
+from . import ring as hash_ring
+
+
+__all__ = ["WorkerRegistry", "get_registry"]
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TTL = 15
+
+
+class WorkerRegistry:
+    """Workers and the rooms pinned to them, shared through redis.
+
+    Every worker keeps its address in {prefix}:workers while its heartbeat key lives.
+    A room is pinned to the worker which created it, so rooms stay where they are when
+    workers are added and the ring changes; only new rooms and users without a room follow
+    the new ring. Pins are removed together with the room.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str = "quo"):
+        self.redis_ = client
+        self.prefix_ = prefix
+        self.ring_ = hash_ring.HashRing()
+        self.addresses_: dict[str, str] = dict()
+        self.heartbeat_: typing.Optional[asyncio.Task] = None
+
+    def _workers_key(self) -> str:
+        return "{}:workers".format(self.prefix_)
+
+    def _alive_key(self, worker_id: str) -> str:
+        return "{}:worker:{}:alive".format(self.prefix_, worker_id)
+
+    def _user_key(self, user_id: str) -> str:
+        # Room of the user, see service.storage.redis_storage
+        return "{}:user:{}".format(self.prefix_, user_id)
+
+    def _pin_key(self, room_id: int) -> str:
+        return "{}:room:{}:worker".format(self.prefix_, room_id)
+
+    @property
+    def ring(self) -> hash_ring.HashRing:
+        return self.ring_
+
+    def address(self, worker_id: str) -> str:
+        return self.addresses_[worker_id]
+
+    async def register(self, worker_id: str, address: str):
+        await self._beat(worker_id, address)
+        self.heartbeat_ = asyncio.create_task(self._heartbeat(worker_id, address))
+
+    async def _beat(self, worker_id: str, address: str):
+        async with self.redis_.pipeline(transaction=True) as pipe:
+            pipe.hset(self._workers_key(), worker_id, address)
+            pipe.set(self._alive_key(worker_id), 1, ex=HEARTBEAT_TTL)
+            await pipe.execute()
+
+    async def _heartbeat(self, worker_id: str, address: str):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self._beat(worker_id, address)
+                await self.refresh()
+            except Exception:
+                logger.exception("shard: heartbeat of %s failed", worker_id)
+
+    async def unregister(self, worker_id: str):
+        if self.heartbeat_ is not None:
+            self.heartbeat_.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.heartbeat_
+            self.heartbeat_ = None
+        async with self.redis_.pipeline(transaction=True) as pipe:
+            pipe.hdel(self._workers_key(), worker_id)
+            pipe.delete(self._alive_key(worker_id))
+            await pipe.execute()
+
+    async def refresh(self) -> hash_ring.HashRing:
+        """Reads live workers and rebuilds the ring if they changed"""
+        addresses = {
+            worker_id.decode(): address.decode()
+            for worker_id, address in (await self.redis_.hgetall(self._workers_key())).items()
+        }
+        alive = await self.redis_.mget([self._alive_key(worker_id) for worker_id in addresses]) if addresses else []
+        dead = [worker_id for worker_id, beat in zip(addresses, alive) if beat is None]
+        if dead:
+            await self.redis_.hdel(self._workers_key(), *dead)
+            for worker_id in dead:
+                del addresses[worker_id]
+
+        self.addresses_ = addresses
+        if set(addresses) != self.ring_.workers:
+            logger.info("shard: workers changed to %s", sorted(addresses))
+            self.ring_ = hash_ring.HashRing(addresses)
+        return self.ring_
+
+    async def pin_room(self, room_id: int, worker_id: str):
+        await self.redis_.set(self._pin_key(room_id), worker_id)
+
+    async def route(self, user_id: str, room_id: typing.Optional[int] = None) -> str:
+        """Worker owning the room of the user, or room_id if the user has none, or the user itself"""
+        # The pin key depends on the room read first, a script would have to build it from
+        # the prefix and Redis Cluster can't route such keys
+        users_room_id = await self.redis_.get(self._user_key(user_id))
+        if users_room_id is not None:
+            room_id = int(users_room_id)
+        elif room_id is None:
+            return self.ring_.owner(hash_ring.user_key(user_id))
+
+        pinned = await self.redis_.get(self._pin_key(room_id))
+        if pinned is not None and pinned.decode() in self.addresses_:
+            return pinned.decode()
+        # Workers of pinned rooms may be gone, any worker can serve them from the shared storage
+        return self.ring_.owner(hash_ring.room_key(room_id))
+
+    async def close(self):
+        await self.redis_.aclose()
+
+
+def check_config(config: typing.Dict[str, str]):
+    # Workers share rooms and find each other through redis, the memory backend can't do that
+    if not config.get("REDIS_HOST"):
+        raise ValueError("Sharding needs the redis backend, set REDIS_HOST")
+
+
+def get_registry(config: typing.Dict[str, str]) -> WorkerRegistry:
+    check_config(config)
+    client = redis.Redis(
+        host=config["REDIS_HOST"],
+        port=int(config.get("REDIS_PORT", 6379)),
+        password=config.get("REDIS_PASSWORD"),
+    )
+    return WorkerRegistry(client, config.get("REDIS_PREFIX", "quo"))
@@ -0,0 +1,45 @@
+import bisect
+import hashlib
+import typing
+
+
+VIRTUAL_NODES = 64  # points per worker, evens out the share of keys every worker gets
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def room_key(room_id: int) -> str:
+    return "room:{}".format(room_id)
+
+
+def user_key(user_id: str) -> str:
+    return "user:{}".format(user_id)
+
+
+class HashRing:
+    """Consistent hashing of keys to workers.
+
+    Adding or removing a worker moves only the keys of its neighbours on the ring,
+    about 1/N of all keys, the rest keep their worker.
+    """
+
+    def __init__(self, workers: typing.Iterable[str] = (), virtual_nodes: int = VIRTUAL_NODES):
+        self.workers = frozenset(workers)
+        points = sorted(
+            (_hash("{}#{}".format(worker, i)), worker)
+            for worker in self.workers
+            for i in range(virtual_nodes)
+        )
+        self.hashes_ = [h for h, _ in points]
+        self.owners_ = [worker for _, worker in points]
+
+    def __bool__(self) -> bool:
+        return bool(self.workers)
+
+    def owner(self, key: str) -> str:
+        if not self.owners_:
+            raise LookupError("no workers")
+        i = bisect.bisect(self.hashes_, _hash(key)) % len(self.hashes_)
+        return self.owners_[i]
@@ -0,0 +1,43 @@
+import logging
+import typing
+
+from service.storage import interface
+
+from . import registry
+from . import ring
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedStorage:
+    """Storage of a worker: rooms it creates hash to it and are pinned to it.
+
+    Everything besides generate_room_id and close goes straight to the wrapped storage.
+    """
+
+    def __init__(self, storage: interface.StorageInterface, workers: registry.WorkerRegistry, worker_id: str):
+        self.storage_ = storage
+        self.workers_ = workers
+        self.worker_id_ = worker_id
+
+    def __getattr__(self, name: str):
+        return getattr(self.storage_, name)
+
+    async def generate_room_id(self) -> int:
+        workers = self.workers_.ring
+        # Every worker owns about 1/N of ids, so a few attempts are enough
+        for _ in range(max(len(workers.workers), 1) * 16):
+            room_id = await self.storage_.generate_room_id()
+            if not workers or workers.owner(ring.room_key(room_id)) == self.worker_id_:
+                break
+        else:
+            logger.warning("shard: room %s does not hash to %s, pinning it anyway", room_id, self.worker_id_)
+
+        await self.workers_.pin_room(room_id, self.worker_id_)
+        return room_id
+
+    async def close(self) -> None:
+        await self.workers_.unregister(self.worker_id_)
+        await self.workers_.close()
+        await self.storage_.close()
@@ -0,0 +1,29 @@
+import pytest
+
+from service.storage import memory
+from service.storage import redis_storage
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    return fakeredis.FakeRedis(server=pytest.importorskip("fakeredis").FakeServer())
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def room_storage(request):
+    """Every storage backend, tests using it check both behave the same"""
+    if request.param == "memory":
+        yield memory.MemoryStorage()
+        return
+
+    client = request.getfixturevalue("redis_client")
+    storage = redis_storage.RedisStorage(client)
+    await storage.init_room_ids()
+    yield storage
+    await client.aclose()
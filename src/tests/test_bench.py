@@ -0,0 +1,41 @@
+import pytest
+
+from bench import scenarios
+from bench import synthetic
+from providers import interface as providers
+from service import ordering
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_synthetic_provider_pages_entries():
+    provider = synthetic.SyntheticProvider(25, page_size=10)
+    params = providers.ProviderParams(filters={}, exclude_names=[])
+
+    pages = [page async for page in provider.iter_entries(params)]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert await provider.get_entries(params) == [e for page in pages for e in page]
+
+
+def test_summary_is_in_milliseconds():
+    summary = scenarios.summarize([0.001 * i for i in range(1, 101)])
+    assert summary["p50_ms"] == pytest.approx(51)
+    assert summary["max_ms"] == pytest.approx(100)
+    assert scenarios.summarize([]) == {}
+
+
+@pytest.mark.parametrize("option_ordering", ordering.ORDERINGS)
+async def test_voting_scenario_ends_with_a_match(option_ordering: str):
+    result = await scenarios.voting({}, 3, 50, 10000, liked_share=0.1, like_probability=0.3,
+                                    option_ordering=option_ordering)
+
+    assert result["matched"]
+    assert not result["no_match"]
+    assert result["votes"] <= 3 * 50
+    assert set(result["vote"]) == {"mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}
+
+
+async def test_memory_scenario_measures_started_rooms():
+    result = await scenarios.memory({}, 2, 3, 30)
+    assert result["heap_bytes_per_room"] > 0
+    assert result["serialized_bytes_per_room"] > 0
@@ -0,0 +1,87 @@
+import asyncio
+import typing
+
+import pytest
+
+from models import entry
+from providers import cache
+from providers import interface as providers
+
+pytestmark = pytest.mark.anyio
+
+KIND = providers.ProviderKind.KINOPOISK
+
+
+def _params(**filters) -> providers.ProviderParams:
+    return providers.ProviderParams(filters=filters, exclude_names=[])
+
+
+class CountingProvider(providers.ProviderInterface):
+    """Every request returns entries named after its number, pages after the first are released by the test"""
+
+    def __init__(self, pages: int = 1):
+        self.requests_ = 0
+        self.pages_ = pages
+        self.release_ = asyncio.Event()
+        self.release_.set()
+        self.cancelled_ = 0
+
+    async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        self.requests_ += 1
+        request = self.requests_
+        try:
+            for page in range(self.pages_):
+                if page:
+                    await self.release_.wait()
+                yield [entry.ProviderEntry("request {} page {}".format(request, page))]
+        except asyncio.CancelledError:
+            self.cancelled_ += 1
+            raise
+
+
+async def test_cache_serves_fresh_entries_copied():
+    provider = CountingProvider()
+    caching = cache.CachingProvider(KIND, provider, cache.ProviderCache(10), ttl=60, stale_ttl=0)
+
+    first = await caching.get_entries(_params(year=2024))
+    first[0].name = "changed by the caller"
+    second = await caching.get_entries(_params(year=2024))
+
+    assert provider.requests_ == 1
+    assert second[0].name == "request 1 page 0"
+    assert caching.cache_.stats()["hits"] == 1
+
+
+async def test_cache_serves_stale_entries_while_refreshing():
+    provider = CountingProvider()
+    caching = cache.CachingProvider(KIND, provider, cache.ProviderCache(10), ttl=0, stale_ttl=60)
+
+    await caching.get_entries(_params())
+    stale = await caching.get_entries(_params())
+    assert stale[0].name == "request 1 page 0"
+    await asyncio.gather(*caching.refreshing_.values())
+
+    refreshed = await caching.get_entries(_params())
+    assert refreshed[0].name == "request 2 page 0"
+    stats = caching.cache_.stats()
+    assert (stats["stale_hits"], stats["refreshes"]) == (2, 1)
+    await caching.close()
+
+
+def test_cache_evicts_least_recently_used():
+    provider_cache = cache.ProviderCache(2)
+    provider_cache.put("a", [])
+    provider_cache.put("b", [])
+    provider_cache.get("a")
+    provider_cache.put("c", [])
+
+    assert list(provider_cache.items_) == ["a", "c"]
+    assert provider_cache.stats()["evictions"] == 1
+
+
+def test_cache_key_ignores_filter_order():
+    assert cache.cache_key(KIND, _params(year=2024, month="MAY")) == cache.cache_key(KIND, _params(month="MAY", year=2024))
+    assert cache.cache_key(KIND, _params(year=2024)) != cache.cache_key(KIND, _params(year=2023))
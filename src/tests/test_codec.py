@@ -0,0 +1,55 @@
+import msgpack
+import pytest
+
+from models import entry
+from models import room
+from service import journal
+from service import ordering
+from service.storage import codec
+
+
+def _room() -> room.RoomData:
+    room_data = room.RoomData(owner="a", params=room.RoomParams("kinopoisk", {"year": 2024}),
+                              ordering=ordering.ADAPTIVE)
+    for user_id in ("a", "b"):
+        journal.apply(room_data, journal.join(user_id))
+    options = [entry.ProviderEntry("option {}".format(i), "descr", 0.5, 100, "http://x/{}.jpg".format(i))
+               for i in range(3)]
+    journal.apply(room_data, journal.start(options, room_data.participants))
+    journal.apply(room_data, journal.vote(room_data, "a", True))
+    return room_data
+
+
+def test_room_round_trip():
+    room_data = _room()
+    # Masks of rooms with more than 64 participants don't fit msgpack ints
+    room_data.options_likes[1] = 1 << 100
+
+    data = room_data.to_bytes()
+    assert msgpack.unpackb(data)[0] == room.FORMAT_VERSION
+    assert room.RoomData.from_bytes(data) == room_data
+
+
+def test_room_of_another_version_is_rejected():
+    fields = msgpack.unpackb(_room().to_bytes(), raw=False, strict_map_key=False)
+    fields[0] = room.FORMAT_VERSION - 1
+
+    with pytest.raises(ValueError):
+        room.RoomData.from_bytes(msgpack.packb(fields, use_bin_type=True))
+
+
+@pytest.mark.parametrize("event", [
+    journal.join("a"),
+    journal.start([entry.ProviderEntry("option")], ["a", "b"]),
+    journal.append_options([entry.ProviderEntry("option", rating=0.1)]),
+    journal.Event(journal.EventKind.VOTE, user_id="a", liked=True, option=3),
+    journal.set_filters({"year": 2024, "month": "MAY"}),
+    journal.reset_match(),
+])
+def test_event_round_trip(event: journal.Event):
+    assert codec.decode_event(codec.encode_event(event)) == event
+
+
+def test_event_logged_before_filters_is_decoded():
+    data = msgpack.packb([int(journal.EventKind.SKIP), "a", False, None, None, 2], use_bin_type=True)
+    assert codec.decode_event(data) == journal.Event(journal.EventKind.SKIP, user_id="a", option=2)
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+import redis.asyncio as redis
+
+from models import entry
+from models import room
+from providers import interface as providers
+from service import service
+from service.events import interface as events
+from service.events import memory
+from service.events import redis_events
+from service.storage import memory as memory_storage
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_subscribers_get_events_of_their_room_only():
+    bus = memory.MemoryEventBus()
+    async with bus.subscribe(1) as first, bus.subscribe(2) as second:
+        await bus.publish(events.RoomEvent(kind=events.RoomEventKind.JOIN, room_id=2, user_id="a"))
+        await bus.publish(events.RoomEvent(kind=events.RoomEventKind.START, room_id=1, user_id="a"))
+
+        assert (await anext(first))["kind"] == events.RoomEventKind.START
+        assert (await anext(second))["kind"] == events.RoomEventKind.JOIN
+    assert not bus.has_subscribers(1)
+
+
+async def test_failed_subscribers_get_the_error():
+    bus = memory.MemoryEventBus()
+    async with bus.subscribe(1) as room_events:
+        bus.fail_all(events.EventsLost())
+        with pytest.raises(events.EventsLost):
+            await anext(room_events)
+
+
+async def test_waiters_look_at_the_room_again_after_redis_reconnects(redis_client, monkeypatch):
+    monkeypatch.setattr(redis_events, "RECONNECT_DELAY", 0.05)
+    bus = redis_events.RedisEventBus(redis_client)
+
+    # The first subscription breaks as if redis was restarted
+    broken = asyncio.Event()
+    dispatch = bus._dispatch
+
+    async def break_once():
+        if not broken.is_set():
+            await broken.wait()
+            raise redis.ConnectionError("redis is restarting")
+        await dispatch()
+
+    monkeypatch.setattr(bus, "_dispatch", break_once)
+    room_service = service.Service(memory_storage.MemoryStorage(), {providers.ProviderKind.CUSTOM: None}, bus)
+    await room_service.create_room("a", room.RoomParams(providers.ProviderKind.CUSTOM))
+    await room_service.add_entry("a", entry.ProviderEntry("option"))
+    waiting = asyncio.create_task(room_service.wait_start("a"))
+    await asyncio.sleep(0.01)
+
+    broken.set()
+    await asyncio.sleep(0.01)
+    # Published while nobody is subscribed
+    await room_service.start_vote("a")
+
+    await asyncio.wait_for(waiting, 1)
+    assert not bus.reader_.done()
+    await room_service.close()
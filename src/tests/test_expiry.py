@@ -0,0 +1,39 @@
+from service.storage import expiry
+
+
+def test_expiry_queue_pops_in_deadline_order():
+    queue = expiry.ExpiryQueue()
+    queue.schedule("a", 3)
+    queue.schedule("b", 1)
+    queue.schedule("c", 2)
+    queue.schedule("b", 5)  # touched, moves later
+    queue.schedule("c", 0.5)  # moves earlier
+    queue.remove("a")
+
+    assert queue.pop_expired(2) == ["c"]
+    assert queue.pop_expired(4) == []
+    assert len(queue) == 1
+    assert queue.pop_expired(10) == ["b"]
+    assert len(queue) == 0
+
+
+def test_expiry_queue_keeps_one_entry_per_touched_key():
+    queue = expiry.ExpiryQueue()
+    for deadline in range(1, 1000):
+        queue.schedule("a", deadline)
+
+    assert len(queue.heap_) == 1
+    assert queue.pop_expired(500, limit=10) == []
+    assert queue.pop_expired(1000) == ["a"]
+
+
+def test_expiry_queue_keeps_the_earlier_deadline_when_asked():
+    queue = expiry.ExpiryQueue()
+    queue.schedule("a", 2)
+    queue.schedule("a", 5, only_earlier=True)
+    assert queue.pop_expired(3) == ["a"]
+
+    queue.schedule("b", 5)
+    queue.schedule("b", 1, only_earlier=True)
+    queue.schedule("c", 4, only_earlier=True)  # nothing to keep
+    assert queue.pop_expired(4) == ["b", "c"]
@@ -0,0 +1,29 @@
+import pytest
+
+from providers import filters
+from providers import interface as providers
+
+KIND = providers.ProviderKind.KINOPOISK
+
+
+def test_filters_are_normalized():
+    assert filters.validate(KIND, {"year": "2024", "month": " may "}) == {"year": 2024, "month": "MAY"}
+    assert filters.validate(providers.ProviderKind.RESTAURANTS, {"bbox": "55.5,37.3,56,38"}) == \
+        {"bbox": "55.5,37.3,56.0,38.0"}
+    assert filters.validate(providers.ProviderKind.CUSTOM, {}) == {}
+
+
+@pytest.mark.parametrize("kind, room_filters", [
+    (KIND, {"colour": "red"}),
+    (KIND, {"year": 1800}),
+    (KIND, {"year": True}),
+    (KIND, {"month": "SMARCH"}),
+    (KIND, {"month": "MAY", "genre": 1}),
+    (providers.ProviderKind.RESTAURANTS, {"area": "Moscow\"]; out;"}),
+    (providers.ProviderKind.RESTAURANTS, {"bbox": "56,37,55,38"}),
+    (providers.ProviderKind.RESTAURANTS, {"area": "Moscow", "bbox": "55,37,56,38"}),
+    (providers.ProviderKind.CITY, {"limit": 0}),
+])
+def test_bad_filters_are_rejected(kind: providers.ProviderKind, room_filters: dict):
+    with pytest.raises(filters.FilterError):
+        filters.validate(kind, room_filters)
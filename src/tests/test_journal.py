@@ -0,0 +1,196 @@
+import copy
+import random
+
+import pytest
+
+from models import entry
+from models import room
+from service import journal
+from service import ordering
+
+
+def _options(first: int, count: int) -> list[entry.ProviderEntry]:
+    return [entry.ProviderEntry("option {}".format(i)) for i in range(first, first + count)]
+
+
+def _started_room(users: list[str], options_count: int, room_ordering: str = ordering.SHUFFLED) -> room.RoomData:
+    room_data = room.RoomData(owner=users[0], params=room.RoomParams("kinopoisk"), ordering=room_ordering)
+    for user_id in users:
+        journal.apply(room_data, journal.join(user_id))
+    journal.apply(room_data, journal.start(_options(0, options_count), users))
+    return room_data
+
+
+def _vote(room_data: room.RoomData, user_id: str, is_liked: bool) -> int:
+    option_index = journal.current_option_index(room_data, user_id)
+    journal.apply(room_data, journal.vote(room_data, user_id, is_liked))
+    return option_index
+
+
+@pytest.mark.parametrize("room_ordering", ordering.ORDERINGS)
+@pytest.mark.parametrize("run", range(30))
+def test_options_appended_mid_vote_are_seen_once(run: int, room_ordering: str):
+    rng = random.Random(run)
+    users = ["a", "b", "c"]
+    room_data = _started_room(users, 7, room_ordering)
+    pages = [5, 10, 8]  # 7 + 23 options, the first chunk is filled up by the first page
+    seen = {user_id: [] for user_id in users}
+
+    # One of them is 4 options in when the rest starts coming
+    for _ in range(4):
+        seen["a"].append(_vote(room_data, "a", True))
+    while pages or any(journal.current_option_index(room_data, user_id) is not None for user_id in users):
+        if pages and rng.random() < 0.2:
+            journal.apply(room_data, journal.append_options(_options(len(room_data.options), pages.pop(0))))
+            continue
+        user_id = rng.choice(users)
+        if journal.current_option_index(room_data, user_id) is not None:
+            seen[user_id].append(_vote(room_data, user_id, True))
+
+    for user_id in users:
+        assert sorted(seen[user_id]) == list(range(30))
+
+
+def test_no_match_after_options_appended_mid_vote():
+    users = ["a", "b"]
+    room_data = _started_room(users, 7)
+    for _ in range(4):
+        _vote(room_data, "a", False)
+    journal.apply(room_data, journal.append_options(_options(7, 23)))
+
+    while journal.match_possible(room_data):
+        voters = [user_id for user_id in users if journal.current_option_index(room_data, user_id) is not None]
+        assert voters, "everyone is done while a match is still possible"
+        _vote(room_data, voters[0], False)
+    assert room_data.options_dead == 30
+
+
+def test_option_at_keeps_chunks_when_options_are_appended():
+    seed = ordering.new_seed()
+    order = [ordering.option_at(seed, position) for position in range(ordering.positions_count(25))]
+
+    assert ordering.positions_count(25) == 30
+    for chunk in range(3):
+        start = chunk * ordering.CHUNK_SIZE
+        assert sorted(order[start:start + ordering.CHUNK_SIZE]) == list(range(start, start + ordering.CHUNK_SIZE))
+    assert order == [ordering.option_at(seed, position) for position in range(30)]
+
+
+def test_votes_are_participant_bitmasks():
+    room_data = _started_room(["a", "b", "c"], 3, ordering.ADAPTIVE)
+    a, b = 1 << room_data.participants_indexes["a"], 1 << room_data.participants_indexes["b"]
+
+    liked = _vote(room_data, "a", True)
+    assert room_data.options_likes[liked] == a
+    journal.apply(room_data, journal.leave("c"))
+    disliked = _vote(room_data, "b", False)
+
+    assert room_data.participants_mask == a | b
+    assert room_data.options_dislikes[disliked] == b
+    assert room_data.options_dead == 1
+    assert journal.match_possible(room_data)
+
+
+@pytest.mark.parametrize("room_ordering", ordering.ORDERINGS)
+def test_replaying_events_gives_the_same_room(room_ordering: str):
+    rng = random.Random(1)
+    users = ["a", "b", "c"]
+    base = room.RoomData(owner="a", params=room.RoomParams("kinopoisk"), ordering=room_ordering)
+    events = [journal.join(user_id) for user_id in users] + [journal.start(_options(0, 7), users)]
+    room_data = copy.deepcopy(base)
+    for event in events:
+        journal.apply(room_data, event)
+
+    appended = 7
+    for _ in range(60):
+        user_id = rng.choice(users)
+        if appended < 25 and rng.random() < 0.1:
+            event = journal.append_options(_options(appended, 6))
+            appended += 6
+        elif journal.current_option_index(room_data, user_id) is None:
+            continue
+        elif journal.current_option_dead(room_data, user_id):
+            event = journal.skip(room_data, user_id)
+        else:
+            event = journal.vote(room_data, user_id, rng.random() < 0.7)
+        journal.apply(room_data, event)
+        events.append(event)
+
+    replayed = copy.deepcopy(base)
+    for event in events:
+        journal.apply(replayed, event)
+    assert replayed == room_data
+
+
+def test_match_once_everyone_likes_an_option():
+    room_data = _started_room(["a", "b"], 3, ordering.ADAPTIVE)
+    option_index = _vote(room_data, "a", True)
+    # Adaptive orders show options others have liked first
+    assert journal.current_option_index(room_data, "b") == option_index
+
+    _vote(room_data, "b", True)
+    assert room_data.match == room_data.options[option_index]
+
+
+def test_disliked_options_are_skipped_by_everyone():
+    room_data = _started_room(["a", "b"], 20)
+    disliked = {_vote(room_data, "a", False) for _ in range(5)}
+
+    seen = set()
+    while journal.current_option_index(room_data, "b") is not None:
+        # Their first option was chosen before anything was disliked, the service skips it then
+        if journal.current_option_dead(room_data, "b"):
+            journal.apply(room_data, journal.skip(room_data, "b"))
+            continue
+        seen.add(_vote(room_data, "b", True))
+    assert seen == set(range(20)) - disliked
+
+
+def test_leaving_revives_options_only_they_disliked():
+    room_data = _started_room(["a", "b", "c"], 10)
+    disliked = _vote(room_data, "c", False)
+    while journal.current_option_index(room_data, "a") is not None:
+        if journal.current_option_dead(room_data, "a"):
+            journal.apply(room_data, journal.skip(room_data, "a"))
+            continue
+        _vote(room_data, "a", False)
+    assert room_data.options_dead == 10
+
+    journal.apply(room_data, journal.leave("c"))
+    assert room_data.options_dead == 9
+    # a never saw it and gets it now, b gets it on the way
+    assert journal.current_option_index(room_data, "a") == disliked
+    assert disliked in journal.upcoming_option_indexes(room_data, "b", 10) + \
+        [journal.current_option_index(room_data, "b")]
+
+
+def test_unvoted_options_are_tracked_through_votes_and_leaving():
+    rng = random.Random(3)
+    users = ["a", "b", "c"]
+    room_data = _started_room(users, 40, ordering.ADAPTIVE)
+
+    def first_unvoted() -> int:
+        everyone = room_data.participants_mask
+        return next((i for i, (likes, dislikes) in enumerate(zip(room_data.options_likes, room_data.options_dislikes))
+                     if not (likes | dislikes) & everyone), len(room_data.options))
+
+    for step in range(90):
+        if step == 60:
+            journal.apply(room_data, journal.leave("c"))
+            users.remove("c")
+        user_id = rng.choice(users)
+        if journal.current_option_index(room_data, user_id) is not None and room_data.match is None:
+            _vote(room_data, user_id, rng.random() < 0.2)
+        assert room_data.options_unvoted == first_unvoted()
+
+
+@pytest.mark.parametrize("room_ordering", ordering.ORDERINGS)
+def test_leaving_matches_an_option_everyone_left_likes(room_ordering: str):
+    room_data = _started_room(["a", "b", "c"], 5, room_ordering)
+    for user_id in ("a", "b"):
+        while journal.current_option_index(room_data, user_id) is not None:
+            _vote(room_data, user_id, True)
+    assert room_data.match is None
+
+    journal.apply(room_data, journal.leave("c"))
+    assert room_data.match == room_data.options[0]
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+import telegram
+
+from bot.pictures import memory
+from bot.pictures import sender
+
+pytestmark = pytest.mark.anyio
+
+
+class UploadingBot:
+    def __init__(self):
+        self.running_ = 0
+        self.most_running_ = 0
+        self.uploads_ = 0
+
+    async def send_photo(self, chat_id, photo, **kwargs) -> telegram.Message:
+        self.running_ += 1
+        self.most_running_ = max(self.most_running_, self.running_)
+        await asyncio.sleep(0.01)
+        self.running_ -= 1
+        self.uploads_ += 1
+        return telegram.Message(self.uploads_, None, telegram.Chat(1, "private"),
+                                photo=(telegram.PhotoSize("id:" + photo, photo, 9, 9),))
+
+    async def delete_message(self, chat_id, message_id):
+        pass
+
+
+async def test_uploads_in_advance_are_bounded():
+    bot = UploadingBot()
+    pictures = sender.Pictures(memory.MemoryFileIdCache(100), upload_chat_id="-1", upload_rate=1000, max_uploads=5)
+
+    pictures.preload(bot, ["http://x/{}".format(i) for i in range(20)])
+    pictures.preload(bot, ["http://x/0"])
+    assert len(pictures.uploading_) == 5
+    await asyncio.gather(*pictures.uploading_.values())
+
+    assert bot.uploads_ == 5
+    assert bot.most_running_ == sender.UPLOAD_CONCURRENCY
+    assert await pictures.file_id("http://x/4") == "id:http://x/4"
+    await pictures.close()
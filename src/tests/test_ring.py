@@ -0,0 +1,30 @@
+import collections
+
+import pytest
+
+from shard import ring
+
+
+def test_keys_are_spread_over_workers():
+    hash_ring = ring.HashRing(["w1", "w2", "w3", "w4"])
+    owners = collections.Counter(hash_ring.owner(ring.room_key(room_id)) for room_id in range(10000))
+
+    assert set(owners) == {"w1", "w2", "w3", "w4"}
+    assert min(owners.values()) > 1500
+
+
+def test_new_worker_takes_keys_only_from_others():
+    before = ring.HashRing(["w1", "w2", "w3"])
+    after = ring.HashRing(["w1", "w2", "w3", "w4"])
+    keys = [ring.user_key(str(user_id)) for user_id in range(10000)]
+
+    moved = [key for key in keys if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == "w4" for key in moved)
+    assert len(moved) < len(keys) / 3
+
+
+def test_empty_ring_has_no_owners():
+    hash_ring = ring.HashRing()
+    assert not hash_ring
+    with pytest.raises(LookupError):
+        hash_ring.owner(ring.room_key(1))
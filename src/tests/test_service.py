@@ -0,0 +1,230 @@
+import asyncio
+import typing
+
+import prometheus_client
+import pytest
+
+from models import entry
+from models import room
+from providers import interface as providers
+from service import interface
+from service import journal
+from service import service
+from service.storage import interface as storage
+from service.storage import redis_storage
+
+from .test_cache import CountingProvider
+
+pytestmark = pytest.mark.anyio
+
+PARAMS = room.RoomParams(providers.ProviderKind.KINOPOISK)
+
+
+class PagedProvider(providers.ProviderInterface):
+    def __init__(self, pages: list[int]):
+        self.pages_ = pages
+
+    async def get_entries(self, params: providers.ProviderParams) -> list[entry.ProviderEntry]:
+        return await providers.collect_entries(self.iter_entries(params))
+
+    async def iter_entries(self, params: providers.ProviderParams) -> typing.AsyncIterator[list[entry.ProviderEntry]]:
+        first = 0
+        for size in self.pages_:
+            yield [entry.ProviderEntry("option {}".format(i)) for i in range(first, first + size)]
+            first += size
+            await asyncio.sleep(0.01)
+
+
+async def _vote_until_done(room_service: service.Service, user_id: str, streaming: asyncio.Task) -> list[str]:
+    seen = []
+    while True:
+        option, _ = await room_service.current_option(user_id)
+        if option is None:
+            if streaming.done():
+                return seen
+            await asyncio.sleep(0.005)
+            continue
+        try:
+            await room_service.vote(user_id, True)
+        except storage.ConflictError:
+            continue
+        seen.append(option.name)
+
+
+async def _start_room(room_service: service.Service, users: list[str]) -> int:
+    room_id = await room_service.create_room(users[0], PARAMS)
+    for user_id in users[1:]:
+        await room_service.join_room(user_id, room_id)
+    await room_service.start_vote(users[0])
+    return room_id
+
+
+async def test_pages_appended_while_everyone_votes(room_storage):
+    users = ["a", "b", "c"]
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([7, 5, 10, 8])})
+    room_id = await _start_room(room_service, users)
+
+    streaming = room_service.streaming_[room_id]
+    seen = await asyncio.gather(*(_vote_until_done(room_service, user_id, streaming) for user_id in users))
+
+    room_data = await room_storage.load_room(room_id)
+    assert len(room_data.options) == 30
+    assert all(likes == room_data.participants_mask for likes in room_data.options_likes)
+    for names in seen:
+        assert sorted(names) == sorted(option.name for option in room_data.options)
+    await room_service.close()
+
+
+async def test_page_is_appended_again_after_losing_every_race(redis_client, monkeypatch):
+    # Votes go through another worker, so appends really conflict with them
+    monkeypatch.setattr(redis_storage, "MAX_UPDATE_ATTEMPTS", 1)
+    monkeypatch.setattr(service, "APPEND_RETRY_INTERVAL", 0)
+    provider = PagedProvider([7] + [1] * 23)
+    workers = []
+    for _ in range(2):
+        worker_storage = redis_storage.RedisStorage(redis_client)
+        await worker_storage.init_room_ids()
+        workers.append(service.Service(worker_storage, {providers.ProviderKind.KINOPOISK: provider}))
+
+    users = ["a", "b"]
+    room_id = await _start_room(workers[0], users)
+    streaming = workers[0].streaming_[room_id]
+    await asyncio.gather(*(_vote_until_done(workers[1], user_id, streaming) for user_id in users))
+
+    room_data = await workers[1].storage_.load_room(room_id)
+    assert [option.name for option in sorted(room_data.options, key=lambda option: int(option.name.split()[1]))] == \
+        ["option {}".format(i) for i in range(30)]
+    assert all(journal.current_option_index(room_data, user_id) is None for user_id in users)
+    for worker in workers:
+        await worker.close()
+
+
+async def test_start_reads_prefetched_pages_as_they_arrive(room_storage):
+    provider = CountingProvider(pages=3)
+    provider.release_.clear()
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: provider}, prefetch=True)
+    room_id = await _start_room(room_service, ["a", "b"])
+    streaming = room_service.streaming_[room_id]
+
+    room_data = await room_storage.load_room(room_id)
+    assert [option.name for option in room_data.options] == ["request 1 page 0"]
+    provider.release_.set()
+    await streaming
+
+    room_data = await room_storage.load_room(room_id)
+    assert sorted(option.name for option in room_data.options) == ["request 1 page {}".format(i) for i in range(3)]
+    assert provider.requests_ == 1
+    await room_service.close()
+
+
+async def test_failed_prefetch_is_fetched_again_on_start(room_storage):
+    class FlakyProvider(PagedProvider):
+        async def iter_entries(self, params):
+            self.calls_ = getattr(self, "calls_", 0) + 1
+            if self.calls_ == 1:
+                raise RuntimeError("upstream")
+            async for page in super().iter_entries(params):
+                yield page
+
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: FlakyProvider([3, 2])},
+                                   prefetch=True)
+    room_id = await _start_room(room_service, ["a", "b"])
+    await room_service.streaming_[room_id]
+
+    assert len((await room_storage.load_room(room_id)).options) == 5
+    await room_service.close()
+
+
+async def test_everyone_stops_waiting_once_the_vote_ends(room_storage):
+    users = ["a", "b", "c"]
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([3])},
+                                   option_ordering="adaptive")
+    await _start_room(room_service, users)
+    waiting = [asyncio.create_task(room_service.wait_end(user_id)) for user_id in users]
+    await asyncio.sleep(0.01)  # subscribed
+
+    await room_service.leave_room("c")
+    await asyncio.wait_for(waiting[2], 1)
+    assert not waiting[0].done()
+
+    # Adaptive orders show both of them the option one of them liked
+    await room_service.vote("a", True)
+    assert await room_service.vote("b", True) == interface.VoteOutcome.MATCH
+    await asyncio.wait_for(asyncio.gather(*waiting[:2]), 1)
+
+    # Those coming after the end don't wait at all
+    await asyncio.wait_for(room_service.wait_end("a"), 1)
+    await room_service.close()
+
+
+async def test_match_once_the_only_one_left_to_like_it_leaves(room_storage, monkeypatch):
+    users = ["a", "b", "c"]
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([5])},
+                                   match_ttl=60)
+    room_id = await _start_room(room_service, users)
+    for user_id in users[:2]:
+        while (await room_service.current_option(user_id))[0] is not None:
+            await room_service.vote(user_id, True)
+    assert await room_service.get_match("a") is None
+
+    expired = []
+    expire_room = room_storage.expire_room
+
+    async def record_expiry(expired_id: int, ttl: float):
+        expired.append((expired_id, ttl))
+        await expire_room(expired_id, ttl)
+
+    monkeypatch.setattr(room_storage, "expire_room", record_expiry)
+    waiting = asyncio.create_task(room_service.wait_end("a"))
+    await asyncio.sleep(0.01)  # subscribed
+
+    await room_service.leave_room("c")
+    await asyncio.wait_for(waiting, 1)
+    assert await room_service.get_match("b") is not None
+    assert expired == [(room_id, 60)]
+    await room_service.close()
+
+
+async def test_matched_room_expires_after_the_match_is_reset(room_storage):
+    users = ["a", "b"]
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([5])},
+                                   match_ttl=0)
+    room_id = await _start_room(room_service, users)
+    await room_service.vote("a", True)
+    assert await room_service.vote("b", True) == interface.VoteOutcome.MATCH
+
+    # Keyboard voting resets the match right away and goes on
+    await room_service.reset_match("a")
+    await room_service.vote("a", True)
+
+    assert await room_storage.collect_garbage() == [room_id]
+    with pytest.raises(KeyError):
+        await room_storage.load_room(room_id)
+    await room_service.close()
+
+
+async def test_prefetch_lives_its_ttl_after_filters_change(room_storage):
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([5])},
+                                   prefetch=True, prefetch_ttl=0.1)
+    room_id = await room_service.create_room("a", PARAMS)
+    await asyncio.sleep(0.06)
+    await room_service.set_filters("a", {"year": 2024})
+    prefetch = room_service.prefetched_[room_id]
+
+    # The timer of the first prefetch is gone with it
+    await asyncio.sleep(0.06)
+    assert room_service.prefetched_[room_id] is prefetch
+    await asyncio.sleep(0.06)
+    assert room_id not in room_service.prefetched_
+    await room_service.close()
+
+
+async def test_room_gauges_are_reported_once_the_service_starts(room_storage):
+    room_id = await room_storage.generate_room_id()
+    await room_storage.store_room(room_id, room.RoomData(owner="a", params=PARAMS), users={"a": room_id})
+
+    room_service = service.Service(room_storage, {})
+    await room_service.start()
+    assert prometheus_client.REGISTRY.get_sample_value("quo_live_rooms") == 1
+    assert prometheus_client.REGISTRY.get_sample_value("quo_room_users") == 1
+    await room_service.close()
@@ -0,0 +1,37 @@
+import pytest
+
+import shard
+from shard import registry
+from shard import ring
+
+
+def test_role_is_checked():
+    assert shard.get_role({}) is None
+    assert shard.get_role({"SHARD_ROLE": "Worker", "REDIS_HOST": "redis"}) == "worker"
+    with pytest.raises(ValueError):
+        shard.get_role({"SHARD_ROLE": "backend", "REDIS_HOST": "redis"})
+
+
+@pytest.mark.parametrize("role", ["front", "worker"])
+def test_sharding_needs_redis(role: str):
+    with pytest.raises(ValueError, match="REDIS_HOST"):
+        shard.get_role({"SHARD_ROLE": role})
+    with pytest.raises(ValueError, match="REDIS_HOST"):
+        registry.get_registry({"SHARD_ROLE": role})
+
+
+@pytest.mark.anyio
+async def test_users_are_routed_to_the_worker_of_their_room(redis_client):
+    workers = registry.WorkerRegistry(redis_client)
+    await workers.register("w1", "http://w1")
+    await workers.register("w2", "http://w2")
+    await workers.refresh()
+    await workers.pin_room(10, "w2")
+    await redis_client.set("quo:user:a", 10)
+
+    assert await workers.route("a") == "w2"
+    # Joining the room by its id
+    assert await workers.route("b", 10) == "w2"
+    assert await workers.route("c") == workers.ring.owner(ring.user_key("c"))
+    for worker_id in ("w1", "w2"):
+        await workers.unregister(worker_id)
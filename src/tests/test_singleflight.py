@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from models import entry
+from providers import singleflight
+
+from .test_cache import KIND
+from .test_cache import CountingProvider
+from .test_cache import _params
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_requests_share_one_upstream_request():
+    provider = CountingProvider(pages=3)
+    provider.release_.clear()
+    coalescing = singleflight.CoalescingProvider(KIND, provider)
+
+    requests = [asyncio.create_task(coalescing.get_entries(_params())) for _ in range(5)]
+    await asyncio.sleep(0)
+    provider.release_.set()
+    results = await asyncio.gather(*requests)
+
+    assert provider.requests_ == 1
+    assert all([e.name for e in result] == ["request 1 page {}".format(i) for i in range(3)] for result in results)
+    # Every caller gets its own copies
+    assert results[0][0] is not results[1][0]
+
+    await coalescing.get_entries(_params())
+    assert provider.requests_ == 2
+
+
+async def test_upstream_request_is_cancelled_once_nobody_reads_it():
+    provider = CountingProvider(pages=2)
+    provider.release_.clear()
+    coalescing = singleflight.CoalescingProvider(KIND, provider)
+
+    pages = coalescing.iter_entries(_params())
+    await anext(pages)
+    await pages.aclose()
+    await asyncio.sleep(0)
+
+    assert provider.cancelled_ == 1
+    assert not coalescing.flights_
+
+
+async def test_upstream_error_reaches_every_reader():
+    class FailingProvider(CountingProvider):
+        async def iter_entries(self, params):
+            yield [entry.ProviderEntry("first")]
+            raise RuntimeError("upstream")
+
+    coalescing = singleflight.CoalescingProvider(KIND, FailingProvider())
+    results = await asyncio.gather(*(coalescing.get_entries(_params()) for _ in range(2)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
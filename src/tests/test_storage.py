@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from models import room
+from providers import interface as providers
+from service import interface
+from service import journal
+from service import service
+from service.storage import memory
+from service.storage import redis_storage
+
+from .test_service import PagedProvider
+
+pytestmark = pytest.mark.anyio
+
+
+async def _play(room_storage, users: list[str]) -> room.RoomData:
+    room_service = service.Service(room_storage, {providers.ProviderKind.KINOPOISK: PagedProvider([25])},
+                                   option_ordering="adaptive")
+    room_id = await room_service.create_room(users[0], room.RoomParams(providers.ProviderKind.KINOPOISK))
+    for user_id in users[1:]:
+        await room_service.join_room(user_id, room_id)
+    await room_service.start_vote(users[0])
+
+    rng = random.Random(7)
+    for _ in range(40):
+        user_id = rng.choice(users)
+        card = await room_service.current_card(user_id)
+        if card["option"] is not None:
+            await room_service.vote(user_id, rng.random() < 0.6)
+    await room_service.leave_room(users[-1])
+    await room_service.close()
+    return await room_storage.load_room(room_id)
+
+
+async def test_backends_store_the_same_rooms(redis_client):
+    # Seeds and choices of both runs come from the same random state
+    users = ["a", "b", "c", "d"]
+    storage = memory.MemoryStorage()
+    random.seed(1)
+    in_memory = await _play(storage, users)
+
+    # Small log makes the redis room go through both snapshots and replayed events
+    storage = redis_storage.RedisStorage(redis_client, max_log_length=8)
+    await storage.init_room_ids()
+    random.seed(1)
+    in_redis = await _play(storage, users)
+
+    assert in_redis == in_memory
+    assert room.RoomData.from_bytes(in_memory.to_bytes()) == in_redis
+
+
+async def test_users_room_is_updated_with_the_room(room_storage):
+    room_id = await room_storage.generate_room_id()
+    await room_storage.store_room(room_id, room.RoomData(owner="a", params=room.RoomParams("x")), users={"a": room_id})
+
+    def join(room_data: room.RoomData) -> list[journal.Event]:
+        return [journal.join("b")]
+
+    updated = await room_storage.update_room(room_id, join, users={"b": room_id})
+    loaded_id, loaded = await room_storage.load_users_room("b")
+    assert loaded_id == room_id
+    assert loaded == updated
+    assert loaded.participants == {"b"}
+
+    with pytest.raises(KeyError):
+        await room_storage.load_room(room_id + 1)
+
+
+async def test_expired_rooms_are_collected(room_storage):
+    room_id = await room_storage.generate_room_id()
+    await room_storage.store_room(room_id, room.RoomData(owner="a", params=room.RoomParams("x")), users={"a": room_id})
+    await room_storage.expire_room(room_id, 0)
+
+    await room_storage.collect_garbage()
+    with pytest.raises(KeyError):
+        await room_storage.load_room(room_id)
+    assert (await room_storage.stats())["live_rooms"] == 0
+
+
+async def test_redis_scripts_change_only_keys_they_are_given(redis_client):
+    async def dump() -> dict[bytes, bytes]:
+        return {key: await redis_client.dump(key) for key in await redis_client.keys("*")}
+
+    def checked(script):
+        async def call(keys: list[str], args: list):
+            before = await dump()
+            result = await script(keys=keys, args=args)
+            after = await dump()
+            changed = {key for key in before.keys() | after.keys() if before.get(key) != after.get(key)}
+            assert changed <= {key.encode() for key in keys}
+            return result
+        return call
+
+    storage = redis_storage.RedisStorage(redis_client, max_log_length=4)
+    await storage.init_room_ids()
+    for name in ("compare_and_append_events_", "compare_and_store_room_", "expire_room_", "collect_room_"):
+        setattr(storage, name, checked(getattr(storage, name)))
+
+    room_service = service.Service(storage, {providers.ProviderKind.KINOPOISK: PagedProvider([5])}, match_ttl=0)
+    room_id = await room_service.create_room("a", room.RoomParams(providers.ProviderKind.KINOPOISK))
+    await room_service.join_room("b", room_id)
+    await room_service.start_vote("a")
+    await room_service.vote("a", True)
+    assert await room_service.vote("b", True) == interface.VoteOutcome.MATCH
+    await room_service.reset_match("a")
+    await room_service.vote("a", False)
+
+    assert await storage.collect_garbage() == [room_id]
+    assert set(await redis_client.keys("*")) == {b"quo:next_room_id", b"quo:gc"}
+    await room_service.close()
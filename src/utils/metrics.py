@@ -0,0 +1,72 @@
+import functools
+import logging
+import time
+import typing
+
+import prometheus_client
+
+
+__all__ = ["timed", "start_server"]
+
+logger = logging.getLogger(__name__)
+
+SERVICE_LATENCY = prometheus_client.Histogram(
+    "quo_service_call_seconds", "Latency of room service calls", ["method"])
+PROVIDER_LATENCY = prometheus_client.Histogram(
+    "quo_provider_request_seconds", "Time a provider takes to return all entries", ["provider"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+BOT_HANDLER_LATENCY = prometheus_client.Histogram(
+    "quo_bot_handler_seconds", "Latency of Telegram update handlers", ["handler"])
+
+VOTES = prometheus_client.Counter("quo_votes", "Votes", ["liked"])
+MATCHES = prometheus_client.Counter("quo_matches", "Matches")
+NO_MATCHES = prometheus_client.Counter("quo_no_matches", "Rooms where every option got disliked by someone")
+PROVIDER_ERRORS = prometheus_client.Counter("quo_provider_errors", "Failed provider requests", ["provider"])
+PROVIDER_CACHE = prometheus_client.Counter(
+    "quo_provider_cache_lookups", "Provider cache lookups by result: hit, stale_hit or miss", ["provider", "result"])
+PROVIDER_COALESCED = prometheus_client.Counter(
+    "quo_provider_coalesced_requests", "Provider requests served by an identical request already in flight", ["provider"])
+
+# Storage counts these for all workers, they are copied from it periodically
+LIVE_ROOMS = prometheus_client.Gauge("quo_live_rooms", "Rooms which are not expired yet")
+ROOM_USERS = prometheus_client.Gauge("quo_room_users", "Users assigned to a room")
+EXPIRED_ROOMS = prometheus_client.Gauge("quo_expired_rooms", "Rooms removed by the storage so far")
+RECLAIMED_BYTES = prometheus_client.Gauge("quo_reclaimed_bytes", "Serialized size of rooms removed so far")
+
+WAITING_USERS = prometheus_client.Gauge("quo_waiting_users", "Users waiting for the vote to start on this worker")
+
+F = typing.TypeVar("F", bound=typing.Callable[..., typing.Awaitable])
+
+
+def timed(histogram: prometheus_client.Histogram, label: typing.Optional[str] = None) -> typing.Callable[[F], F]:
+    """Observes how long the decorated coroutine function takes, labeled with its name by default"""
+    def decorator(fun: F) -> F:
+        child = histogram.labels(label or fun.__name__)
+
+        @functools.wraps(fun)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fun(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+
+        return typing.cast(F, wrapper)
+
+    return decorator
+
+
+def start_server(config: typing.Dict[str, str], role: typing.Optional[str] = None) -> None:
+    """Serves Prometheus text format on METRICS_ADDR:METRICS_PORT, METRICS_PORT=0 disables it.
+
+    Processes of a sharded bot may share a host: the front takes METRICS_PORT and every worker
+    its WEBHOOK_PORT plus WORKER_METRICS_PORT_OFFSET, as worker webhook ports differ anyway.
+    """
+    port = int(config.get("METRICS_PORT", 9108))
+    if port == 0:
+        return
+    if role == "worker":
+        port = int(config.get("WEBHOOK_PORT", 8080)) + int(config.get("WORKER_METRICS_PORT_OFFSET", 1000))
+    addr = config.get("METRICS_ADDR", "127.0.0.1")
+    prometheus_client.start_http_server(port, addr=addr)
+    logger.info("metrics are served on http://%s:%d/metrics", addr, port)
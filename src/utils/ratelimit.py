@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate_ = rate
+        self.capacity_ = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens_ = self.capacity_
+        self.updated_at_ = time.monotonic()
+        self.lock_ = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens_ = min(self.capacity_, self.tokens_ + (now - self.updated_at_) * self.rate_)
+        self.updated_at_ = now
+
+    async def acquire(self):
+        # Waiters are served one by one in arrival order
+        async with self.lock_:
+            self._refill()
+            if self.tokens_ < 1:
+                await asyncio.sleep((1 - self.tokens_) / self.rate_)
+                self._refill()
+            self.tokens_ -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False